@@ -11,6 +11,21 @@ export interface EncryptVideoResponse {
   mp4_filename: string;
 }
 
+export interface EncryptVideoFileResponse {
+  blob: Blob;
+  filename: string;
+  resultId: string | null;
+  frameNumbers: number[];
+}
+
+export interface VerifyVideoResponse {
+  valid: boolean;
+  id?: string;
+  border_data?: string;
+  reason?: string;
+  stego_data?: string;
+}
+
 export class BackendService {
   private static instance: BackendService;
   private healthCheckCache: { isHealthy: boolean; lastCheck: number } = {
@@ -69,8 +84,9 @@ export class BackendService {
     text: string
   ): Promise<EncryptVideoResponse> {
     const formData = new FormData();
-    formData.append("video", videoFile);
+    // Text goes first so the server can start encoding while the video uploads
     formData.append("text", text);
+    formData.append("video", videoFile);
 
     const response = await fetch(`${BACKEND_URL}/encrypt`, {
       method: "POST",
@@ -84,6 +100,38 @@ export class BackendService {
     return await response.json();
   }
 
+  // Same as encryptVideo, but the MP4 is streamed back as binary instead of
+  // base64 inside JSON, so neither side has to hold an inflated copy in memory
+  async encryptVideoFile(
+    videoFile: File,
+    text: string
+  ): Promise<EncryptVideoFileResponse> {
+    const formData = new FormData();
+    // Text goes first so the server can start encoding while the video uploads
+    formData.append("text", text);
+    formData.append("video", videoFile);
+
+    const response = await fetch(`${BACKEND_URL}/encrypt?response=binary`, {
+      method: "POST",
+      body: formData,
+    });
+
+    if (!response.ok) {
+      throw new Error(`Encryption failed: ${response.statusText}`);
+    }
+
+    const disposition = response.headers.get("Content-Disposition") || "";
+    const filenameMatch = disposition.match(/filename="?([^";]+)"?/);
+    const frameNumbers = response.headers.get("X-Frame-Numbers");
+
+    return {
+      blob: await response.blob(),
+      filename: filenameMatch ? filenameMatch[1] : "encoded.mp4",
+      resultId: response.headers.get("X-Result-Id"),
+      frameNumbers: frameNumbers ? frameNumbers.split(",").map(Number) : [],
+    };
+  }
+
   // eslint-disable-next-line @typescript-eslint/no-explicit-any
   async decryptVideo(videoFile: File): Promise<any> {
     const formData = new FormData();
@@ -100,6 +148,24 @@ export class BackendService {
 
     return await response.json();
   }
+
+  // Checks the embedded ID against the video's integrity tag without a full
+  // decrypt; pass decrypt to also get stego_data
+  async verifyVideo(videoFile: File, decrypt = false): Promise<VerifyVideoResponse> {
+    const formData = new FormData();
+    formData.append("video", videoFile);
+
+    const response = await fetch(`${BACKEND_URL}/verify${decrypt ? "?decrypt=1" : ""}`, {
+      method: "POST",
+      body: formData,
+    });
+
+    if (!response.ok) {
+      throw new Error(`Verification failed: ${response.statusText}`);
+    }
+
+    return await response.json();
+  }
 }
 
 export const backendService = BackendService.getInstance();
@@ -0,0 +1,193 @@
+"""Admission control for the heavy endpoints.
+
+Each endpoint kind (encrypt, decrypt) gets an AdmissionController with a
+fixed number of execution slots and a bounded wait queue. A request reserves
+a place before its upload is read, so a burst beyond slots + queue is turned
+away immediately with 503 + Retry-After instead of piling uploads onto disk.
+Once the upload is in, the request is admitted in FIFO order with a cost
+estimate (frames x pixels): besides the slot limit, the total cost of the
+running requests stays under a budget, so one 4K clip doesn't run next to
+five others. A request that is alone always runs, whatever its cost.
+
+Limits are per process; under a multi-worker WSGI server the totals are
+workers x limits.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+import metrics
+
+# Initial guess of how long a request holds its slot, refined as requests finish
+DEFAULT_SERVICE_SECONDS = 5.0
+SERVICE_TIME_SMOOTHING = 0.2
+MAX_RETRY_AFTER = 300
+
+ADMISSION_RUNNING = metrics.registry.register(metrics.Gauge(
+    'stego_admission_running', 'Requests holding an execution slot', ['endpoint']))
+ADMISSION_QUEUED = metrics.registry.register(metrics.Gauge(
+    'stego_admission_queued', 'Requests holding a queue place (uploading or waiting for a slot)', ['endpoint']))
+ADMISSION_REJECTED = metrics.registry.register(metrics.Counter(
+    'stego_admission_rejected_total', 'Requests turned away by admission control', ['endpoint', 'reason']))
+ADMISSION_WAIT = metrics.registry.register(metrics.Histogram(
+    'stego_admission_wait_seconds', 'Time admitted requests waited for a slot', ['endpoint']))
+
+
+class AdmissionError(Exception):
+    status_code = 503
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(AdmissionError):
+    """The queue is full or the request waited too long for a slot"""
+    status_code = 503
+
+
+class TooExpensive(AdmissionError):
+    """A single request costs more than the server accepts at all"""
+    status_code = 413
+
+
+class Ticket:
+    """A request's place in an AdmissionController; release it when done"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.state = 'reserved'
+        self.cost = 0
+        self.started = None
+
+    @property
+    def admitted(self):
+        return self.state == 'running'
+
+    def admit(self, cost, timeout=None):
+        """Block until the request may run; raises Overloaded or TooExpensive"""
+        self.controller._admit(self, cost, timeout)
+        return self
+
+    def try_admit(self, cost):
+        """Admit the request only if it can run right away; raises TooExpensive"""
+        return self.controller._admit(self, cost, wait=False)
+
+    def release(self):
+        self.controller._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, name, max_concurrent, max_queue, max_cost=None, max_request_cost=None,
+                 queue_timeout=60.0):
+        self.name = name
+        self.max_concurrent = max(int(max_concurrent), 1)
+        self.max_queue = max(int(max_queue), 0)
+        self.max_cost = max_cost or None
+        self.max_request_cost = max_request_cost or None
+        self.queue_timeout = queue_timeout
+        self.service_seconds = DEFAULT_SERVICE_SECONDS
+        self._reserved = 0
+        self._running = 0
+        self._running_cost = 0
+        self._waiting = deque()
+        self._cond = threading.Condition()
+
+    def reserve(self):
+        """Claim a queue place for a new request; raises Overloaded when none is left"""
+        with self._cond:
+            if self._reserved + self._running >= self.max_concurrent + self.max_queue:
+                ADMISSION_REJECTED.inc(endpoint=self.name, reason='queue_full')
+                raise Overloaded(f"Too many {self.name} requests in progress", self._retry_after())
+            self._reserved += 1
+            self._update_gauges()
+        return Ticket(self)
+
+    def _fits(self, ticket, cost):
+        if self._waiting[0] is not ticket or self._running >= self.max_concurrent:
+            return False
+        return self._running == 0 or self.max_cost is None or self._running_cost + cost <= self.max_cost
+
+    def _admit(self, ticket, cost, timeout=None, wait=True):
+        """Move a reserved ticket to running; without wait, returns False instead of queueing"""
+        if ticket.state != 'reserved':
+            raise RuntimeError("Ticket was already admitted or released")
+        if self.max_request_cost is not None and cost > self.max_request_cost:
+            ADMISSION_REJECTED.inc(endpoint=self.name, reason='too_expensive')
+            raise TooExpensive(f"Video too large to {self.name}")
+
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._cond:
+            self._waiting.append(ticket)
+            if not wait and not self._fits(ticket, cost):
+                self._waiting.remove(ticket)
+                self._cond.notify_all()
+                return False
+            while not self._fits(ticket, cost):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._cond.notify_all()
+                    ADMISSION_REJECTED.inc(endpoint=self.name, reason='timeout')
+                    raise Overloaded(f"Timed out waiting for a free {self.name} slot", self._retry_after())
+                self._cond.wait(remaining)
+
+            self._waiting.popleft()
+            self._reserved -= 1
+            self._running += 1
+            self._running_cost += cost
+            ticket.state = 'running'
+            ticket.cost = cost
+            ticket.started = time.monotonic()
+            self._update_gauges()
+            # The next request in line might fit as well
+            self._cond.notify_all()
+        ADMISSION_WAIT.observe(ticket.started - start, endpoint=self.name)
+        return True
+
+    def _release(self, ticket):
+        with self._cond:
+            if ticket.state == 'running':
+                self._running -= 1
+                self._running_cost -= ticket.cost
+                elapsed = time.monotonic() - ticket.started
+                self.service_seconds += SERVICE_TIME_SMOOTHING * (elapsed - self.service_seconds)
+            elif ticket.state == 'reserved':
+                self._reserved -= 1
+            else:
+                return
+            ticket.state = 'released'
+            self._update_gauges()
+            self._cond.notify_all()
+
+    def _retry_after(self):
+        """Rough number of seconds until a place frees up; caller holds the lock"""
+        ahead = self._reserved + self._running
+        estimate = self.service_seconds * max(ahead - self.max_concurrent + 1, 1) / self.max_concurrent
+        return min(max(int(math.ceil(estimate)), 1), MAX_RETRY_AFTER)
+
+    def _update_gauges(self):
+        ADMISSION_RUNNING.set(self._running, endpoint=self.name)
+        ADMISSION_QUEUED.set(self._reserved, endpoint=self.name)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "running": self._running,
+                "queued": self._reserved,
+                "waiting_for_slot": len(self._waiting),
+                "running_cost": self._running_cost,
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "max_cost": self.max_cost,
+                "service_seconds": round(self.service_seconds, 3),
+            }
@@ -0,0 +1,200 @@
+"""The legacy PNG pipeline, kept as the benchmarks' baseline.
+
+Before the streaming pipeline, /encrypt extracted every frame to a PNG file,
+drew the border and the LSB payload on those files, wrote them to a
+PNG-codec MOV with cv2.VideoWriter and re-encoded that with ffmpeg. The
+server no longer uses any of it; run_benchmarks.py times each step so the
+streaming pipeline has something to be compared against.
+
+Import it after the server module, which run_benchmarks.py loads from the
+server folder.
+"""
+import os
+import subprocess
+
+import cv2
+
+from border import text_bits
+from frame_header import HEADER_FRAME, SCHEME_CODES, hide_header, pack_header
+from lsb_codec import hide_array
+from metrics import timed
+from pipeline import border_frame_file, ordered_map
+from server import (BORDER_FRAMES, ENCODE_MAX_IN_FLIGHT, ENCODE_WORKER_MODE, ENCODE_WORKERS, PAYLOAD_START,
+                    border_payload, describe_part, payload_parts)
+
+
+@timed('extract')
+def extract_frames(video_path, temp_dir):
+    """Extract frames from video"""
+    if not os.path.exists(temp_dir):
+        os.makedirs(temp_dir)
+    
+    print(f"[INFO] Extracting frames from video {video_path}")
+    vidcap = cv2.VideoCapture(video_path)
+    count = 0
+    frames = []
+    
+    while True:
+        success, image = vidcap.read()
+        if not success:
+            break
+        frame_path = os.path.join(temp_dir, f"{count}.png")
+        cv2.imwrite(frame_path, image)
+        frames.append(frame_path)
+        count += 1
+    
+    print(f"[INFO] Extracted {count} frames from video")
+    return frames, count
+
+
+@timed('border')
+def add_data_border_to_frames(frames, data, temp_dir):
+    """Add data-encoding border to all frames"""
+    bordered_frames = []
+    
+    # Set a reasonable border width
+    border_width = 20
+    
+    # Get total frame count
+    total_frames = len(frames)
+    
+    # Prepare the data to encode with STEGO marker
+    if not frames:
+        return []
+    full_data = border_payload(data, cv2.imread(frames[0]).shape, border_width)
+    print(f"[INFO] Encoding data in border: {full_data[:50]}...")
+    
+    # Process frames on the worker pool, collecting results in frame order
+    bits = text_bits(full_data)
+    tasks = ((i, frame_path, os.path.join(temp_dir, f"bordered_{i}.png"), bits, total_frames, border_width)
+             for i, frame_path in enumerate(frames))
+    for i, bordered_path in ordered_map(border_frame_file, tasks, workers=ENCODE_WORKERS,
+                                        mode=ENCODE_WORKER_MODE, max_in_flight=ENCODE_MAX_IN_FLIGHT):
+        if bordered_path is None:
+            continue
+        bordered_frames.append(bordered_path)
+        
+        # Log progress
+        if i % 10 == 0:
+            print(f"[INFO] Added data border to frame {i}/{total_frames}")
+    
+    print(f"[INFO] Added data borders to all {len(bordered_frames)} frames")
+    return bordered_frames
+
+
+@timed('lsb')
+def encode_frames(frames, encrypted_text, temp_dir):
+    """Encode encrypted text into frames"""
+    # Convert to string if it's bytes
+    if isinstance(encrypted_text, bytes):
+        encrypted_text = encrypted_text.decode('utf-8')
+        
+    # Split the text into parts
+    split_text_list, scheme = payload_parts(encrypted_text)
+    num_parts = len(split_text_list)
+    
+    # Use the N frames after the header frame (N = number of text parts)
+    frame_numbers = list(range(PAYLOAD_START, min(PAYLOAD_START + num_parts, len(frames))))
+    
+    print(f"Encoding text into {len(frame_numbers)} frames")
+    
+    # The header in frame 0 lists the payload frames for the decoder
+    header_frame = cv2.imread(frames[HEADER_FRAME])
+    header = pack_header(frame_numbers, len(encrypted_text), border_frames=BORDER_FRAMES,
+                         scheme=SCHEME_CODES[scheme])
+    cv2.imwrite(frames[HEADER_FRAME], hide_header(header_frame, header))
+    
+    # Hide text parts in frames
+    for i, frame_num in enumerate(frame_numbers):
+        if i >= len(split_text_list):
+            break
+            
+        frame_path = frames[frame_num]
+        # Hide text in frame using LSB steganography
+        frame = cv2.imread(frame_path)
+        cv2.imwrite(frame_path, hide_array(frame, split_text_list[i], in_place=True))
+        print(f"[INFO] Frame {frame_num} holds {describe_part(split_text_list[i])}")
+    
+    # Save the frame numbers in a special metadata frame
+    # This will help with faster decryption
+    metadata_frame_path = os.path.join(temp_dir, "metadata.png")
+    # Create a simple black image for metadata
+    metadata_img = cv2.imread(frames[0])
+    
+    # Save frame numbers as metadata
+    metadata_content = ",".join(map(str, frame_numbers))
+    cv2.imwrite(metadata_frame_path, hide_array(metadata_img, metadata_content, in_place=True))
+    print(f"[INFO] Metadata frame holds frame numbers: {metadata_content}")
+    
+    # Insert the metadata frame as the last frame to process
+    frames.append(metadata_frame_path)
+        
+    return frame_numbers
+
+
+@timed('write')
+def create_output_video(frames, original_video, output_path):
+    """Create output video from frames"""
+    # Get video properties
+    video = cv2.VideoCapture(original_video)
+    fps = video.get(cv2.CAP_PROP_FPS)
+    width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    
+    # Ensure output path ends with .mov
+    if not output_path.endswith('.mov'):
+        output_path = output_path.rsplit('.', 1)[0] + '.mov'
+    
+    # Create video writer with PNG codec for MOV container
+    # This preserves image quality better for steganography
+    fourcc = cv2.VideoWriter_fourcc(*'png ')  # PNG codec with MOV container
+    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
+    
+    # Add frames to video
+    for frame_path in frames:
+        frame = cv2.imread(frame_path)
+        if frame is not None:
+            out.write(frame)
+    
+    out.release()
+    print(f"[INFO] Created output video: {output_path}")
+    return output_path
+
+
+@timed('transcode')
+def convert_to_mp4(mov_path, output_dir):
+    """Convert MOV file to MP4 using ffmpeg"""
+    # Create the output path with .mp4 extension
+    mp4_path = mov_path.rsplit('.', 1)[0] + '.mp4'
+    
+    try:
+        # Use ffmpeg to convert from MOV to MP4
+        # -c:v libx264 uses H.264 codec for video
+        # -crf 23 is a good balance between quality and file size
+        # -preset fast provides a good encoding speed
+        # -c:a aac uses AAC codec for audio
+        # -b:a 128k sets audio bitrate
+        command = [
+            'ffmpeg',
+            '-i', mov_path,
+            '-c:v', 'libx264',
+            '-crf', '23',
+            '-preset', 'fast',
+            '-c:a', 'aac',
+            '-b:a', '128k',
+            mp4_path
+        ]
+        
+        # Execute the command
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        stdout, stderr = process.communicate()
+        
+        if process.returncode != 0:
+            print(f"Error converting video: {stderr.decode()}")
+            return None
+        
+        print(f"Successfully converted {mov_path} to {mp4_path}")
+        return mp4_path
+    except Exception as e:
+        print(f"Error during conversion: {str(e)}")
+        return None
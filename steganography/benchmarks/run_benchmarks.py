@@ -0,0 +1,386 @@
+"""Stage-level benchmarks for the steganography server.
+
+Generates deterministic synthetic clips (see synthetic.py), then times each
+stage of the legacy PNG pipeline (legacy_pipeline.py), the streaming pipeline
+and the full /encrypt and /decrypt endpoints through the Flask test client.
+Every result records frames/sec, peak RSS and the peak bytes written to temp
+dirs, and the whole run is written as JSON that can be compared against a
+stored baseline.
+
+    python benchmarks/run_benchmarks.py --resolutions 480p,720p --durations 2,5
+    python benchmarks/run_benchmarks.py --output run.json --baseline baseline.json --tolerance 0.2
+
+The exit status is 1 when a stage regressed by more than the tolerance.
+Smart encoding only works on sources already in the output profile's pixel
+format, so encode_video_smart runs on a 4:4:4 copy of each clip; a stage that
+can't run on a clip is reported as skipped.
+Worker processes (STEGO_ENCODE_WORKER_MODE=process) are not included in RSS.
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCHMARK_DIR)
+
+# CID-shaped payload, like the frontend's proof flow sends
+PAYLOAD_TEXT = "bafybeigdyrzt5sfp7udm7hu76uh7y26nf3efuylqabf3oclgtqy55fbzdi"
+
+LEGACY_STAGES = ['extract_frames', 'create_data_border', 'encode_frames', 'create_output_video',
+                 'convert_to_mp4', 'extract_border_data', 'decode_video']
+PIPELINE_STAGES = ['encode_video', 'encode_video_smart', 'decode_video_single_pass']
+ENDPOINT_STAGES = ['encrypt_endpoint', 'decrypt_endpoint']
+ALL_STAGES = LEGACY_STAGES + PIPELINE_STAGES + ENDPOINT_STAGES
+
+
+def current_rss():
+    """Resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if resource is not None:
+        # ru_maxrss is the peak, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    return 0
+
+
+def tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ResourceSampler:
+    """Samples RSS and the size of some directories in the background, keeping the peaks"""
+
+    def __init__(self, paths=(), interval=0.02, disk_interval=0.1):
+        self.paths = [p for p in paths if p]
+        self.interval = interval
+        self.disk_interval = disk_interval
+        self.start_rss = 0
+        self.peak_rss = 0
+        self.start_disk = 0
+        self.peak_disk = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _disk(self):
+        return sum(tree_size(p) for p in self.paths)
+
+    def _sample(self):
+        last_disk = 0.0
+        while not self._stop.is_set():
+            self.peak_rss = max(self.peak_rss, current_rss())
+            now = time.monotonic()
+            if self.paths and now - last_disk >= self.disk_interval:
+                self.peak_disk = max(self.peak_disk, self._disk())
+                last_disk = now
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = self.peak_rss = current_rss()
+        self.start_disk = self.peak_disk = self._disk()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak_rss = max(self.peak_rss, current_rss())
+        self.peak_disk = max(self.peak_disk, self._disk())
+
+
+def measure(func, frames, disk_paths=()):
+    """Run func() once and return (its result, the measurements)"""
+    with ResourceSampler(disk_paths) as sampler:
+        start = time.perf_counter()
+        result = func()
+        seconds = time.perf_counter() - start
+    return result, {
+        "seconds": round(seconds, 4),
+        "frames": frames,
+        "fps": round(frames / seconds, 2) if seconds > 0 else None,
+        "peak_rss_mb": round(sampler.peak_rss / 2 ** 20, 1),
+        "rss_growth_mb": round((sampler.peak_rss - sampler.start_rss) / 2 ** 20, 1),
+        "temp_disk_bytes": max(sampler.peak_disk - sampler.start_disk, 0),
+    }
+
+
+def run_clip(server, clip_path, frame_count, stages, work_dir, quiet=True, smart_clip_path=None):
+    """Benchmark the selected stages on one clip; returns {stage: measurements}
+
+    smart_clip_path is the same clip in the pixel format smart encoding
+    needs; encode_video_smart runs on clip_path without it.
+    """
+    results = {}
+    out = open(os.devnull, 'w') if quiet else sys.stdout
+    needed = set(stages)
+
+    def run(stage, func, frames, disk_paths=()):
+        with contextlib.redirect_stdout(out):
+            result, results[stage] = measure(func, frames, disk_paths)
+        return result
+
+    # Imports the server module, so it can only be loaded once main has set that up
+    import legacy_pipeline as legacy
+    encrypted_text = server.encrypt_rsa(PAYLOAD_TEXT)
+
+    # Legacy PNG pipeline; each stage depends on the one before it
+    legacy_dir = os.path.join(work_dir, 'legacy')
+    os.makedirs(legacy_dir, exist_ok=True)
+    legacy_mp4 = None
+    if needed & set(LEGACY_STAGES[:5]):
+        frames, count = run('extract_frames', lambda: legacy.extract_frames(clip_path, legacy_dir),
+                            frame_count, [legacy_dir])
+        if needed & set(LEGACY_STAGES[1:5]):
+            frames = run('create_data_border',
+                         lambda: legacy.add_data_border_to_frames(frames, PAYLOAD_TEXT, legacy_dir),
+                         count, [legacy_dir])
+        if needed & set(LEGACY_STAGES[2:5]):
+            run('encode_frames', lambda: legacy.encode_frames(frames, encrypted_text, legacy_dir),
+                count, [legacy_dir])
+        if needed & set(LEGACY_STAGES[3:5]):
+            mov_path = run('create_output_video',
+                           lambda: legacy.create_output_video(frames, clip_path,
+                                                              os.path.join(legacy_dir, 'encoded.mov')),
+                           len(frames), [legacy_dir])
+            if 'convert_to_mp4' in needed:
+                legacy_mp4 = run('convert_to_mp4', lambda: legacy.convert_to_mp4(mov_path, legacy_dir),
+                                 len(frames), [legacy_dir])
+
+    # Streaming pipeline
+    pipeline_dir = os.path.join(work_dir, 'pipeline')
+    os.makedirs(pipeline_dir, exist_ok=True)
+    encoded_path = None
+    if 'encode_video' in needed or needed & {'extract_border_data', 'decode_video', 'decode_video_single_pass'}:
+        encoded_path, _ = run('encode_video',
+                              lambda: server.encode_video(clip_path, PAYLOAD_TEXT, encrypted_text,
+                                                          os.path.join(pipeline_dir, 'encoded.mp4')),
+                              frame_count, [pipeline_dir])
+        if 'encode_video' not in needed:
+            del results['encode_video']
+    if 'encode_video_smart' in needed:
+        try:
+            run('encode_video_smart',
+                lambda: server.encode_video_smart(smart_clip_path or clip_path, PAYLOAD_TEXT, encrypted_text,
+                                                  os.path.join(pipeline_dir, 'encoded_smart.mp4')),
+                frame_count, [pipeline_dir])
+        except server.SmartRenderUnavailable as e:
+            results['encode_video_smart'] = {"skipped": str(e)}
+
+    # Decoders run on the streaming pipeline's output (or the legacy one if that's all we have)
+    decode_input = encoded_path or legacy_mp4
+    if decode_input:
+        if 'extract_border_data' in needed:
+            run('extract_border_data', lambda: server.extract_border_data(decode_input), frame_count)
+        if 'decode_video' in needed:
+            run('decode_video', lambda: server.decode_video(decode_input), frame_count)
+        if 'decode_video_single_pass' in needed:
+            run('decode_video_single_pass', lambda: server.decode_video_single_pass(decode_input), frame_count)
+
+    # Full endpoints, uploading the way the frontend does
+    client = server.create_app().test_client()
+    server_dirs = [server.TEMP_FOLDER, server.UPLOAD_FOLDER]
+    mp4_bytes = None
+    if needed & set(ENDPOINT_STAGES):
+        def encrypt():
+            with open(clip_path, 'rb') as f:
+                response = client.post('/encrypt', data={'video': (f, 'recording.mp4'), 'text': PAYLOAD_TEXT})
+            if response.status_code != 200:
+                raise RuntimeError(f"/encrypt returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+            return base64.b64decode(response.get_json()['mp4'])
+
+        mp4_bytes = run('encrypt_endpoint', encrypt, frame_count, server_dirs)
+        if 'encrypt_endpoint' not in needed:
+            del results['encrypt_endpoint']
+
+    if 'decrypt_endpoint' in needed:
+        encoded_upload = os.path.join(work_dir, 'encrypt_endpoint.mp4')
+        with open(encoded_upload, 'wb') as f:
+            f.write(mp4_bytes)
+
+        def decrypt():
+            with open(encoded_upload, 'rb') as f:
+                response = client.post('/decrypt', data={'video': (f, 'encoded.mp4')})
+            if response.status_code not in (200, 404):
+                raise RuntimeError(f"/decrypt returned {response.status_code}")
+            return response.get_json()
+
+        run('decrypt_endpoint', decrypt, frame_count, server_dirs)
+
+    if quiet:
+        out.close()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return the regressions of results against a baseline run"""
+    previous = {(r['clip'], r['stage']): r for r in baseline.get('results', [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result['clip'], result['stage']))
+        if not before or not before.get('fps') or not result.get('fps'):
+            continue
+        change = result['fps'] / before['fps'] - 1
+        result['baseline_fps'] = before['fps']
+        result['fps_change'] = round(change, 3)
+        if change < -tolerance:
+            regressions.append(f"{result['clip']} {result['stage']}: {before['fps']} -> {result['fps']} fps "
+                               f"({change:+.0%})")
+        if before.get('peak_rss_mb') and result['peak_rss_mb'] > before['peak_rss_mb'] * (1 + tolerance):
+            regressions.append(f"{result['clip']} {result['stage']}: peak RSS "
+                               f"{before['peak_rss_mb']} -> {result['peak_rss_mb']} MB")
+    return regressions
+
+
+def environment():
+    import cv2
+    import numpy
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "opencv": cv2.__version__,
+        "numpy": numpy.__version__,
+        "ffmpeg": shutil.which('ffmpeg') is not None,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--resolutions', default='480p,720p,1080p',
+                        help='comma-separated list of 480p, 720p, 1080p')
+    parser.add_argument('--durations', default='2,5', help='comma-separated clip durations in seconds')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stages', default=','.join(ALL_STAGES),
+                        help='comma-separated stages to report (default: all)')
+    parser.add_argument('--cache-dir', default=os.path.join(BENCHMARK_DIR, '.clips'),
+                        help='where generated clips are kept between runs')
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown before a stage counts as a regression')
+    parser.add_argument('--verbose', action='store_true', help="don't silence the server's log lines")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    from synthetic import RESOLUTIONS, get_clip
+
+    resolutions = [r.strip() for r in args.resolutions.split(',') if r.strip()]
+    durations = [float(d) for d in args.durations.split(',') if d.strip()]
+    stages = [s.strip() for s in args.stages.split(',') if s.strip()]
+    for name in resolutions:
+        if name not in RESOLUTIONS:
+            raise SystemExit(f"Unknown resolution {name}; choose from {', '.join(RESOLUTIONS)}")
+    for stage in stages:
+        if stage not in ALL_STAGES:
+            raise SystemExit(f"Unknown stage {stage}; choose from {', '.join(ALL_STAGES)}")
+
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    cache_dir = os.path.abspath(args.cache_dir)
+
+    # The server keeps its working folders relative to its own directory
+    os.chdir(SERVER_DIR)
+    sys.path.insert(0, SERVER_DIR)
+    with contextlib.redirect_stdout(sys.stderr):
+        import server
+
+    results = []
+    for resolution in resolutions:
+        for seconds in durations:
+            clip_path = get_clip(cache_dir, resolution, seconds, args.fps, args.seed)
+            smart_clip_path = None
+            smart_pix_fmt = server.OUTPUT_PROFILES[server.OUTPUT_PROFILE]['pix_fmt']
+            # The clips are made with libx264, which only writes YUV
+            if 'encode_video_smart' in stages and smart_pix_fmt.startswith('yuv'):
+                smart_clip_path = get_clip(cache_dir, resolution, seconds, args.fps, args.seed,
+                                           pix_fmt=smart_pix_fmt)
+            frame_count = server.probe_video(clip_path)['frame_count']
+            clip = os.path.basename(clip_path)
+            print(f"[BENCH] {clip} ({frame_count} frames)", file=sys.stderr)
+
+            work_dir = tempfile.mkdtemp(prefix='stego-bench-')
+            try:
+                clip_results = run_clip(server, clip_path, frame_count, stages, work_dir, quiet=not args.verbose,
+                                        smart_clip_path=smart_clip_path)
+            finally:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+            for stage in ALL_STAGES:
+                if stage in clip_results:
+                    result = {"clip": clip, "resolution": resolution, "duration": seconds, "stage": stage}
+                    result.update(clip_results[stage])
+                    results.append(result)
+                    if 'skipped' in result:
+                        print(f"[BENCH]   {stage:<26} skipped: {result['skipped']}", file=sys.stderr)
+                        continue
+                    print(f"[BENCH]   {stage:<26} {result['seconds']:>8.3f}s {result['fps'] or 0:>9.1f} fps "
+                          f"{result['peak_rss_mb']:>8.1f} MB RSS {result['temp_disk_bytes'] / 2 ** 20:>9.1f} MB disk",
+                          file=sys.stderr)
+
+    report = {
+        "created": time.time(),
+        "environment": environment(),
+        "config": {
+            "resolutions": resolutions,
+            "durations": durations,
+            "fps": args.fps,
+            "seed": args.seed,
+            "encode_workers": server.ENCODE_WORKERS,
+            "encode_worker_mode": server.ENCODE_WORKER_MODE,
+            "output_profile": server.OUTPUT_PROFILE,
+        },
+        "results": results,
+    }
+
+    regressions = []
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        report["baseline"] = baseline
+        report["tolerance"] = args.tolerance
+        report["regressions"] = regressions
+        for line in regressions:
+            print(f"[REGRESSION] {line}", file=sys.stderr)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[BENCH] Wrote {output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
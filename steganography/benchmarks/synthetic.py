@@ -0,0 +1,104 @@
+"""Deterministic synthetic clips for the benchmarks.
+
+Every clip is a pure function of (resolution, duration, fps, seed): a moving
+gradient with a bouncing block and a fixed noise texture, so the encoder has
+real detail to work on. Clips are encoded as H.264/AAC MP4 like a phone
+recording when ffmpeg is available (4:2:0 unless another pixel format is
+asked for), and as an mp4v MP4 through OpenCV otherwise. Generated clips are
+cached by name.
+"""
+import os
+import shutil
+import subprocess
+
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    '480p': (854, 480),
+    '720p': (1280, 720),
+    '1080p': (1920, 1080),
+    '2160p': (3840, 2160),
+}
+DEFAULT_FPS = 30
+DEFAULT_PIX_FMT = 'yuv420p'
+
+
+def clip_name(resolution, seconds, fps=DEFAULT_FPS, seed=0, pix_fmt=DEFAULT_PIX_FMT):
+    suffix = '' if pix_fmt == DEFAULT_PIX_FMT else f'_{pix_fmt}'
+    return f"synthetic_{resolution}_{seconds:g}s_{fps}fps_seed{seed}{suffix}.mp4"
+
+
+class SyntheticFrames:
+    """Generates frame i of a clip on demand"""
+
+    def __init__(self, width, height, seed=0):
+        self.width = width
+        self.height = height
+        rng = np.random.default_rng(seed)
+        self.noise = rng.integers(0, 48, (height, width, 3), dtype=np.uint8)
+        self.block = max(height // 6, 8)
+        self.x_ramp = (np.arange(width, dtype=np.uint16) * 255 // max(width - 1, 1)).astype(np.uint8)
+        self.y_ramp = (np.arange(height, dtype=np.uint16) * 255 // max(height - 1, 1)).astype(np.uint8)
+
+    def frame(self, i):
+        frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        frame[..., 0] = (self.x_ramp[None, :] + np.uint8(i * 3 % 256))
+        frame[..., 1] = self.y_ramp[:, None]
+        frame[..., 2] = np.uint8(i * 7 % 256)
+        frame += self.noise
+
+        # A block bouncing across the frame gives the encoder some motion
+        span_x = max(self.width - self.block, 1)
+        span_y = max(self.height - self.block, 1)
+        x = abs((i * 11) % (2 * span_x) - span_x)
+        y = abs((i * 7) % (2 * span_y) - span_y)
+        frame[y:y + self.block, x:x + self.block] = (255 - i % 256, 128, i % 256)
+        return frame
+
+
+def generate_clip(path, resolution, seconds, fps=DEFAULT_FPS, seed=0, audio=True, pix_fmt=DEFAULT_PIX_FMT):
+    """Write a synthetic clip to path and return its frame count"""
+    width, height = RESOLUTIONS[resolution] if isinstance(resolution, str) else resolution
+    frame_count = max(int(round(seconds * fps)), 1)
+    frames = SyntheticFrames(width, height, seed)
+
+    if shutil.which('ffmpeg'):
+        command = [
+            'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}',
+            '-framerate', str(fps), '-i', 'pipe:0',
+        ]
+        if audio:
+            command += ['-f', 'lavfi', '-i', f'sine=frequency=440:sample_rate=44100:duration={frame_count / fps}',
+                        '-c:a', 'aac', '-b:a', '128k']
+        command += ['-c:v', 'libx264', '-preset', 'veryfast', '-crf', '20', '-pix_fmt', pix_fmt,
+                    '-g', str(fps * 2), '-movflags', '+faststart', path]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE)
+        try:
+            for i in range(frame_count):
+                process.stdin.write(frames.frame(i).data)
+        finally:
+            process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to generate {path}")
+    else:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+        try:
+            for i in range(frame_count):
+                writer.write(frames.frame(i))
+        finally:
+            writer.release()
+
+    return frame_count
+
+
+def get_clip(cache_dir, resolution, seconds, fps=DEFAULT_FPS, seed=0, pix_fmt=DEFAULT_PIX_FMT):
+    """Return the path of a cached synthetic clip, generating it if needed"""
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, clip_name(resolution, seconds, fps, seed, pix_fmt))
+    if not os.path.exists(path):
+        tmp_path = path + '.part.mp4'
+        generate_clip(tmp_path, resolution, seconds, fps, seed, pix_fmt=pix_fmt)
+        os.replace(tmp_path, path)
+    return path
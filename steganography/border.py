@@ -0,0 +1,384 @@
+"""Template-cached compositor for the data-encoding border.
+
+Everything create_data_border draws apart from the top-left data corner only
+depends on the frame size and on frame_index % 8, so the decorative corners,
+the 8 overlay phases and their alpha masks are rendered once per
+(width, height, border_width) and reused across frames and requests. Per
+frame we only paint the data corner and blend the four border strips in
+place, so the cost scales with the border area instead of the frame area.
+"""
+import colorsys
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+BORDER_ALPHA = 0.6  # Translucency of the decorative border overlay
+PATTERN_PHASES = 8  # The border pattern repeats every 8 frames
+SEGMENT_WIDTH = 2
+TEMPLATE_CACHE_SIZE = 8
+
+_template_cache = OrderedDict()
+_template_lock = threading.Lock()
+_scratch = threading.local()
+
+
+def bits_per_frame_limit(width, height, border_width=20):
+    """Most payload bits one frame's border window spans, before the corner size cap"""
+    return (2 * (width + height) - 4 * border_width) // 2
+
+
+def text_bits(text):
+    """Convert text to a uint8 array of bits (MSB first), like text_to_binary"""
+    if isinstance(text, str):
+        text = text.encode('utf-8')
+    return np.unpackbits(np.frombuffer(text, dtype=np.uint8))
+
+
+def bit_colors(frame_index, total_frames):
+    """Return the BGR colours used for '0' and '1' bits in a given frame"""
+    hue_shift = (frame_index / total_frames) * 0.3  # Shift hue by up to 0.3
+
+    # Color for '0' bit - dark blue to purple range
+    zero_color = tuple(int(x * 255) for x in colorsys.hsv_to_rgb((0.6 + hue_shift) % 1.0, 0.7, 0.4))
+    # Color for '1' bit - orange to red range
+    one_color = tuple(int(x * 255) for x in colorsys.hsv_to_rgb((0.05 + hue_shift) % 1.0, 0.9, 0.7))
+
+    # Convert to BGR
+    return zero_color[::-1], one_color[::-1]
+
+
+def _draw_decorative_corners(canvas, width, height, corner_size, value=None):
+    """Draw the three decorative corners; with value set, draw a coverage mask instead"""
+    def color(c):
+        return c if value is None else value
+
+    # Top-right corner (green with diagonal lines)
+    cv2.rectangle(canvas, (width - corner_size, 0), (width, corner_size), color((30, 180, 30)), -1)
+    for i in range(0, corner_size, 4):
+        cv2.line(canvas, (width - corner_size, i), (width - corner_size + i, 0), color((255, 255, 255)), 1)
+
+    # Bottom-left corner (blue with a circle)
+    cv2.rectangle(canvas, (0, height - corner_size), (corner_size, height), color((180, 30, 30)), -1)
+    cv2.circle(canvas, (corner_size // 2, height - corner_size // 2),
+               corner_size // 3, color((255, 255, 255)), 2)
+
+    # Bottom-right corner (cyan with a square)
+    cv2.rectangle(canvas, (width - corner_size, height - corner_size), (width, height), color((180, 180, 30)), -1)
+    cv2.rectangle(canvas, (width - corner_size + 5, height - corner_size + 5),
+                  (width - 5, height - 5), color((255, 255, 255)), 2)
+
+
+def _draw_overlay_phase(canvas, width, height, border_width, corner_size, phase, value=None):
+    """Draw the translucent border pattern for frames where frame_index % 8 == phase"""
+    step = SEGMENT_WIDTH * 2
+
+    def color(c):
+        return c if value is None else value
+
+    # Top border (excluding corners)
+    for x in range(corner_size, width - corner_size, step):
+        p = (x + phase) % PATTERN_PHASES
+        if p < 4:
+            cv2.rectangle(canvas, (x, 0), (x + step - 1, border_width - 1),
+                          color((30 + p * 20, 30 + p * 10, 150 - p * 10)), -1)
+
+    # Right border (excluding corners)
+    for y in range(corner_size, height - corner_size, step):
+        p = (y + phase) % PATTERN_PHASES
+        if p < 4:
+            cv2.rectangle(canvas, (width - border_width, y), (width - 1, y + step - 1),
+                          color((30 + p * 10, 150 - p * 10, 30 + p * 20)), -1)
+
+    # Bottom border (excluding corners)
+    for x in range(width - corner_size, corner_size, -step):
+        p = (x + phase) % PATTERN_PHASES
+        if p < 4:
+            cv2.rectangle(canvas, (x - step + 1, height - border_width), (x, height - 1),
+                          color((150 - p * 10, 30 + p * 10, 30 + p * 20)), -1)
+
+    # Left border (excluding corners)
+    for y in range(height - corner_size, corner_size, -step):
+        p = (y + phase) % PATTERN_PHASES
+        if p < 4:
+            cv2.rectangle(canvas, (0, y - step + 1), (border_width - 1, y),
+                          color((30 + p * 20, 150 - p * 10, 30 + p * 10)), -1)
+
+
+class BorderTemplate:
+    """Pre-rendered corners, overlay phases and alpha masks for one frame size"""
+
+    def __init__(self, width, height, border_width=20):
+        self.width = width
+        self.height = height
+        self.border_width = border_width
+        self.corner_size = corner_size = border_width * 2
+
+        # Number of border bits each frame carries (see create_data_border)
+        self.bits_per_frame_limit = bits_per_frame_limit(width, height, border_width)
+
+        # Decorative corners are opaque, so keep the final pixels and a coverage mask
+        canvas = np.zeros((height, width, 3), dtype=np.uint8)
+        coverage = np.zeros((height, width), dtype=np.uint8)
+        _draw_decorative_corners(canvas, width, height, corner_size)
+        _draw_decorative_corners(coverage, width, height, corner_size, value=255)
+        corner_rois = [
+            (slice(0, corner_size + 1), slice(max(width - corner_size, 0), width)),  # Top-right
+            (slice(max(height - corner_size, 0), height), slice(0, corner_size + 1)),  # Bottom-left
+            (slice(max(height - corner_size, 0), height), slice(max(width - corner_size, 0), width)),  # Bottom-right
+        ]
+        self.corners = [
+            (roi, canvas[roi].copy(), coverage[roi][..., None] > 0)
+            for roi in corner_rois
+        ]
+
+        # The four translucent border strips (excluding corners)
+        self.strips = [
+            (slice(0, border_width), slice(corner_size, width - corner_size)),  # Top
+            (slice(corner_size, height - corner_size), slice(width - border_width, width)),  # Right
+            (slice(height - border_width, height), slice(corner_size, width - corner_size)),  # Bottom
+            (slice(corner_size, height - corner_size), slice(0, border_width)),  # Left
+        ]
+
+        # Overlay colours and masks for each of the 8 pattern phases, strip by strip
+        self.phases = []
+        for phase in range(PATTERN_PHASES):
+            canvas[:] = 0
+            coverage[:] = 0
+            _draw_overlay_phase(canvas, width, height, border_width, corner_size, phase)
+            _draw_overlay_phase(coverage, width, height, border_width, corner_size, phase, value=255)
+            self.phases.append([
+                (canvas[roi].copy(), coverage[roi][..., None] > 0)
+                for roi in self.strips
+            ])
+
+    def _scratch_buffer(self, index, shape):
+        """Per-thread scratch buffer for strip blending so frames don't allocate"""
+        buffers = getattr(_scratch, 'buffers', None)
+        if buffers is None:
+            buffers = _scratch.buffers = {}
+        key = (self.width, self.height, self.border_width, index)
+        buf = buffers.get(key)
+        if buf is None or buf.shape != shape:
+            buf = buffers[key] = np.empty(shape, dtype=np.uint8)
+        return buf
+
+    def apply(self, frame, bits, frame_index, total_frames):
+        """Draw the border onto frame in place; bits is the full payload as a bit array"""
+        corner_size = self.corner_size
+
+        # Calculate which portion of the data to encode in this frame
+        # (overlaps by 2/3 between frames for redundancy, wrapping around)
+        num_bits = len(bits)
+        bits_per_frame = min(num_bits, self.bits_per_frame_limit)
+        count = min(bits_per_frame, corner_size * corner_size)
+        if count > 0:
+            start_index = (frame_index * bits_per_frame // 3) % num_bits
+            frame_bits = bits[(start_index + np.arange(count)) % num_bits]
+
+            zero_color, one_color = bit_colors(frame_index, total_frames)
+            palette = np.array([zero_color, one_color], dtype=np.uint8)
+            colors = palette[frame_bits]
+
+            # Fill the top-left corner row by row
+            top_left = frame[0:corner_size, 0:corner_size]
+            full_rows, remainder = divmod(count, corner_size)
+            top_left[:full_rows] = colors[:full_rows * corner_size].reshape(full_rows, corner_size, 3)
+            if remainder:
+                top_left[full_rows, :remainder] = colors[full_rows * corner_size:]
+
+        # Paste the decorative corners
+        for roi, patch, mask in self.corners:
+            np.copyto(frame[roi], patch, where=mask)
+
+        # Blend the overlay into each border strip only where the pattern was drawn
+        for i, (roi, (overlay, mask)) in enumerate(zip(self.strips, self.phases[frame_index % PATTERN_PHASES])):
+            region = frame[roi]
+            if region.size == 0:
+                continue
+            blended = self._scratch_buffer(i, region.shape)
+            cv2.addWeighted(region, 1 - BORDER_ALPHA, overlay, BORDER_ALPHA, 0, dst=blended)
+            np.copyto(region, blended, where=mask)
+
+        return frame
+
+
+def get_border_template(width, height, border_width=20):
+    """Return the cached template for a frame size, building it on first use"""
+    key = (width, height, border_width)
+    with _template_lock:
+        template = _template_cache.get(key)
+        if template is not None:
+            _template_cache.move_to_end(key)
+            return template
+
+    template = BorderTemplate(width, height, border_width)
+
+    with _template_lock:
+        _template_cache[key] = template
+        _template_cache.move_to_end(key)
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+    return template
+
+
+def apply_data_border(frame, bits, frame_index, total_frames, border_width=20):
+    """Draw the data-encoding border onto frame in place and return it"""
+    height, width = frame.shape[:2]
+    template = get_border_template(width, height, border_width)
+    return template.apply(frame, bits, frame_index, total_frames)
+
+
+# Decoding side: batched over all sampled frames
+
+# A pixel is a '1' bit when red exceeds blue by this much (orange/red vs blue/purple)
+ONE_BIT_MARGIN = 20
+
+
+def stack_corners(frames, border_width=20):
+    """Stack the top-left and top-right corners of frames into two (N, cs, cs, 3) arrays
+
+    Frames too small to hold a corner get an all-zero corner.
+    """
+    corner_size = border_width * 2
+    top_left = np.zeros((len(frames), corner_size, corner_size, 3), dtype=np.uint8)
+    top_right = np.zeros_like(top_left)
+    for i, frame in enumerate(frames):
+        height, width = frame.shape[:2]
+        if width < corner_size or height < corner_size:
+            continue
+        top_left[i] = frame[0:corner_size, 0:corner_size, :3]
+        top_right[i] = frame[0:corner_size, width - corner_size:width, :3]
+    return top_left, top_right
+
+
+def corner_strip(frame, border_width=20):
+    """The top-left and top-right corners side by side, as corner_reader produces them
+
+    The strip decodes like the full frame. Frames too narrow for the corners
+    not to overlap are returned unchanged.
+    """
+    corner_size = border_width * 2
+    height, width = frame.shape[:2]
+    if width < corner_size * 2 or height < corner_size:
+        return frame
+    return np.hstack((frame[:corner_size, :corner_size, :3],
+                      frame[:corner_size, width - corner_size:, :3]))
+
+
+def detect_borders(frames, border_width=20):
+    """Return a bool array telling which frames carry our top-left encoding pattern"""
+    if not frames:
+        return np.zeros(0, dtype=bool)
+    corner_size = border_width * 2
+    top_left, top_right = stack_corners(frames, border_width)
+    sizes = np.array([frame.shape[:2] for frame in frames])
+    big_enough = (sizes[:, 0] >= corner_size) & (sizes[:, 1] >= corner_size)
+
+    # The data corner should have significant colour variance (mix of 0 and 1
+    # bits) and strong red or blue components (our bit colours)
+    pixels = top_left.reshape(len(frames), -1, 3)
+    high_variance = np.std(pixels, axis=1).mean(axis=1) > 50
+    strong_color = np.mean(pixels, axis=1).max(axis=1) > 100
+
+    # ...or the top-right decorative corner should be green
+    tr_color = np.mean(top_right.reshape(len(frames), -1, 3), axis=1)
+    tr_green = ((tr_color[:, 1] > tr_color[:, 0] + 30) & (tr_color[:, 1] > tr_color[:, 2] + 30)
+                & (sizes[:, 1] >= corner_size * 2))
+
+    return big_enough & ((high_variance & strong_color) | tr_green)
+
+
+def decode_corner_bits(top_left):
+    """Threshold stacked top-left corners into an (N, cs*cs) array of bits in row-major order"""
+    # uint8 arithmetic on purpose: matches the per-pixel check this replaced
+    blue = top_left[..., 0] + np.uint8(ONE_BIT_MARGIN)
+    bits = top_left[..., 2] > blue
+    return bits.reshape(len(top_left), -1)
+
+
+def decode_border_bytes(frames, border_width=20):
+    """Decode the raw bytes in the top-left corner of every frame in one go"""
+    if not frames:
+        return []
+    top_left, _ = stack_corners(frames, border_width)
+    packed = np.packbits(decode_corner_bits(top_left), axis=1)
+    return [row.tobytes() for row in packed]
+
+
+_PRINTABLE = bytes(range(32, 127))
+_NON_PRINTABLE = bytes(set(range(256)) - set(_PRINTABLE))
+
+
+def printable_text(data):
+    """Keep only printable ASCII characters of decoded bytes, like binary_to_text"""
+    return data.translate(None, _NON_PRINTABLE).decode('ascii')
+
+
+# Majority-vote reconstruction. When the "STEGO:" payload fits in the data
+# corner, every frame carries all of it, rotated so that frame k starts at bit
+# (k * n // 3) % n of the n payload bits (the 2/3 overlap). For each
+# candidate length n we undo the rotations, take a per-bit majority across
+# the frames and keep the n the frames agree on best. Frames whose index is a
+# multiple of 3 all share rotation 0, so at least two distinct rotations are
+# needed before a length can be told apart from its neighbours.
+
+STEGO_PREFIX_BITS = text_bits("STEGO:").astype(bool)
+# Lengths whose voted "STEGO:" bits are further off than this are skipped
+PREFIX_TOLERANCE_BITS = 6
+# A frame confirms the vote when at least this share of its bits match the
+# majority of the other frames
+FRAME_AGREEMENT = 0.98
+# Votes less consistent than this are treated as noise
+MIN_VOTE_CONFIDENCE = 0.85
+
+
+def leave_one_out_agreement(rows):
+    """Share of each row's bits that match the majority of the other rows
+
+    A frame's own bits don't count towards the majority it is compared
+    with, and ties among the others count as disagreement, so two frames
+    that share an error can't confirm each other's vote.
+    """
+    others = rows.sum(axis=0)[None, :] - rows
+    remaining = len(rows) - 1
+    majority = others * 2 > remaining
+    decided = others * 2 != remaining
+    return ((majority == rows) & decided).mean(axis=1)
+
+
+def vote_border_payload(corner_bits, indices, width, height, border_width=20):
+    """Reconstruct the border payload from the corner bits of several frames
+
+    corner_bits is decode_corner_bits() output for frames at the given
+    indices of a width x height video. Returns a dict with the payload bytes,
+    its confidence (mean share of bits agreeing with the vote) and how many
+    frames confirm it leave-one-out, or None if no payload length fits.
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if len(indices) < 2:
+        return None
+    max_bits = min(corner_bits.shape[1], bits_per_frame_limit(width, height, border_width))
+    best = None
+    for n in range(len(STEGO_PREFIX_BITS) + 8, max_bits + 1, 8):
+        shifts = (indices * n // 3) % n
+        if len(np.unique(shifts)) < 2:
+            continue
+        # Undo each frame's rotation so position p holds payload bit p
+        rows = np.stack([np.roll(corner_bits[i, :n], shift) for i, shift in enumerate(shifts)])
+        majority = rows.sum(axis=0) * 2 > len(rows)
+        prefix = majority[:len(STEGO_PREFIX_BITS)]
+        if np.count_nonzero(prefix != STEGO_PREFIX_BITS) > PREFIX_TOLERANCE_BITS:
+            continue
+        confidence = float((rows == majority).mean())
+        if confidence < MIN_VOTE_CONFIDENCE:
+            continue
+        if best is None or confidence > best["confidence"]:
+            best = {
+                "data": np.packbits(majority).tobytes(),
+                "confidence": confidence,
+                "agreeing": int((leave_one_out_agreement(rows) >= FRAME_AGREEMENT).sum()),
+                "frames": len(rows),
+            }
+    return best
@@ -0,0 +1,123 @@
+"""Corner-only decoding of sampled frames for border extraction.
+
+The border decoders only look at the top-left (data) and top-right
+(decorative) corners, border_width * 2 pixels square. Instead of converting
+every sampled frame to full-resolution BGR (25 MB per 4K frame), CornerReader
+has ffmpeg select the sampled frames, crop both corners while still in the
+source pixel format and stack them side by side. Each sampled frame arrives as
+a (corner_size, 2 * corner_size) BGR strip of a few KB, laid out like the top
+of a frame exactly 2 * corner_size wide, so the border.py decoders accept it
+unchanged.
+
+The border sampler reads its candidates in batches and usually stops early,
+so all of them are selected in a single ffmpeg run whose output is read as
+the batches are asked for: each batch continues the decode where the last
+one stopped instead of decoding the video from the start again.
+"""
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+
+CORNER_READ_TIMEOUT = 300
+
+
+def corner_filter(indices, corner_size):
+    """Filter graph selecting frames by index and stacking their top corners"""
+    select = '+'.join(f'eq(n\\,{i})' for i in indices)
+    return (f"[0:v:0]select='{select}',split=2[left][right];"
+            f"[left]crop={corner_size}:{corner_size}:0:0[tl];"
+            f"[right]crop={corner_size}:{corner_size}:iw-{corner_size}:0[tr];"
+            f"[tl][tr]hstack=inputs=2,format=bgr24[corners]")
+
+
+class CornerReader:
+    """Corner strips of the candidate frames, decoded in one pass as they are asked for
+
+    indices are every frame the caller may ask for; read() hands them out in
+    ascending batches. Use as a context manager so ffmpeg is stopped once the
+    caller has what it needs.
+    """
+
+    def __init__(self, video_path, indices, width, height, border_width=20):
+        self.corner_size = border_width * 2
+        self.candidates = sorted(set(indices))
+        self._candidate_set = set(self.candidates)
+        self.strip_size = self.corner_size * self.corner_size * 2 * 3
+        self.process = None
+        self._next = 0
+        self._strips = {}
+        self._failed = False
+        if not self.candidates or shutil.which('ffmpeg') is None:
+            return
+        if width < self.corner_size * 2 or height < self.corner_size:
+            return
+
+        command = [
+            'ffmpeg', '-hide_banner', '-nostdin', '-loglevel', 'error',
+            '-i', video_path,
+            '-filter_complex', corner_filter(self.candidates, self.corner_size),
+            '-map', '[corners]', '-vsync', 'passthrough',
+            # Stop decoding once the last candidate is out
+            '-frames:v', str(len(self.candidates)),
+            '-f', 'rawvideo', 'pipe:1',
+        ]
+        # A file, so a chatty decoder can't block on a full stderr pipe
+        self._log = tempfile.TemporaryFile()
+        try:
+            self.process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=self._log)
+        except OSError as e:
+            print(f"[WARNING] Corner decode failed: {e}")
+            self._log.close()
+            return
+        self._timer = threading.Timer(CORNER_READ_TIMEOUT, self.process.kill)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def read(self, indices):
+        """Return {index: corner strip} for the wanted frames, or None if this path can't be used
+
+        None means ffmpeg is unavailable, failed, or the frame is too small
+        for the corners not to overlap; callers then fall back to full frames.
+        Indices past the end of the video are left out.
+        """
+        if self.process is None or self._failed or not set(indices) <= self._candidate_set:
+            return None
+        last = max(indices, default=-1)
+        while self._next < len(self.candidates) and self.candidates[self._next] <= last:
+            strip = self.process.stdout.read(self.strip_size)
+            if len(strip) < self.strip_size:
+                if self.process.wait() != 0:
+                    self._log.seek(0)
+                    print(f"[WARNING] Corner decode failed: {self._log.read().decode(errors='ignore')[-500:]}")
+                    self._failed = True
+                    return None
+                # The video ended before the last candidates
+                self._next = len(self.candidates)
+                break
+            # select keeps presentation order, so the k-th strip is the k-th candidate
+            self._strips[self.candidates[self._next]] = np.frombuffer(strip, dtype=np.uint8).reshape(
+                self.corner_size, self.corner_size * 2, 3)
+            self._next += 1
+        return {i: self._strips[i] for i in indices if i in self._strips}
+
+    def close(self):
+        """Stop ffmpeg if it's still running"""
+        if self.process is None:
+            return
+        self._timer.cancel()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        self._log.close()
+        self.process = None
+
@@ -0,0 +1,158 @@
+"""Content-addressed cache of /decrypt results.
+
+The same encoded video tends to be submitted again and again (result page,
+verify page, contract lookups), so decrypt results are cached under the
+SHA-256 of the uploaded bytes, which is computed while the upload is saved.
+Entries live in a small in-memory LRU backed by one JSON file per hash in
+<root>, bounded by entry count (memory), total size (disk, oldest entries go
+first) and a TTL, so every worker process of a multi-process server shares
+the disk tier.
+
+The entry key also covers CACHE_VERSION and the fingerprint of the RSA key
+the result was decrypted with (key_id), so a key rotation or reload never
+serves plaintext from the old key.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+# Bump when the decoders change what they return for the same video
+CACHE_VERSION = 1
+
+CACHE_LOOKUPS = metrics.registry.register(metrics.Counter(
+    'stego_decrypt_cache_lookups_total', 'Decrypt cache lookups by outcome', ['result']))
+
+
+class DecryptCache:
+    def __init__(self, root, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl_seconds=86400, key_id=None):
+        self.root = root
+        # Callable returning the id of the current decryption key, or None
+        self.key_id = key_id
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        # Keys are hex digests; anything else could be a path traversal attempt
+        if not key or len(key) != 64 or any(c not in '0123456789abcdef' for c in key):
+            return None
+        return os.path.join(self.root, f"{key}.json")
+
+    def entry_key(self, content_hash):
+        """The key a content hash is stored under for the current cache version and decryption key"""
+        key_id = self.key_id() if self.key_id is not None else ''
+        return hashlib.sha256(f"{CACHE_VERSION}:{key_id}:{content_hash}".encode()).hexdigest()
+
+    def get(self, content_hash):
+        """Return the cached response data for a content hash, or None"""
+        data = self._get(self.entry_key(content_hash))
+        CACHE_LOOKUPS.inc(result='miss' if data is None else 'hit')
+        return data
+
+    def _get(self, key):
+        now = time.time()
+        with self._lock:
+            record = self._memory.get(key)
+            if record is not None:
+                if record["expires"] >= now:
+                    self._memory.move_to_end(key)
+                    return record["data"]
+                del self._memory[key]
+
+        path = self._path(key)
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("version") != CACHE_VERSION or record.get("expires", 0) < now:
+            self._remove(path)
+            return None
+
+        self._remember(key, record)
+        return record["data"]
+
+    def put(self, content_hash, data):
+        key = self.entry_key(content_hash)
+        path = self._path(key)
+        if path is None:
+            return
+        now = time.time()
+        record = {"version": CACHE_VERSION, "key": key, "data": data,
+                  "created": now, "expires": now + self.ttl_seconds}
+        self._remember(key, record)
+
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(record, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"[WARNING] Could not write decrypt cache entry: {e}")
+            self._remove(tmp_path)
+            return
+        self._enforce_disk_limit()
+
+    def _remember(self, key, record):
+        with self._lock:
+            self._memory[key] = record
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _enforce_disk_limit(self):
+        """Drop expired entries, then the oldest ones until under max_bytes
+
+        Files are never touched after they are written, so mtime + TTL is
+        the record's expiry.
+        """
+        if not self._disk_lock.acquire(blocking=False):
+            return  # Another thread is already cleaning up
+        try:
+            now = time.time()
+            entries = []
+            for name in os.listdir(self.root):
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(self.root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.st_mtime + self.ttl_seconds < now:
+                    self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+        finally:
+            self._disk_lock.release()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for name in os.listdir(self.root):
+            if name.endswith('.json'):
+                self._remove(os.path.join(self.root, name))
@@ -0,0 +1,151 @@
+"""Reed-Solomon erasure coding of the payload over GF(256).
+
+encode_shards() cuts the payload into k data shards and adds n - k parity
+shards (a systematic Cauchy code), one shard per payload frame. Any k intact
+shards rebuild the payload, so the decoder can stop reading after k good
+frames, and up to n - k damaged or dropped frames cost nothing. Every shard
+describes itself and carries a CRC, so a damaged frame is simply skipped
+rather than corrupting the result. Layout (big endian):
+
+    b"SVE" | k (1) | n (1) | shard index (1) | payload length (4) | CRC-32 (4) | shard data
+
+The CRC covers the shard data. Shard i < k holds bytes [i * size, (i + 1) *
+size) of the zero-padded payload; shard i >= k holds row i - k of the Cauchy
+parity matrix times the data shards.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+SHARD_MAGIC = b"SVE"
+MAX_SHARDS = 255
+
+_SHARD = struct.Struct('>3sBBBII')
+
+# GF(256) with the Reed-Solomon polynomial x^8 + x^4 + x^3 + x^2 + 1
+_EXP = np.zeros(512, dtype=np.uint8)
+_LOG = np.zeros(256, dtype=np.int32)
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11d
+_EXP[255:510] = _EXP[:255]
+# MUL[a] is the multiply-by-a lookup table, so MUL[a][row] scales a whole shard
+MUL = np.zeros((256, 256), dtype=np.uint8)
+MUL[1:, 1:] = _EXP[(_LOG[1:, None] + _LOG[None, 1:]) % 255]
+
+
+def _inverse(a):
+    return int(_EXP[255 - _LOG[a]])
+
+
+def _generator_row(index, k):
+    """Coefficients producing shard index from the k data shards"""
+    if index < k:
+        row = np.zeros(k, dtype=np.uint8)
+        row[index] = 1
+        return row
+    # Cauchy row: 1 / (x + y_j) with x = index and y_j = j, all distinct
+    return np.array([_inverse(index ^ j) for j in range(k)], dtype=np.uint8)
+
+
+def _combine(coefficients, shards):
+    """GF(256) linear combination of equally long shard arrays"""
+    out = np.zeros(shards.shape[1], dtype=np.uint8)
+    for c, shard in zip(coefficients, shards):
+        if c:
+            out ^= MUL[c][shard]
+    return out
+
+
+def _invert(matrix):
+    """Invert a k x k GF(256) matrix by Gauss-Jordan elimination"""
+    k = len(matrix)
+    a = np.concatenate([matrix, np.eye(k, dtype=np.uint8)], axis=1)
+    for col in range(k):
+        pivot = next(r for r in range(col, k) if a[r, col])
+        a[[col, pivot]] = a[[pivot, col]]
+        a[col] = MUL[_inverse(int(a[col, col]))][a[col]]
+        for r in range(k):
+            if r != col and a[r, col]:
+                a[r] ^= MUL[int(a[r, col])][a[col]]
+    return a[:, k:]
+
+
+def encode_shards(data, k, n):
+    """Split data into n shards, any k of which rebuild it"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if not 1 <= k <= n <= MAX_SHARDS:
+        raise ValueError(f"Need 1 <= k <= n <= {MAX_SHARDS}, got k={k}, n={n}")
+    size = max(-(-len(data) // k), 1)
+    padded = np.zeros(k * size, dtype=np.uint8)
+    padded[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+    blocks = padded.reshape(k, size)
+
+    shards = []
+    for index in range(n):
+        block = blocks[index] if index < k else _combine(_generator_row(index, k), blocks)
+        body = block.tobytes()
+        shards.append(_SHARD.pack(SHARD_MAGIC, k, n, index, len(data), zlib.crc32(body)) + body)
+    return shards
+
+
+def parse_shard(raw):
+    """Return a shard dict, or None if raw isn't an intact shard"""
+    if not raw or len(raw) < _SHARD.size or not raw.startswith(SHARD_MAGIC):
+        return None
+    _, k, n, index, length, crc = _SHARD.unpack_from(raw)
+    body = raw[_SHARD.size:]
+    if not 1 <= k <= n or index >= n or zlib.crc32(body) != crc:
+        return None
+    return {"k": k, "n": n, "index": index, "length": length, "data": body}
+
+
+class ShardCollector:
+    """Gathers shards as frames are read and rebuilds the payload once k agree"""
+
+    def __init__(self):
+        self.shards = {}
+        self.rejected = 0
+
+    def add(self, raw):
+        """Add one frame's message; returns True if it was a usable shard"""
+        shard = parse_shard(raw)
+        if shard is None or (self.shards and not self._matches(shard)):
+            self.rejected += 1
+            return False
+        self.shards.setdefault(shard["index"], shard)
+        return True
+
+    def _matches(self, shard):
+        first = next(iter(self.shards.values()))
+        return all(shard[key] == first[key] for key in ("k", "n", "length")) and \
+            len(shard["data"]) == len(first["data"])
+
+    @property
+    def needed(self):
+        """Shards still missing before the payload can be rebuilt (None before the first)"""
+        if not self.shards:
+            return None
+        return max(next(iter(self.shards.values()))["k"] - len(self.shards), 0)
+
+    def payload(self):
+        """The rebuilt payload bytes, or None without k shards"""
+        if self.needed != 0:
+            return None
+        first = next(iter(self.shards.values()))
+        k = first["k"]
+        # Prefer data shards: they need no arithmetic
+        chosen = sorted(self.shards)[:k]
+        stacked = np.stack([np.frombuffer(self.shards[i]["data"], dtype=np.uint8) for i in chosen])
+        if chosen == list(range(k)):
+            blocks = stacked
+        else:
+            decoder = _invert(np.stack([_generator_row(i, k) for i in chosen]))
+            blocks = np.stack([_combine(row, stacked) for row in decoder])
+        return blocks.reshape(-1)[:first["length"]].tobytes()
@@ -0,0 +1,83 @@
+"""Versioned header hidden in frame 0 of every encoded video.
+
+Older videos only say where their payload is through a metadata frame
+appended at the end, so the decoder had to scan the last frames and then
+fall back to blind-checking the first 15. Videos now also carry this header
+in the LSBs of frame 0. The payload parts start at frame 1. The header lists
+exactly which frames hold them, so the decoder reads frame 0 and then only
+those frames. Layout (big endian), hidden with lsb_codec like any other
+message:
+
+    b"SVH" | version (1) | scheme (1) | border width (1) | border frames (1)
+    | payload length (4) | frame count (2) | frame indices (4 each) | CRC-32 (4)
+
+The CRC covers everything before it. A frame without the magic, with an
+unknown version or with a bad CRC has no header, and the decoder takes the
+metadata frame path instead. Decoders that predate a scheme see no header
+either, so erasure-coded videos need a decoder that knows 'rsa-erasure'.
+"""
+import struct
+import zlib
+
+from lsb_codec import hide_array, reveal_bytes
+
+HEADER_MAGIC = b"SVH"
+HEADER_VERSION = 1
+HEADER_FRAME = 0
+
+# Payload encoding schemes
+SCHEME_RSA_BASE64 = 1  # base64 RSA-OAEP ciphertext or SE1 envelope, split across the frames in order
+SCHEME_RSA_ERASURE = 2  # the same base64 text as erasure.py shards, any k of the frames rebuild it
+SCHEMES = {SCHEME_RSA_BASE64: 'rsa-base64', SCHEME_RSA_ERASURE: 'rsa-erasure'}
+SCHEME_CODES = {name: code for code, name in SCHEMES.items()}
+
+# Which frames carry the data border
+BORDER_FRAMES = {0: 'all', 1: 'payload'}
+BORDER_FRAME_CODES = {name: code for code, name in BORDER_FRAMES.items()}
+
+_FIXED = struct.Struct('>3sBBBBIH')
+_INDEX = struct.Struct('>I')
+_CRC = struct.Struct('>I')
+
+
+def pack_header(frames, payload_length, border_width=20, border_frames='all', scheme=SCHEME_RSA_BASE64):
+    """Serialize a header listing the payload frames in order"""
+    data = _FIXED.pack(HEADER_MAGIC, HEADER_VERSION, scheme, border_width,
+                       BORDER_FRAME_CODES[border_frames], payload_length, len(frames))
+    data += b''.join(_INDEX.pack(index) for index in frames)
+    return data + _CRC.pack(zlib.crc32(data))
+
+
+def unpack_header(data):
+    """Parse a header; returns a dict, or None if data isn't a valid header"""
+    if not data or len(data) < _FIXED.size + _CRC.size or not data.startswith(HEADER_MAGIC):
+        return None
+    magic, version, scheme, border_width, border_code, payload_length, count = _FIXED.unpack_from(data)
+    if version != HEADER_VERSION or scheme not in SCHEMES or border_code not in BORDER_FRAMES:
+        return None
+    end = _FIXED.size + count * _INDEX.size
+    if len(data) != end + _CRC.size or _CRC.unpack_from(data, end)[0] != zlib.crc32(data[:end]):
+        return None
+    return {
+        "version": version,
+        "scheme": SCHEMES[scheme],
+        "border_width": border_width,
+        "border_frames": BORDER_FRAMES[border_code],
+        "payload_length": payload_length,
+        "frames": [_INDEX.unpack_from(data, _FIXED.size + i * _INDEX.size)[0] for i in range(count)],
+    }
+
+
+def hide_header(frame, header_bytes):
+    """Hide a packed header in a frame in place"""
+    return hide_array(frame, header_bytes, in_place=True)
+
+
+def read_header(frame):
+    """Return the header hidden in a frame, or None"""
+    if frame is None:
+        return None
+    try:
+        return unpack_header(reveal_bytes(frame))
+    except ValueError:
+        return None
@@ -0,0 +1,174 @@
+"""Seek-aware random access to video frames.
+
+Seeking with CAP_PROP_POS_FRAMES makes the decoder jump back to the nearest
+keyframe and decode forward, which is expensive on long-GOP H.264 files like
+the ones ffmpeg produces. FrameReader takes the set of wanted indices, visits
+them in order and, for every gap, picks the cheaper of seeking or skipping
+forward with grab() (which decodes but skips the pixel conversion), using the
+keyframe positions of the file. Recently decoded frames are kept in a small
+LRU so overlapping requests don't decode twice.
+"""
+import bisect
+import shutil
+import subprocess
+from collections import OrderedDict
+
+import cv2
+
+# Cost model, in units of "one frame decoded and converted"
+READ_COST = 1.0
+GRAB_COST = 0.7  # grab() decodes but skips the colour conversion
+SEEK_OVERHEAD = 3.0  # demuxer reset and decoder flush on every seek
+
+# libx264's default keyint, assumed when the keyframes can't be probed
+DEFAULT_GOP = 250
+
+# Codecs where every frame is a keyframe, so seeking is always cheap
+INTRA_ONLY_FOURCCS = {'png ', 'mjpg', 'MJPG', 'jpeg', 'ffv1', 'FFV1', 'rawv', 'RGBA', 'BGRA', 'ap4h', 'apch', 'apcn'}
+
+FRAME_CACHE_SIZE = 32
+
+
+def probe_keyframes(video_path):
+    """Return the sorted frame indices of keyframes using ffprobe, or None if unavailable"""
+    if shutil.which('ffprobe') is None:
+        return None
+
+    command = [
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts,flags',
+        '-of', 'csv=p=0',
+        video_path,
+    ]
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        print(f"[WARNING] Could not probe keyframes: {e}")
+        return None
+    if result.returncode != 0:
+        return None
+
+    # Packets come in decode order; sort by pts to get presentation (frame) order
+    packets = []
+    for line in result.stdout.decode(errors='ignore').splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or not parts[0].lstrip('-').isdigit():
+            continue
+        packets.append((int(parts[0]), 'K' in parts[1]))
+    packets.sort()
+
+    keyframes = [index for index, (_, is_key) in enumerate(packets) if is_key]
+    return keyframes or None
+
+
+class FrameReader:
+    """Read arbitrary sets of frames from a video with as little decoding as possible"""
+
+    def __init__(self, video_path, cache_size=FRAME_CACHE_SIZE, keyframes=None):
+        self.video_path = video_path
+        self.cap = cv2.VideoCapture(video_path)
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.position = 0
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._keyframes = keyframes
+
+        # Counters, handy when tuning the cost model
+        self.stats = {"seeks": 0, "grabs": 0, "reads": 0, "cache_hits": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        self._cache.clear()
+
+    @property
+    def keyframes(self):
+        """Keyframe indices, probed lazily and only when a seek decision needs them"""
+        if self._keyframes is None:
+            fourcc = int(self.cap.get(cv2.CAP_PROP_FOURCC))
+            codec = ''.join(chr((fourcc >> (8 * i)) & 0xFF) for i in range(4))
+            if codec in INTRA_ONLY_FOURCCS:
+                self._keyframes = list(range(max(self.frame_count, 1)))
+            else:
+                self._keyframes = (probe_keyframes(self.video_path)
+                                   or list(range(0, max(self.frame_count, 1), DEFAULT_GOP)))
+        return self._keyframes
+
+    def _previous_keyframe(self, index):
+        keyframes = self.keyframes
+        i = bisect.bisect_right(keyframes, index) - 1
+        return keyframes[i] if i >= 0 else 0
+
+    def _should_seek(self, target):
+        """Decide whether seeking to target is cheaper than grabbing forward to it"""
+        if target < self.position:
+            return True
+        skip_cost = (target - self.position) * GRAB_COST
+        if skip_cost <= SEEK_OVERHEAD:
+            return False
+        seek_cost = SEEK_OVERHEAD + (target - self._previous_keyframe(target)) * GRAB_COST
+        return seek_cost < skip_cost
+
+    def _remember(self, index, frame):
+        self._cache[index] = frame
+        self._cache.move_to_end(index)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _decode(self, index):
+        """Position the decoder on index and return the decoded frame (or None)"""
+        if index != self.position:
+            if self._should_seek(index):
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                self.stats["seeks"] += 1
+                self.position = index
+            else:
+                while self.position < index:
+                    if not self.cap.grab():
+                        return None
+                    self.stats["grabs"] += 1
+                    self.position += 1
+
+        ret, frame = self.cap.read()
+        self.stats["reads"] += 1
+        self.position = index + 1
+        return frame if ret else None
+
+    def get(self, index):
+        """Return a single frame, or None if it can't be read"""
+        frame = self._cache.get(index)
+        if frame is not None:
+            self._cache.move_to_end(index)
+            self.stats["cache_hits"] += 1
+            return frame
+
+        frame = self._decode(index)
+        if frame is None:
+            print(f"[ERROR] Could not read frame {index}")
+            return None
+        self._remember(index, frame)
+        return frame
+
+    def iter_frames(self, indices):
+        """Yield (index, frame) for the wanted indices in ascending order"""
+        for index in sorted(set(i for i in indices if i >= 0)):
+            if self.frame_count and index >= self.frame_count:
+                continue
+            frame = self.get(index)
+            if frame is not None:
+                yield index, frame
+
+    def read(self, indices):
+        """Read the wanted indices and return them as a {index: frame} dict"""
+        return dict(self.iter_frames(indices))
@@ -0,0 +1,249 @@
+"""Streaming ingestion: start decoding an upload before it has finished arriving.
+
+receive_upload() parses the multipart body straight off the request stream.
+It saves the video part to disk as it arrives and can tee every chunk into a
+StreamDecoder, an ffmpeg process that decodes its stdin into raw BGR frames
+for the processing pipeline running in another thread. Time-to-result then
+approaches max(upload, processing) instead of their sum.
+
+Not every upload can be decoded from a pipe: an MP4 whose moov atom sits at
+the end (the default for many phone recorders) needs seeking. Then the
+decoder reports no video stream and the caller falls back to processing the
+saved copy once the upload is complete. Fragmented MP4, faststart MP4, MOV
+and WebM stream fine.
+"""
+import os
+import re
+import subprocess
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from werkzeug.utils import secure_filename
+
+CHUNK_SIZE = 256 * 1024
+# Form fields are small; anything bigger is refused by the multipart decoder
+MAX_FIELD_BYTES = 1024 * 1024
+# Seconds to wait for ffmpeg to identify the video stream
+STREAM_INFO_TIMEOUT = 60.0
+# Frame count estimate (in seconds of video) when the container declares no duration
+DEFAULT_STREAM_SECONDS = 60
+DEFAULT_FPS = 30.0
+
+_DURATION_RE = re.compile(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)')
+_FPS_RE = re.compile(r'(\d+(?:\.\d+)?) fps')
+_SIZE_RE = re.compile(r', (\d{2,5})x(\d{2,5})')
+
+
+class StreamDecodeError(RuntimeError):
+    """ffmpeg could not decode the upload as it arrived"""
+
+
+def iter_multipart(stream, boundary, chunk_size=CHUNK_SIZE):
+    """Yield (name, filename, chunks) for each part of a multipart body as it arrives
+
+    filename is None for plain form fields. chunks yields the part's data and
+    must be consumed before asking for the next part; whatever is left of it
+    is skipped.
+    """
+    decoder = MultipartDecoder(boundary, max_form_memory_size=MAX_FIELD_BYTES)
+
+    def next_event():
+        while True:
+            event = decoder.next_event()
+            if not isinstance(event, NeedData):
+                return event
+            chunk = stream.read(chunk_size)
+            decoder.receive_data(chunk if chunk else None)
+
+    while True:
+        event = next_event()
+        if isinstance(event, Epilogue):
+            return
+        if not isinstance(event, (Field, File)):
+            continue
+
+        finished = []
+
+        def chunks():
+            while not finished:
+                data = next_event()
+                if not isinstance(data, Data):
+                    raise ValueError("Malformed multipart body")
+                if not data.more_data:
+                    finished.append(True)
+                if data.data:
+                    yield data.data
+
+        part = chunks()
+        yield event.name, event.filename if isinstance(event, File) else None, part
+        for _ in part:
+            pass
+
+
+def receive_upload(stream, content_type, upload_dir, file_field='video', on_file=None,
+                   digest=None, chunk_size=CHUNK_SIZE):
+    """Parse a multipart upload off the request stream, saving the file part as it arrives
+
+    on_file(fields, filename) is called when the file part starts, with the
+    form fields received before it. It may return a sink whose feed(chunk)
+    also receives every chunk of the file; feed returning False stops that.
+    digest, a hashlib object, is updated with the file's bytes if given.
+    Returns (fields, file_path, filename), file_path being None if the upload
+    had no file part. Raises ValueError for a malformed body.
+    """
+    mimetype, options = parse_options_header(content_type or '')
+    boundary = options.get('boundary')
+    if mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError("Expected a multipart/form-data upload")
+
+    fields = {}
+    file_path = filename = None
+    for name, part_filename, chunks in iter_multipart(stream, boundary.encode(), chunk_size):
+        if part_filename is None:
+            fields[name] = b''.join(chunks).decode('utf-8', 'replace')
+        elif name == file_field and file_path is None:
+            filename = part_filename
+            file_path = os.path.join(upload_dir, secure_filename(part_filename) or 'upload')
+            sink = on_file(dict(fields), part_filename) if on_file else None
+            with open(file_path, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    if digest is not None:
+                        digest.update(chunk)
+                    if sink is not None and not sink.feed(chunk):
+                        sink = None
+    return fields, file_path, filename
+
+
+class StreamDecoder:
+    """ffmpeg decoding a video fed through stdin into raw BGR frames"""
+
+    def __init__(self):
+        self.info = None
+        self.returncode = None
+        self._info_ready = threading.Event()
+        self._log = deque(maxlen=40)
+        self._fed = True
+        self.process = subprocess.Popen(
+            ['ffmpeg', '-hide_banner', '-nostdin', '-nostats', '-i', 'pipe:0',
+             '-map', '0:v:0', '-vsync', 'passthrough',
+             '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        # stderr is drained continuously so ffmpeg never blocks on its log
+        self._stderr_thread = threading.Thread(target=self._read_log, daemon=True)
+        self._stderr_thread.start()
+
+    def _read_log(self):
+        duration = fps = None
+        in_output = False
+        for raw in iter(self.process.stderr.readline, b''):
+            line = raw.decode(errors='ignore').rstrip()
+            self._log.append(line)
+            match = _DURATION_RE.search(line)
+            if match and duration is None:
+                hours, minutes, seconds = match.groups()
+                duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+            if 'Video:' in line and not in_output and fps is None:
+                match = _FPS_RE.search(line)
+                fps = float(match.group(1)) if match else None
+            if line.startswith('Output #0'):
+                in_output = True
+            if in_output and 'Video: rawvideo' in line and self.info is None:
+                # The output stream has the real frame size (after any autorotation)
+                match = _SIZE_RE.search(line)
+                if match:
+                    width, height = int(match.group(1)), int(match.group(2))
+                    fps = fps or DEFAULT_FPS
+                    seconds = duration if duration else DEFAULT_STREAM_SECONDS
+                    self.info = {
+                        "width": width,
+                        "height": height,
+                        "fps": fps,
+                        "frame_count": max(int(round(seconds * fps)), 1),
+                        "frame_count_estimated": True,
+                    }
+                    self._info_ready.set()
+        self._info_ready.set()
+
+    def wait_info(self, timeout=STREAM_INFO_TIMEOUT):
+        """Wait until ffmpeg has identified the video stream; None if it couldn't"""
+        self._info_ready.wait(timeout)
+        return self.info
+
+    def feed(self, chunk):
+        """Pass upload bytes to ffmpeg; returns False once it stopped accepting them"""
+        if not self._fed:
+            return False
+        try:
+            self.process.stdin.write(chunk)
+        except (BrokenPipeError, OSError, ValueError):
+            self._fed = False
+        return self._fed
+
+    def finish_input(self):
+        """Signal the end of the upload"""
+        self._fed = False
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+    def frames(self):
+        """Yield (index, frame) pairs; raises StreamDecodeError if ffmpeg fails part-way"""
+        if self.info is None:
+            raise StreamDecodeError("Video stream was not identified")
+        width, height = self.info["width"], self.info["height"]
+        frame_size = width * height * 3
+        index = 0
+        while True:
+            buffer = bytearray(frame_size)
+            view = memoryview(buffer)
+            filled = 0
+            while filled < frame_size:
+                n = self.process.stdout.readinto(view[filled:])
+                if not n:
+                    break
+                filled += n
+            if filled < frame_size:
+                break
+            yield index, np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+            index += 1
+
+        self.returncode = self.process.wait()
+        self._stderr_thread.join()
+        if self.returncode != 0 or index == 0:
+            raise StreamDecodeError(f"ffmpeg could not decode the upload: {self.log}")
+
+    @property
+    def log(self):
+        return '\n'.join(self._log)[-2000:]
+
+    def close(self):
+        """Stop ffmpeg if it's still running"""
+        self.finish_input()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.returncode = self.process.wait()
+        self.process.stdout.close()
+        self._stderr_thread.join()
+        self.process.stderr.close()
+
+
+def run_in_thread(func, *args):
+    """Run func(*args) on a new thread and return a Future for its result"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True, name='stego-ingest').start()
+    return future
@@ -0,0 +1,167 @@
+"""Background jobs for the heavy encrypt/decrypt pipelines.
+
+Submitting a job returns immediately with an id; a process-wide worker pool
+runs the pipeline and reports per-stage progress (frames done / total). Job
+state is mirrored to <root>/<job_id>.json so that any worker process of a
+multi-process server can answer status polls, and finished jobs are removed
+once their TTL has passed.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Progress is written to disk at most this often (seconds) while a stage runs
+PERSIST_INTERVAL = 0.5
+
+
+class Job:
+    def __init__(self, manager, kind, job_id=None):
+        self.manager = manager
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.stage = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.updated = self.created
+        self._last_persist = 0.0
+        self._lock = threading.Lock()
+
+    def report(self, stage, done, total=None):
+        """Record progress for a stage; cheap enough to call once per frame"""
+        with self._lock:
+            self.stage = stage
+            entry = self.progress.setdefault(stage, {"done": 0, "total": total})
+            entry["done"] = done
+            if total is not None:
+                entry["total"] = total
+            self.updated = time.time()
+            due = self.updated - self._last_persist >= PERSIST_INTERVAL
+        if due:
+            self.persist()
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": {k: dict(v) for k, v in self.progress.items()},
+                "result": self.result,
+                "error": self.error,
+                "created": self.created,
+                "updated": self.updated,
+                "expires": self.updated + self.manager.ttl_seconds if self.status in ('done', 'failed') else None,
+            }
+
+    def persist(self):
+        self._last_persist = time.time()
+        self.manager._write(self.id, self.to_dict())
+
+
+class JobManager:
+    def __init__(self, root, workers=2, ttl_seconds=3600):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stego-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, job_id):
+        try:
+            job_id = uuid.UUID(job_id).hex
+        except (ValueError, TypeError, AttributeError):
+            return None
+        return os.path.join(self.root, f"{job_id}.json")
+
+    def _write(self, job_id, record):
+        path = self._path(job_id)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
+
+    def submit(self, kind, func, *args, cleanup=None):
+        """Queue func(job, *args) and return the job; its return value becomes job.result
+
+        cleanup, if given, runs after the job finishes whether or not it failed.
+        """
+        self.purge_expired()
+        job = Job(self, kind)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.persist()
+        self._executor.submit(self._run, job, func, args, cleanup)
+        return job
+
+    def _run(self, job, func, args, cleanup):
+        job.status = 'running'
+        job.persist()
+        try:
+            job.result = func(job, *args)
+            job.status = 'done'
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            job.updated = time.time()
+            job.persist()
+            if cleanup is not None:
+                try:
+                    cleanup()
+                except Exception as cleanup_error:
+                    print(f"Error cleaning up job {job.id}: {cleanup_error}")
+
+    def get(self, job_id):
+        """Return the job's state as a dict, or None if unknown or expired"""
+        path = self._path(job_id)
+        if path is None:
+            return None
+        with self._lock:
+            job = self._jobs.get(uuid.UUID(job_id).hex)
+        if job is not None:
+            record = job.to_dict()
+        else:
+            # Submitted by another worker process; read its mirrored state
+            try:
+                with open(path) as f:
+                    record = json.load(f)
+            except (OSError, ValueError):
+                return None
+
+        if record["expires"] is not None and record["expires"] < time.time():
+            self._forget(record["job_id"])
+            return None
+        return record
+
+    def _forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        try:
+            os.remove(self._path(job_id))
+        except OSError:
+            pass
+
+    def purge_expired(self):
+        """Drop finished jobs whose TTL has passed"""
+        now = time.time()
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.root, name)) as f:
+                    expires = json.load(f).get("expires")
+            except (OSError, ValueError):
+                continue
+            if expires is not None and expires < now:
+                self._forget(name[:-len('.json')])
@@ -0,0 +1,210 @@
+"""Process-wide RSA key handling and hybrid envelope encryption.
+
+KeyManager parses the PEM files in the keys folder once and only reloads them
+when their modification time changes, instead of re-reading and re-parsing
+the private key on every request.
+
+Raw RSA-OAEP (SHA-256, 2048-bit) caps the plaintext at 190 bytes, so longer
+messages are sealed in an envelope: a random AES-256-GCM key encrypts the
+(optionally zlib-compressed) message and only that key goes through RSA.
+Envelope layout, before base64:
+
+    b"SE1" | flags (1 byte, bit 0 = zlib) | RSA-wrapped key | nonce (12) | ciphertext + tag
+
+The first four bytes are authenticated as associated data.
+
+Integrity tags (tag / check_tag) are HMAC-SHA256 under a key derived from
+the private key with HKDF, so they rotate with the key pair and need no key
+file of their own.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+import zlib
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding as rsa_padding
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+ENVELOPE_MAGIC = b"SE1"
+FLAG_ZLIB = 0x01
+NONCE_SIZE = 12
+MAC_KEY_INFO = b"stego-integrity-tag-v1"
+# Truncated HMAC-SHA256 length: 80 bits keeps forgery out of reach and still
+# fits in the data border next to the payload
+TAG_SIZE = 10
+
+# How often (seconds) the key files are stat()ed to notice a rotation
+RELOAD_CHECK_INTERVAL = 2.0
+
+
+def oaep():
+    return rsa_padding.OAEP(
+        mgf=rsa_padding.MGF1(algorithm=hashes.SHA256()),
+        algorithm=hashes.SHA256(),
+        label=None
+    )
+
+
+def max_oaep_plaintext(key_size):
+    """Largest message raw RSA-OAEP with SHA-256 can encrypt for a key size"""
+    return key_size // 8 - 2 * hashes.SHA256.digest_size - 2
+
+
+def generate_key_pair(keys_folder, key_size=2048):
+    """Generate an RSA key pair in keys_folder if it doesn't exist yet"""
+    private_keys_path = os.path.join(keys_folder, f'private_key_{key_size}.pem')
+    public_keys_path = os.path.join(keys_folder, f'public_key_{key_size}.pem')
+
+    if os.path.isfile(private_keys_path) and os.path.isfile(public_keys_path):
+        return False
+
+    private_key = rsa.generate_private_key(
+        public_exponent=65537,
+        key_size=key_size,
+    )
+
+    private_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+    public_pem = private_key.public_key().public_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo
+    )
+
+    with open(private_keys_path, "wb") as file_obj:
+        file_obj.write(private_pem)
+    with open(public_keys_path, "wb") as file_obj:
+        file_obj.write(public_pem)
+
+    print(f"Public and Private keys created with size {key_size}")
+    return True
+
+
+class KeyManager:
+    """Loads the RSA key pair once and hot-reloads it when the files change"""
+
+    def __init__(self, keys_folder, key_size=2048, check_interval=RELOAD_CHECK_INTERVAL):
+        self.keys_folder = keys_folder
+        self.key_size = key_size
+        self.check_interval = check_interval
+        self.private_key_path = os.path.join(keys_folder, f'private_key_{key_size}.pem')
+        self.public_key_path = os.path.join(keys_folder, f'public_key_{key_size}.pem')
+        self._lock = threading.Lock()
+        self._private_key = None
+        self._public_key = None
+        self._mac_key = None
+        self._fingerprint = None
+        self._mtimes = None
+        self._last_check = 0.0
+
+    def _current_mtimes(self):
+        try:
+            return (os.stat(self.private_key_path).st_mtime_ns, os.stat(self.public_key_path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def _load(self):
+        """(Re)load both keys if missing or changed on disk; caller holds the lock"""
+        mtimes = self._current_mtimes()
+        if mtimes is None:
+            generate_key_pair(self.keys_folder, self.key_size)
+            mtimes = self._current_mtimes()
+
+        if mtimes != self._mtimes or self._private_key is None:
+            with open(self.private_key_path, 'rb') as key_file:
+                self._private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+            with open(self.public_key_path, 'rb') as key_file:
+                self._public_key = serialization.load_pem_public_key(key_file.read())
+            private_der = self._private_key.private_bytes(
+                encoding=serialization.Encoding.DER,
+                format=serialization.PrivateFormat.PKCS8,
+                encryption_algorithm=serialization.NoEncryption()
+            )
+            self._mac_key = HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                                 info=MAC_KEY_INFO).derive(private_der)
+            self._fingerprint = hashlib.sha256(self._public_key.public_bytes(
+                encoding=serialization.Encoding.DER,
+                format=serialization.PublicFormat.SubjectPublicKeyInfo
+            )).hexdigest()
+            if self._mtimes is not None:
+                print(f"[INFO] Reloaded RSA keys from {self.keys_folder}")
+            self._mtimes = mtimes
+        self._last_check = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._private_key is not None and time.monotonic() - self._last_check < self.check_interval:
+            return
+        with self._lock:
+            if self._private_key is None or time.monotonic() - self._last_check >= self.check_interval:
+                self._load()
+
+    @property
+    def public_key(self):
+        self._ensure_fresh()
+        return self._public_key
+
+    @property
+    def private_key(self):
+        self._ensure_fresh()
+        return self._private_key
+
+    def fingerprint(self):
+        """SHA-256 hex digest of the current public key (DER)"""
+        self._ensure_fresh()
+        return self._fingerprint
+
+    def tag(self, message_bytes):
+        """Integrity tag (truncated HMAC-SHA256) over a message"""
+        self._ensure_fresh()
+        return hmac.new(self._mac_key, message_bytes, hashlib.sha256).digest()[:TAG_SIZE]
+
+    def check_tag(self, message_bytes, tag):
+        """Whether tag was made by tag() for this message under the current keys"""
+        return len(tag) == TAG_SIZE and hmac.compare_digest(self.tag(message_bytes), tag)
+
+    def encrypt(self, message_bytes):
+        """Raw RSA-OAEP encryption"""
+        return self.public_key.encrypt(message_bytes, oaep())
+
+    def decrypt(self, cipher_text):
+        """Raw RSA-OAEP decryption"""
+        return self.private_key.decrypt(cipher_text, oaep())
+
+    def seal(self, message_bytes, compress=True):
+        """Encrypt a message of any length into an RSA-wrapped AES-GCM envelope"""
+        flags = 0
+        if compress:
+            compressed = zlib.compress(message_bytes, 9)
+            if len(compressed) < len(message_bytes):
+                message_bytes = compressed
+                flags |= FLAG_ZLIB
+
+        header = ENVELOPE_MAGIC + bytes([flags])
+        data_key = AESGCM.generate_key(bit_length=256)
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = AESGCM(data_key).encrypt(nonce, message_bytes, header)
+        return header + self.encrypt(data_key) + nonce + ciphertext
+
+    def is_envelope(self, blob):
+        return blob.startswith(ENVELOPE_MAGIC) and len(blob) > self.key_size // 8 + 4 + NONCE_SIZE
+
+    def open(self, blob):
+        """Decrypt an envelope produced by seal()"""
+        if not self.is_envelope(blob):
+            raise ValueError("Not an encrypted envelope")
+        header, rest = blob[:4], blob[4:]
+        key_bytes = self.key_size // 8
+        wrapped_key, nonce, ciphertext = rest[:key_bytes], rest[key_bytes:key_bytes + NONCE_SIZE], rest[key_bytes + NONCE_SIZE:]
+
+        data_key = self.decrypt(wrapped_key)
+        message_bytes = AESGCM(data_key).decrypt(nonce, ciphertext, header)
+        if header[3] & FLAG_ZLIB:
+            message_bytes = zlib.decompress(message_bytes)
+        return message_bytes
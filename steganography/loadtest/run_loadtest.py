@@ -0,0 +1,558 @@
+"""Concurrent load test for the steganography server.
+
+Starts the server locally (wsgi.py, or --server-cmd for e.g. gunicorn) unless
+--url points at one that is already running. Closed-loop clients then upload
+the way the frontend's BackendService does: /encrypt?response=binary with the
+text field ahead of the video, and /decrypt and /verify with just the video.
+The number of clients follows a ramp profile and each request picks its
+endpoint from a weighted mix. The JSON report has per-endpoint latency
+percentiles, throughput and status counts for every profile stage and for the
+whole run, plus the server's RSS and ./tmp disk high-water marks sampled
+throughout.
+
+    python loadtest/run_loadtest.py --profile 1:10,4:30,8:30 --mix encrypt=1,decrypt=3
+    python loadtest/run_loadtest.py --profile 0-16:120 --server-env STEGO_ENCRYPT_CONCURRENCY=4
+    python loadtest/run_loadtest.py --server-cmd "gunicorn -w 4 --threads 4 -b 127.0.0.1:{port} --timeout 600 wsgi:app"
+    python loadtest/run_loadtest.py --url http://127.0.0.1:5000 --output run.json --baseline baseline.json
+
+A profile stage "N:S" holds N clients for S seconds and "A-B:S" ramps linearly
+from A to B clients over S seconds. Decrypt and verify uploads get a unique
+trailing MP4 "free" box each, so they miss the server's decrypt cache unless
+--cache-hits is given. The exit status is 1 when p95 latency, throughput or
+peak RSS regressed against the baseline by more than the tolerance, or the
+error rate went over --max-error-rate.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import shlex
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(LOADTEST_DIR)
+sys.path.insert(0, os.path.join(SERVER_DIR, 'benchmarks'))
+
+from run_benchmarks import PAYLOAD_TEXT, tree_size  # noqa: E402
+
+ENDPOINTS = ('encrypt', 'decrypt', 'verify')
+# Statuses that are a normal answer; /decrypt says 404 when nothing is hidden
+OK_STATUSES = {'encrypt': {200}, 'decrypt': {200, 404}, 'verify': {200}}
+SERVER_START_TIMEOUT = 120
+
+
+def parse_profile(text):
+    """Parse "N:S" / "A-B:S" stages into dicts"""
+    stages = []
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        clients, sep, seconds = part.partition(':')
+        start, _, end = clients.partition('-')
+        if not sep or not start.strip().isdigit() or (end and not end.strip().isdigit()):
+            raise SystemExit(f"Bad profile stage {part!r}; expected N:SECONDS or A-B:SECONDS")
+        stages.append({"start": int(start), "end": int(end or start), "seconds": float(seconds)})
+    if not stages:
+        raise SystemExit("The profile has no stages")
+    return stages
+
+
+def parse_mix(text):
+    """Parse "encrypt=1,decrypt=3" into {endpoint: weight}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r} in mix; choose from {', '.join(ENDPOINTS)}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise SystemExit("The mix has no weight")
+    return mix
+
+
+def profile_clients(stages, elapsed):
+    """(stage index, client count) at elapsed seconds into the profile, or None once it is over"""
+    for index, stage in enumerate(stages):
+        if elapsed < stage["seconds"]:
+            fraction = elapsed / stage["seconds"]
+            return index, int(round(stage["start"] + (stage["end"] - stage["start"]) * fraction))
+        elapsed -= stage["seconds"]
+    return None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(int(-(-fraction * len(sorted_values) // 1)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+# Uploads
+
+def multipart_body(parts):
+    """Encode (name, value) or (name, filename, bytes, content_type) parts in order"""
+    boundary = f"----stegoload{uuid.uuid4().hex}"
+    chunks = []
+    for part in parts:
+        chunks.append(f"--{boundary}\r\n".encode())
+        if len(part) == 2:
+            name, value = part
+            chunks.append(f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode())
+            chunks.append(value.encode('utf-8'))
+        else:
+            name, filename, data, content_type = part
+            chunks.append(f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                          f'Content-Type: {content_type}\r\n\r\n'.encode())
+            chunks.append(data)
+        chunks.append(b"\r\n")
+    chunks.append(f"--{boundary}--\r\n".encode())
+    return b''.join(chunks), f"multipart/form-data; boundary={boundary}"
+
+
+def unique_mp4(data, nonce):
+    """The same MP4 with a trailing "free" box, so its content hash differs"""
+    filler = nonce.encode('ascii')
+    return data + struct.pack('>I', 8 + len(filler)) + b'free' + filler
+
+
+def build_request(endpoint, clip, encoded, cache_hits):
+    """(path, body, content type) shaped like the frontend's upload for an endpoint"""
+    if endpoint == 'encrypt':
+        # BackendService.encryptVideo sends the text first so the server can stream
+        parts = [("text", PAYLOAD_TEXT), ("video", "recording.mp4", clip, "video/mp4")]
+        path = '/encrypt?response=binary'
+    else:
+        video = encoded if cache_hits else unique_mp4(encoded, uuid.uuid4().hex)
+        parts = [("video", "proof.mp4", video, "video/mp4")]
+        path = f'/{endpoint}'
+    body, content_type = multipart_body(parts)
+    return path, body, content_type
+
+
+def send(base_url, path, body, content_type, timeout):
+    """POST body and read the whole response; returns (status, response bytes)"""
+    url = urlsplit(base_url)
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        connection.request('POST', url.path.rstrip('/') + path, body=body,
+                           headers={'Content-Type': content_type, 'Content-Length': str(len(body))})
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+
+# Server process and its resources
+
+def free_port():
+    import socket
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_healthy(base_url, timeout=SERVER_START_TIMEOUT, process=None):
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise SystemExit(f"The server exited with status {process.returncode} while starting")
+        try:
+            connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=2)
+            connection.request('GET', url.path.rstrip('/') + '/health')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.25)
+    raise SystemExit(f"The server at {base_url} didn't become healthy within {timeout:g}s")
+
+
+def start_server(command, port, env_overrides, log_path):
+    env = dict(os.environ, STEGO_HOST='127.0.0.1', STEGO_PORT=str(port))
+    env.update(env_overrides)
+    argv = shlex.split(command.format(port=port)) if command else [sys.executable, 'wsgi.py']
+    log = open(log_path, 'ab')
+    try:
+        return subprocess.Popen(argv, cwd=SERVER_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    finally:
+        log.close()
+
+
+def process_tree(pid):
+    """pid and all its descendants (WSGI workers, ffmpeg processes)"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, todo = [], [pid]
+    while todo:
+        current = todo.pop()
+        tree.append(current)
+        todo += children.get(current, [])
+    return tree
+
+
+def process_rss(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+def tree_rss(pid):
+    if pid is None or not os.path.isdir('/proc'):
+        return None
+    return sum(process_rss(p) for p in process_tree(pid))
+
+
+# The run
+
+class LoadRun:
+    """Closed-loop clients following a profile, with a resource sampler alongside"""
+
+    def __init__(self, args, stages, mix, clip, encoded, server_pid):
+        self.args = args
+        self.stages = stages
+        self.mix = mix
+        self.clip = clip
+        self.encoded = encoded
+        self.server_pid = server_pid
+        self.max_clients = max(max(s["start"], s["end"]) for s in stages)
+        self.state = {"stage": 0, "clients": 0}
+        self.records = []
+        self.timeline = []
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def client(self, index):
+        rng = random.Random(self.args.seed * 1000 + index)
+        names = [name for name in self.mix if self.mix[name] > 0]
+        weights = [self.mix[name] for name in names]
+        while not self._stop.is_set():
+            if index >= self.state["clients"]:
+                self._stop.wait(0.05)
+                continue
+            endpoint = rng.choices(names, weights)[0]
+            path, body, content_type = build_request(endpoint, self.clip, self.encoded, self.args.cache_hits)
+            record = {"endpoint": endpoint, "stage": self.state["stage"], "client": index,
+                      "bytes_out": len(body), "start": time.monotonic() - self.started}
+            with self._lock:
+                self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                status, data = send(self.args.url, path, body, content_type, self.args.timeout)
+                record.update(status=status, bytes_in=len(data))
+            except (OSError, http.client.HTTPException) as e:
+                record.update(status=None, error=f"{type(e).__name__}: {e}")
+            record["seconds"] = time.perf_counter() - start
+            record["ok"] = record["status"] in OK_STATUSES[endpoint]
+            with self._lock:
+                self.in_flight -= 1
+                self.records.append(record)
+            if self.args.think > 0:
+                self._stop.wait(self.args.think)
+
+    def sample(self):
+        disk = tree_size(self.args.tmp_dir) if self.args.tmp_dir else None
+        with self._lock:
+            point = {
+                "t": round(time.monotonic() - self.started, 2),
+                "stage": self.state["stage"],
+                "clients": self.state["clients"],
+                "in_flight": self.in_flight,
+                "completed": len(self.records),
+                "rss_bytes": tree_rss(self.server_pid),
+                "tmp_bytes": disk,
+            }
+        self.timeline.append(point)
+        return point
+
+    def sampler(self):
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.args.sample_interval)
+
+    def run(self):
+        self.started = time.monotonic()
+        self.sample()
+        threads = [threading.Thread(target=self.client, args=(i,), daemon=True, name=f'load-client-{i}')
+                   for i in range(self.max_clients)]
+        threads.append(threading.Thread(target=self.sampler, daemon=True, name='load-sampler'))
+        for thread in threads:
+            thread.start()
+
+        last_stage = None
+        while True:
+            position = profile_clients(self.stages, time.monotonic() - self.started)
+            if position is None:
+                break
+            self.state["stage"], self.state["clients"] = position
+            if position[0] != last_stage:
+                last_stage = position[0]
+                stage = self.stages[last_stage]
+                print(f"[LOAD] Stage {last_stage}: {stage['start']}-{stage['end']} clients "
+                      f"for {stage['seconds']:g}s", file=sys.stderr)
+            time.sleep(0.05)
+
+        # Let the requests in flight finish; they count towards the last stage
+        self.state["clients"] = 0
+        self.run_seconds = time.monotonic() - self.started
+        deadline = time.monotonic() + self.args.timeout
+        while self.in_flight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        for thread in threads:
+            thread.join(timeout=1)
+        self.sample()
+
+
+def summarize(records, seconds):
+    """Per-endpoint latency, throughput and status counts of a set of records"""
+    summary = {}
+    for endpoint in ENDPOINTS:
+        mine = [r for r in records if r["endpoint"] == endpoint]
+        if not mine:
+            continue
+        ok = sorted(r["seconds"] for r in mine if r["ok"])
+        statuses = {}
+        for r in mine:
+            key = str(r["status"]) if r["status"] is not None else "connection_error"
+            statuses[key] = statuses.get(key, 0) + 1
+        summary[endpoint] = {
+            "requests": len(mine),
+            "ok": len(ok),
+            "error_rate": round(1 - len(ok) / len(mine), 4),
+            "statuses": statuses,
+            "throughput_rps": round(len(ok) / seconds, 3) if seconds > 0 else None,
+            "latency_seconds": {
+                "p50": percentile(ok, 0.50),
+                "p95": percentile(ok, 0.95),
+                "p99": percentile(ok, 0.99),
+                "mean": round(sum(ok) / len(ok), 4) if ok else None,
+                "max": ok[-1] if ok else None,
+            },
+            "upload_mb": round(sum(r["bytes_out"] for r in mine) / 2 ** 20, 2),
+        }
+        for key, value in summary[endpoint]["latency_seconds"].items():
+            if value is not None:
+                summary[endpoint]["latency_seconds"][key] = round(value, 4)
+    return summary
+
+
+def resource_summary(timeline):
+    rss = [p["rss_bytes"] for p in timeline if p["rss_bytes"] is not None]
+    disk = [p["tmp_bytes"] for p in timeline if p["tmp_bytes"] is not None]
+    mb = lambda value: round(value / 2 ** 20, 1)
+    result = {}
+    if rss:
+        result.update(start_rss_mb=mb(rss[0]), peak_rss_mb=mb(max(rss)), end_rss_mb=mb(rss[-1]),
+                      rss_growth_mb=mb(rss[-1] - rss[0]))
+    if disk:
+        result.update(peak_tmp_bytes=max(disk), end_tmp_bytes=disk[-1])
+    return result
+
+
+def compare(report, baseline, tolerance):
+    """Return the regressions of a report against a baseline report"""
+    regressions = []
+    before_endpoints = baseline.get("overall", {}).get("endpoints", {})
+    for endpoint, result in report["overall"]["endpoints"].items():
+        before = before_endpoints.get(endpoint)
+        if not before:
+            continue
+        p95, before_p95 = result["latency_seconds"]["p95"], before["latency_seconds"]["p95"]
+        if p95 and before_p95 and p95 > before_p95 * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {before_p95}s -> {p95}s ({p95 / before_p95 - 1:+.0%})")
+        rps, before_rps = result["throughput_rps"], before["throughput_rps"]
+        if before_rps and rps is not None and rps < before_rps * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {before_rps} -> {rps} req/s ({rps / before_rps - 1:+.0%})")
+    peak, before_peak = report["server"].get("peak_rss_mb"), baseline.get("server", {}).get("peak_rss_mb")
+    if peak and before_peak and peak > before_peak * (1 + tolerance):
+        regressions.append(f"server: peak RSS {before_peak} -> {peak} MB")
+    return regressions
+
+
+def load_clip(args):
+    if args.video:
+        with open(args.video, 'rb') as f:
+            return f.read(), os.path.basename(args.video)
+    from synthetic import get_clip
+    path = get_clip(os.path.abspath(args.cache_dir), args.resolution, args.duration)
+    with open(path, 'rb') as f:
+        return f.read(), os.path.basename(path)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--profile', default='1:10,4:30',
+                        help='comma-separated stages, N:SECONDS or A-B:SECONDS (default: %(default)s)')
+    parser.add_argument('--mix', default='encrypt=1,decrypt=2,verify=2',
+                        help='endpoint weights (default: %(default)s)')
+    parser.add_argument('--url', help='load an already running server instead of starting one')
+    parser.add_argument('--server-cmd', help='command starting the server, {port} is substituted '
+                                             '(default: python wsgi.py)')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='environment for the started server, e.g. STEGO_ENCRYPT_CONCURRENCY=4')
+    parser.add_argument('--server-pid', type=int, help='sample the RSS of this process tree (with --url)')
+    parser.add_argument('--tmp-dir', default=os.path.join(SERVER_DIR, 'tmp'),
+                        help="the server's temp folder, for the disk high-water mark")
+    parser.add_argument('--video', help='upload this clip instead of a synthetic one')
+    parser.add_argument('--resolution', default='720p', help='synthetic clip resolution')
+    parser.add_argument('--duration', type=float, default=2, help='synthetic clip length in seconds')
+    parser.add_argument('--cache-dir', default=os.path.join(SERVER_DIR, 'benchmarks', '.clips'),
+                        help='where generated clips are kept between runs')
+    parser.add_argument('--cache-hits', action='store_true',
+                        help='upload identical decrypt/verify bodies so they hit the decrypt cache')
+    parser.add_argument('--think', type=float, default=0.0, help='seconds each client waits between requests')
+    parser.add_argument('--timeout', type=float, default=600.0, help='per-request timeout in seconds')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='resource sampling period')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here (default: stdout)')
+    parser.add_argument('--baseline', help='JSON report of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative change before p95, throughput or RSS counts as a regression')
+    parser.add_argument('--max-error-rate', type=float,
+                        help='fail the run when more than this share of requests went wrong')
+    parser.add_argument('--include-records', action='store_true', help='add every request to the report')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stages = parse_profile(args.profile)
+    mix = parse_mix(args.mix)
+    server_env = dict(item.split('=', 1) for item in args.server_env)
+    output = os.path.abspath(args.output) if args.output else None
+
+    clip, clip_name = load_clip(args)
+    process = None
+    server_pid = args.server_pid
+    if args.url is None:
+        port = free_port()
+        args.url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(LOADTEST_DIR, 'server.log')
+        process = start_server(args.server_cmd, port, server_env, log_path)
+        server_pid = process.pid
+        print(f"[LOAD] Started the server at {args.url} (pid {process.pid}, log {log_path})", file=sys.stderr)
+    try:
+        wait_healthy(args.url, process=process)
+
+        # One encrypt up front gives the proof video the decrypt and verify clients upload
+        path, body, content_type = build_request('encrypt', clip, None, False)
+        start = time.perf_counter()
+        status, encoded = send(args.url, path, body, content_type, args.timeout)
+        warmup = {"endpoint": "encrypt", "status": status, "seconds": round(time.perf_counter() - start, 4)}
+        if status != 200:
+            raise SystemExit(f"Warm-up /encrypt returned {status}: {encoded[:200]!r}")
+        print(f"[LOAD] Warm-up encrypt took {warmup['seconds']}s; running {args.profile} "
+              f"with mix {args.mix}", file=sys.stderr)
+
+        run = LoadRun(args, stages, mix, clip, encoded, server_pid)
+        run.run()
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    stage_reports = []
+    for index, stage in enumerate(stages):
+        records = [r for r in run.records if r["stage"] == index]
+        stage_reports.append(dict(stage, endpoints=summarize(records, stage["seconds"])))
+    errors = [r for r in run.records if not r["ok"]]
+    report = {
+        "created": time.time(),
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {
+            "url": args.url,
+            "server_cmd": args.server_cmd if process is not None else None,
+            "server_env": server_env,
+            "profile": stages,
+            "mix": mix,
+            "clip": clip_name,
+            "clip_bytes": len(clip),
+            "cache_hits": args.cache_hits,
+            "think_seconds": args.think,
+            "seed": args.seed,
+        },
+        "warmup": warmup,
+        "stages": stage_reports,
+        "overall": {
+            "seconds": round(run.run_seconds, 2),
+            "requests": len(run.records),
+            "error_rate": round(len(errors) / len(run.records), 4) if run.records else None,
+            "endpoints": summarize(run.records, run.run_seconds),
+        },
+        "server": resource_summary(run.timeline),
+        "timeline": run.timeline,
+    }
+    if errors:
+        report["sample_errors"] = [{k: r.get(k) for k in ("endpoint", "status", "error", "start")}
+                                   for r in errors[:20]]
+    if args.include_records:
+        report["records"] = run.records
+
+    for endpoint, result in report["overall"]["endpoints"].items():
+        latency = result["latency_seconds"]
+        print(f"[LOAD]   {endpoint:<8} {result['requests']:>6} req {result['throughput_rps'] or 0:>8.2f} req/s "
+              f"p50 {latency['p50'] or 0:.3f}s p95 {latency['p95'] or 0:.3f}s p99 {latency['p99'] or 0:.3f}s "
+              f"errors {result['error_rate']:.1%}", file=sys.stderr)
+    server = report["server"]
+    if server:
+        print(f"[LOAD]   server peak RSS {server.get('peak_rss_mb')} MB (growth {server.get('rss_growth_mb')} MB), "
+              f"peak tmp {server.get('peak_tmp_bytes', 0) / 2 ** 20:.1f} MB", file=sys.stderr)
+
+    failures = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = compare(report, json.load(f), args.tolerance)
+        report["baseline"] = os.path.abspath(args.baseline)
+        report["tolerance"] = args.tolerance
+        report["regressions"] = failures
+    error_rate = report["overall"]["error_rate"]
+    if args.max_error_rate is not None and error_rate is not None and error_rate > args.max_error_rate:
+        failures.append(f"error rate {error_rate:.1%} over {args.max_error_rate:.1%}")
+    for line in failures:
+        print(f"[REGRESSION] {line}", file=sys.stderr)
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"[LOAD] Wrote {output}", file=sys.stderr)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
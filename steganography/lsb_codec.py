@@ -0,0 +1,83 @@
+"""Vectorized LSB steganography on in-memory BGR frames.
+
+Reads and writes the same layout as stegano's lsb.hide / lsb.reveal so videos
+produced with stegano still decode: the message is prefixed with
+"<length>:", turned into bits (MSB first), padded to a multiple of 3 and
+written into the least significant bit of the R, G and B components of the
+pixels in row-major order.
+"""
+import numpy as np
+
+# Longest "<length>:" prefix we are willing to scan for before giving up
+MAX_PREFIX_BYTES = 12
+
+
+def _rgb_pixels(frame):
+    """Return an (N, 3) view of the frame's pixels in R, G, B order"""
+    if frame.ndim != 3 or frame.shape[2] < 3 or frame.dtype != np.uint8:
+        raise ValueError("Expected a uint8 BGR frame")
+    if not frame.flags['C_CONTIGUOUS']:
+        raise ValueError("Expected a contiguous frame")
+    return frame.reshape(-1, frame.shape[2])[:, 2::-1]
+
+
+def _read_bytes(pixels, num_bytes):
+    """Read num_bytes from the start of the LSB stream"""
+    num_pixels = -(-num_bytes * 8 // 3)
+    bits = (pixels[:num_pixels] & 1).reshape(-1)
+    return np.packbits(bits[:num_bytes * 8]).tobytes()
+
+
+def capacity(frame):
+    """Number of bytes (including the length prefix) a frame can hold"""
+    return frame.shape[0] * frame.shape[1] * 3 // 8
+
+
+def hide_array(frame, message, in_place=False):
+    """Hide a message in a BGR frame, returning the encoded frame"""
+    if isinstance(message, str):
+        message = message.encode('utf-8')
+    if not message:
+        raise ValueError("message length is zero")
+
+    payload = str(len(message)).encode('ascii') + b":" + message
+    bits = np.unpackbits(np.frombuffer(payload, dtype=np.uint8))
+    bits = np.concatenate([bits, np.zeros((-len(bits)) % 3, dtype=np.uint8)])
+
+    if len(bits) > frame.shape[0] * frame.shape[1] * 3:
+        raise ValueError(f"The message you want to hide is too long: {len(message)} bytes")
+
+    encoded = frame if in_place else frame.copy()
+    pixels = _rgb_pixels(encoded)[:len(bits) // 3]
+    pixels &= 0xFE
+    pixels |= bits.reshape(-1, 3)
+    return encoded
+
+
+def reveal_bytes(frame):
+    """Return the raw message bytes hidden in a frame, or None if there is none"""
+    pixels = _rgb_pixels(frame)
+    max_bytes = capacity(frame)
+
+    prefix = _read_bytes(pixels, min(MAX_PREFIX_BYTES, max_bytes))
+    sep = prefix.find(b":")
+    if sep <= 0 or not prefix[:sep].isdigit():
+        return None
+
+    length = int(prefix[:sep])
+    total = sep + 1 + length
+    if length == 0 or total > max_bytes:
+        return None
+
+    return _read_bytes(pixels, total)[sep + 1:]
+
+
+def reveal_array(frame):
+    """Return the text message hidden in a frame, or None if there is none"""
+    message = reveal_bytes(frame)
+    if message is None:
+        return None
+    try:
+        return message.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
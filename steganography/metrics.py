@@ -0,0 +1,261 @@
+"""In-process metrics exposed in the Prometheus text format.
+
+A small dependency-free registry of counters, gauges and histograms with
+labels. Stages are timed with stage_timer() / timed(), and streaming frame
+pipelines with StageClock, which splits the time spent in a chain of
+generators into exclusive per-stage durations. Every worker process keeps its
+own registry, so with a multi-process server each worker reports its own
+numbers (scrape them individually or aggregate on the Prometheus side).
+"""
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a single frame up to a long upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_sample(key, value))
+        return lines
+
+    def _render_sample(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only go up")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, key, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    'stego_stage_duration_seconds', 'Time spent in each processing stage', ['stage']))
+STAGE_FRAMES = registry.register(Counter(
+    'stego_frames_processed_total', 'Frames that went through each processing stage', ['stage']))
+BYTES = registry.register(Counter(
+    'stego_bytes_processed_total', 'Bytes received in uploads and sent in responses', ['direction']))
+REQUEST_SECONDS = registry.register(Histogram(
+    'stego_request_duration_seconds', 'Request latency until the response is ready', ['endpoint']))
+REQUESTS = registry.register(Counter(
+    'stego_requests_total', 'Requests handled', ['endpoint', 'status']))
+IN_FLIGHT = registry.register(Gauge(
+    'stego_requests_in_flight', 'Requests currently being processed', ['endpoint']))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def observe_stage(stage, seconds, frames=None):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if frames:
+        STAGE_FRAMES.inc(frames, stage=stage)
+
+
+@contextmanager
+def stage_timer(stage, frames=None):
+    """Time the body of a with block as one run of a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, frames)
+
+
+def timed(stage):
+    """Decorator form of stage_timer"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class StageClock:
+    """Times a chain of frame generators stage by stage
+
+    tap() wraps the output of a stage and measures how long each next() on it
+    takes, which includes every stage upstream of it. observe() subtracts
+    consecutive taps so each stage is charged only for its own work; the
+    consumer at the end of the chain is charged the rest of the total time.
+    When stages run on separate threads, boundary() taps the queue a thread
+    reads from: waiting on it isn't any stage's work, so it is subtracted
+    from the next stage but not recorded.
+    """
+
+    def __init__(self):
+        self._stages = []
+        self._inclusive = {}
+        self._frames = {}
+        self._boundaries = set()
+
+    def boundary(self, frames):
+        stage = f"queue{len(self._boundaries)}"
+        self._boundaries.add(stage)
+        return self.tap(frames, stage)
+
+    def tap(self, frames, stage):
+        self._stages.append(stage)
+        self._inclusive[stage] = 0.0
+        self._frames[stage] = 0
+        return self._timed(frames, stage)
+
+    def _timed(self, frames, stage):
+        iterator = iter(frames)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._inclusive[stage] += time.perf_counter() - start
+                return
+            self._inclusive[stage] += time.perf_counter() - start
+            self._frames[stage] += 1
+            yield item
+
+    def observe(self, total_seconds=None, final_stage=None):
+        """Record every tapped stage (and optionally the consumer) in the stage histogram"""
+        upstream = 0.0
+        for stage in self._stages:
+            inclusive = self._inclusive[stage]
+            if stage not in self._boundaries:
+                observe_stage(stage, max(inclusive - upstream, 0.0), self._frames[stage])
+            upstream = inclusive
+        if final_stage is not None and total_seconds is not None:
+            last = self._stages[-1] if self._stages else None
+            observe_stage(final_stage, max(total_seconds - upstream, 0.0), self._frames.get(last))
+
+
+def request_started(endpoint):
+    IN_FLIGHT.inc(endpoint=endpoint)
+    return time.perf_counter()
+
+
+def request_finished(endpoint, status, started):
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    REQUESTS.inc(endpoint=endpoint, status=status)
+
+
+def request_closed(endpoint):
+    IN_FLIGHT.dec(endpoint=endpoint)
+
+
+def render():
+    return registry.render()
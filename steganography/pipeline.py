@@ -0,0 +1,241 @@
+"""Execution helpers for the per-frame embedding pipeline.
+
+ordered_map shards per-frame work across a worker pool (GIL-releasing
+threads or processes) and hands results back in input order, never keeping
+more than max_in_flight frames submitted at once so memory stays bounded.
+The pools are shared by all requests in the process, so the worker count is
+a per-server setting rather than a per-request one.
+
+StagedExecutor overlaps the stages of one request instead: the decoder, the
+border/LSB transform and the encoder each get a thread, joined by bounded
+queues, so a request takes about as long as its slowest stage rather than
+the sum of them. OpenCV and the ffmpeg pipes release the GIL while they work.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import cv2
+
+import metrics
+from border import apply_data_border
+
+WORKER_MODES = ('thread', 'process')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(workers, mode='thread'):
+    """Return the shared executor for a worker count and mode"""
+    if mode not in WORKER_MODES:
+        raise ValueError(f"Unknown worker mode: {mode}")
+    key = (mode, workers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            if mode == 'process':
+                pool = ProcessPoolExecutor(max_workers=workers)
+            else:
+                pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='stego-frame')
+            _pools[key] = pool
+        return pool
+
+
+def shutdown_pools():
+    """Shut down every shared executor (used on server exit and in benchmarks)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def ordered_map(func, items, workers=1, mode='thread', max_in_flight=None):
+    """Apply func to items on a worker pool, yielding results in input order
+
+    At most max_in_flight items (default: twice the worker count) are
+    submitted but not yet consumed at any time. With a single worker the work
+    runs inline in the calling thread.
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = get_pool(workers, mode)
+    max_in_flight = max(max_in_flight or workers * 2, 1)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # The consumer stopped early or a task failed; drop what hasn't started
+        for future in pending:
+            future.cancel()
+
+
+QUEUE_DEPTH = metrics.registry.register(metrics.Gauge(
+    'stego_pipeline_queue_depth', 'Frames waiting in the queue after each pipeline stage', ['stage']))
+QUEUE_WAIT = metrics.registry.register(metrics.Counter(
+    'stego_pipeline_queue_wait_seconds_total',
+    'Time spent blocked on a stage queue: put = the consumer is behind, get = the producer is',
+    ['stage', 'side']))
+
+# How often blocked queue operations check whether the pipeline was closed
+_POLL_SECONDS = 0.1
+
+
+class StagedExecutor:
+    """Run frame generator stages on their own threads, joined by bounded queues
+
+    stage(name, frames) starts a thread draining frames, typically a
+    generator chain over the previous stage's output, into a queue of at most
+    queue_size items, and returns an iterator over that queue. A full queue
+    blocks its producer, so backpressure bounds the frames held between two
+    stages. Exceptions surface in the consumer, and close() or abandoning an
+    iterator stops every stage. With queue_size 0 stages run inline.
+    """
+
+    def __init__(self, queue_size=4, name='stego-stage'):
+        self.queue_size = max(int(queue_size), 0)
+        self.name = name
+        self.stats = {}
+        self._queues = {}
+        self._threads = []
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def stage(self, name, frames):
+        if self.queue_size == 0:
+            return frames
+        q = self._queues[name] = queue.Queue(self.queue_size)
+        self.stats[name] = {"frames": 0, "max_depth": 0, "put_wait": 0.0, "get_wait": 0.0}
+        thread = threading.Thread(target=self._produce, args=(name, frames, q), daemon=True,
+                                  name=f"{self.name}-{name}")
+        self._threads.append(thread)
+        thread.start()
+        return self._consume(name, q)
+
+    def depths(self):
+        """Frames currently waiting after each stage"""
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    def _put(self, name, q, message):
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                q.put(message, timeout=_POLL_SECONDS)
+            except queue.Full:
+                continue
+            waited = time.perf_counter() - start
+            self.stats[name]["put_wait"] += waited
+            QUEUE_WAIT.inc(waited, stage=name, side='put')
+            return True
+        return False
+
+    def _produce(self, name, frames, q):
+        stats = self.stats[name]
+        iterator = iter(frames)
+        try:
+            for item in iterator:
+                QUEUE_DEPTH.inc(stage=name)
+                if not self._put(name, q, ('frame', item)):
+                    QUEUE_DEPTH.dec(stage=name)
+                    return
+                stats["frames"] += 1
+                stats["max_depth"] = max(stats["max_depth"], q.qsize())
+            self._put(name, q, ('done', None))
+        except BaseException as e:
+            self._put(name, q, ('error', e))
+        finally:
+            # Run the upstream generators' cleanup (e.g. releasing the decoder) on this thread
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def _consume(self, name, q):
+        stats = self.stats[name]
+        finished = False
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    kind, payload = q.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+                    continue
+                finally:
+                    waited = time.perf_counter() - start
+                    stats["get_wait"] += waited
+                    QUEUE_WAIT.inc(waited, stage=name, side='get')
+                if kind != 'frame':
+                    # Errors travel downstream; only an abandoned iterator stops the pipeline
+                    finished = True
+                    if kind == 'error':
+                        raise payload
+                    return
+                QUEUE_DEPTH.dec(stage=name)
+                yield payload
+        finally:
+            if not finished:
+                self.close()
+
+    def close(self):
+        """Stop every stage, drop the frames still queued and wait for the threads"""
+        self._stop.set()
+        for name, q in self._queues.items():
+            while True:
+                try:
+                    kind, _ = q.get_nowait()
+                except queue.Empty:
+                    break
+                if kind == 'frame':
+                    QUEUE_DEPTH.dec(stage=name)
+        current = threading.current_thread()
+        for thread in self._threads:
+            if thread is not current:
+                thread.join()
+
+    def summary(self):
+        return ", ".join(
+            f"{name}: {s['frames']} frames, max depth {s['max_depth']}, "
+            f"producer blocked {s['put_wait']:.2f}s, consumer starved {s['get_wait']:.2f}s"
+            for name, s in self.stats.items())
+
+
+def default_workers():
+    """Number of frame workers to use when the server doesn't configure one"""
+    return os.cpu_count() or 1
+
+
+# Per-frame tasks. They live at module level so process pools can pickle them.
+
+def border_frame(task):
+    """Draw the data border on one in-memory frame"""
+    index, frame, bits, total_frames, border_width = task
+    return index, apply_data_border(frame, bits, index, total_frames, border_width)
+
+
+def border_frame_file(task):
+    """Draw the data border on one frame stored as an image file"""
+    index, frame_path, bordered_path, bits, total_frames, border_width = task
+    frame = cv2.imread(frame_path)
+    if frame is None:
+        return index, None
+    apply_data_border(frame, bits, index, total_frames, border_width)
+    cv2.imwrite(bordered_path, frame)
+    return index, bordered_path
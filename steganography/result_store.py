@@ -0,0 +1,103 @@
+"""On-disk store for finished output videos.
+
+Results live in <root>/<result_id>/ next to a small metadata.json sidecar and
+are deleted once their TTL has passed, so a response can be streamed from
+disk (with HTTP Range support) after the request's temp dir is gone.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+METADATA_FILE = 'metadata.json'
+
+
+class ResultStore:
+    def __init__(self, root, ttl_seconds=3600):
+        # Absolute, since send_file would resolve a relative path against the app's root
+        self.root = os.path.abspath(root)
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, result_id):
+        # Ids are generated by us; anything else could be a path traversal attempt
+        try:
+            result_id = uuid.UUID(result_id).hex
+        except (ValueError, TypeError, AttributeError):
+            return None
+        return os.path.join(self.root, result_id)
+
+    def put(self, source_path, filename=None, metadata=None):
+        """Move a finished file into the store and return its result id"""
+        self.purge_expired()
+
+        result_id = uuid.uuid4().hex
+        result_dir = os.path.join(self.root, result_id)
+        os.makedirs(result_dir)
+
+        filename = filename or os.path.basename(source_path)
+        path = os.path.join(result_dir, filename)
+        shutil.move(source_path, path)
+
+        now = time.time()
+        record = dict(metadata or {})
+        record.update({
+            "result_id": result_id,
+            "filename": filename,
+            "size": os.path.getsize(path),
+            "created": now,
+            "expires": now + self.ttl_seconds,
+        })
+        with open(os.path.join(result_dir, METADATA_FILE), 'w') as f:
+            json.dump(record, f)
+        return result_id
+
+    def get(self, result_id):
+        """Return (path, metadata) for a live result, or None"""
+        result_dir = self._dir(result_id)
+        if result_dir is None:
+            return None
+        try:
+            with open(os.path.join(result_dir, METADATA_FILE)) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        if record["expires"] < time.time():
+            self.delete(result_id)
+            return None
+
+        path = os.path.join(result_dir, record["filename"])
+        if not os.path.exists(path):
+            return None
+        return path, record
+
+    def delete(self, result_id):
+        result_dir = self._dir(result_id)
+        if result_dir is not None:
+            shutil.rmtree(result_dir, ignore_errors=True)
+
+    def purge_expired(self):
+        """Delete every result whose TTL has passed"""
+        if not self._lock.acquire(blocking=False):
+            return  # Another thread is already purging
+        try:
+            now = time.time()
+            for name in os.listdir(self.root):
+                metadata_path = os.path.join(self.root, name, METADATA_FILE)
+                try:
+                    with open(metadata_path) as f:
+                        expires = json.load(f)["expires"]
+                except (OSError, ValueError, KeyError):
+                    # Half-written or foreign entry; leave it alone unless it's stale
+                    try:
+                        expires = os.path.getmtime(os.path.join(self.root, name)) + self.ttl_seconds
+                    except OSError:
+                        continue
+                if expires < now:
+                    shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        finally:
+            self._lock.release()
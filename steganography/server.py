@@ -1,177 +1,194 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Blueprint, Flask, Response, current_app, g, request, send_file, jsonify, url_for
 import os
+import functools
 import cv2
 import math
 import shutil
 import base64
+import contextlib
+import hashlib
+import itertools
 import numpy as np
-import colorsys
+import re
+import time
 import uuid
-from stegano import lsb
-from cryptography.hazmat.primitives.asymmetric import rsa, padding as rsa_padding
-from cryptography.hazmat.primitives import serialization, hashes
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 from datetime import datetime
-import subprocess
+import tempfile
 from werkzeug.datastructures import FileStorage
 from io import BytesIO
+from border import (apply_data_border, bits_per_frame_limit, corner_strip, decode_border_bytes, decode_corner_bits,
+                    detect_borders, printable_text, stack_corners, text_bits, vote_border_payload)
+from corner_reader import CornerReader
+from lsb_codec import hide_array, reveal_array, reveal_bytes
+from frame_header import HEADER_FRAME, SCHEME_CODES, hide_header, pack_header, read_header
+from erasure import ShardCollector, encode_shards, parse_shard
+from frame_reader import FrameReader
+from video_output import DEFAULT_PROFILE, OUTPUT_PROFILES, FFmpegWriter, mux_audio, output_path_for
+from result_store import ResultStore
+from smart_render import (SmartRenderUnavailable, check_matches, concat_segments, matching_encoder_args,
+                          split_gops)
+from jobs import JobManager
+from key_manager import KeyManager, generate_key_pair, max_oaep_plaintext
+from pipeline import StagedExecutor, border_frame, default_workers, ordered_map
+import metrics
+from metrics import StageClock, stage_timer
+from admission import AdmissionController, AdmissionError
+from decrypt_cache import DecryptCache
+from ingest import StreamDecodeError, StreamDecoder, receive_upload, run_in_thread
 
 
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+bp = Blueprint('stego', __name__)
 
 # You can also manually set CORS headers in each response if needed
-@app.after_request
 def after_request(response):
     response.headers.add('Access-Control-Allow-Origin', '*')
     response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
     response.headers.add('Access-Control-Allow-Methods', 'GET,PUT,POST,DELETE,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', ','.join(EXPOSED_HEADERS))
     return response
 
-# Configure upload settings
-UPLOAD_FOLDER = './uploads'
-TEMP_FOLDER = './tmp'
-KEYS_FOLDER = './keys'
+# Request latency, status and in-flight counts for /metrics
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_started = metrics.request_started(g.metrics_endpoint)
+
+def finish_request_metrics(response):
+    if 'metrics_started' in g:
+        metrics.request_finished(g.metrics_endpoint, response.status_code, g.metrics_started)
+    return response
+
+def close_request_metrics(exc=None):
+    if 'metrics_started' in g:
+        metrics.request_closed(g.metrics_endpoint)
+
+# Configure upload settings. Folders are relative to the working directory
+# the server starts in, but kept absolute: Flask's send_file resolves relative
+# paths against the app's root_path instead
+UPLOAD_FOLDER = os.path.abspath('./uploads')
+TEMP_FOLDER = os.path.abspath('./tmp')
+KEYS_FOLDER = os.path.abspath('./keys')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(TEMP_FOLDER, exist_ok=True)
+RESULTS_FOLDER = os.path.abspath('./results')
 os.makedirs(KEYS_FOLDER, exist_ok=True)
 
-def convert_to_mp4(mov_path, output_dir):
-    """Convert MOV file to MP4 using ffmpeg"""
-    # Create the output path with .mp4 extension
-    mp4_path = mov_path.rsplit('.', 1)[0] + '.mp4'
-    
-    try:
-        # Use ffmpeg to convert from MOV to MP4
-        # -c:v libx264 uses H.264 codec for video
-        # -crf 23 is a good balance between quality and file size
-        # -preset fast provides a good encoding speed
-        # -c:a aac uses AAC codec for audio
-        # -b:a 128k sets audio bitrate
-        command = [
-            'ffmpeg',
-            '-i', mov_path,
-            '-c:v', 'libx264',
-            '-crf', '23',
-            '-preset', 'fast',
-            '-c:a', 'aac',
-            '-b:a', '128k',
-            mp4_path
-        ]
-        
-        # Execute the command
-        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = process.communicate()
-        
-        if process.returncode != 0:
-            print(f"Error converting video: {stderr.decode()}")
-            return None
-        
-        print(f"Successfully converted {mov_path} to {mp4_path}")
-        return mp4_path
-    except Exception as e:
-        print(f"Error during conversion: {str(e)}")
-        return None
+# RSA keys are parsed once per process and reloaded when the files change
+KEY_SIZE = 2048
+key_manager = KeyManager(KEYS_FOLDER, KEY_SIZE)
+
+# Finished videos served by /results/<id> are kept this long (seconds)
+RESULT_TTL = int(os.environ.get('STEGO_RESULT_TTL', 3600))
+result_store = ResultStore(RESULTS_FOLDER, RESULT_TTL)
+
+# Background job workers for /jobs/*; job state is kept as long as results are
+JOBS_FOLDER = os.path.abspath('./jobs')
+JOB_WORKERS = int(os.environ.get('STEGO_JOB_WORKERS', 2))
+job_manager = JobManager(JOBS_FOLDER, workers=JOB_WORKERS, ttl_seconds=RESULT_TTL)
+
+# Decrypt results cached by the SHA-256 of the uploaded video (memory LRU + disk)
+CACHE_FOLDER = os.path.abspath('./cache')
+DECRYPT_CACHE_ENTRIES = int(os.environ.get('STEGO_DECRYPT_CACHE_ENTRIES', 1024))
+DECRYPT_CACHE_BYTES = int(os.environ.get('STEGO_DECRYPT_CACHE_BYTES', 64 * 1024 * 1024))
+DECRYPT_CACHE_TTL = int(os.environ.get('STEGO_DECRYPT_CACHE_TTL', 86400))
+decrypt_cache = DecryptCache(CACHE_FOLDER, DECRYPT_CACHE_ENTRIES, DECRYPT_CACHE_BYTES, DECRYPT_CACHE_TTL,
+                             key_id=key_manager.fingerprint)
+
+# Headers carrying result metadata that browser clients are allowed to read
+EXPOSED_HEADERS = ['Content-Disposition', 'Content-Length', 'Content-Range', 'Accept-Ranges',
+                   'X-Result-Id', 'X-Frame-Numbers', 'X-Output-Profile', 'X-Cache']
+
+# Output encoding profile for /encrypt ("x264" for delivery, "lossless" keeps LSB data)
+OUTPUT_PROFILE = os.environ.get('STEGO_OUTPUT_PROFILE', DEFAULT_PROFILE)
+
+# "full" re-encodes every frame; "smart" re-encodes only the GOPs holding
+# payload frames and stream-copies the rest of the upload. Smart only applies
+# to H.264 uploads already in the output profile's pixel format (yuv444p for
+# x264, e.g. a re-upload of our own output); 4:2:0 phone video gets a full
+# encode, since the border doesn't survive 4:2:0 chroma.
+ENCODE_MODE = os.environ.get('STEGO_ENCODE_MODE', 'full')
+# Frames that get the data border: "all", or "payload" for just the payload
+# frames and the metadata frame. Smart encoding can only draw on the frames
+# it re-encodes.
+BORDER_FRAMES = os.environ.get('STEGO_BORDER_FRAMES', 'all')
+# How the encrypted text is spread over the payload frames: "split" into 10
+# parts that are all needed, or "erasure" into data + parity shards, any
+# ERASURE_DATA_FRAMES of which rebuild it. Decoders older than the
+# rsa-erasure header scheme can't read erasure-coded videos.
+PAYLOAD_CODING = os.environ.get('STEGO_PAYLOAD_CODING', 'split')
+ERASURE_DATA_FRAMES = int(os.environ.get('STEGO_ERASURE_DATA_FRAMES', 10))
+ERASURE_PARITY_FRAMES = int(os.environ.get('STEGO_ERASURE_PARITY_FRAMES', 4))
+
+# Frame worker pool used by the border stage ("thread" or "process")
+ENCODE_WORKERS = int(os.environ.get('STEGO_ENCODE_WORKERS', default_workers()))
+ENCODE_WORKER_MODE = os.environ.get('STEGO_ENCODE_WORKER_MODE', 'thread')
+# Maximum frames submitted to the pool but not yet written, bounds memory per request
+ENCODE_MAX_IN_FLIGHT = int(os.environ.get('STEGO_ENCODE_MAX_IN_FLIGHT', ENCODE_WORKERS * 2))
+# Frames queued between the decoder, border/LSB and encoder threads of one
+# request (0 runs the stages one after another on the request thread)
+PIPELINE_QUEUE = int(os.environ.get('STEGO_PIPELINE_QUEUE', 4))
+
+# Admission control (per worker process): execution slots and queue places per
+# endpoint kind, and a budget on the frames x pixels running at once in
+# megapixel-frames (0 = no budget). Requests costing more than
+# MAX_REQUEST_COST megapixel-frames are refused outright (0 = no limit).
+ENCRYPT_CONCURRENCY = int(os.environ.get('STEGO_ENCRYPT_CONCURRENCY', 2))
+ENCRYPT_QUEUE = int(os.environ.get('STEGO_ENCRYPT_QUEUE', 8))
+ENCRYPT_MAX_COST = float(os.environ.get('STEGO_ENCRYPT_MAX_COST', 8000))
+DECRYPT_CONCURRENCY = int(os.environ.get('STEGO_DECRYPT_CONCURRENCY', 4))
+DECRYPT_QUEUE = int(os.environ.get('STEGO_DECRYPT_QUEUE', 32))
+DECRYPT_MAX_COST = float(os.environ.get('STEGO_DECRYPT_MAX_COST', 0))
+# /verify decodes only a few frames, so it has its own slots and doesn't wait behind decrypts
+VERIFY_CONCURRENCY = int(os.environ.get('STEGO_VERIFY_CONCURRENCY', 8))
+VERIFY_QUEUE = int(os.environ.get('STEGO_VERIFY_QUEUE', 64))
+VERIFY_MAX_COST = float(os.environ.get('STEGO_VERIFY_MAX_COST', 0))
+MAX_REQUEST_COST = float(os.environ.get('STEGO_MAX_REQUEST_COST', 0))
+# Seconds a request may wait for a slot once its upload is in
+ADMISSION_TIMEOUT = float(os.environ.get('STEGO_ADMISSION_TIMEOUT', 60))
+
+# Upload ingestion: "spool" saves the whole upload before processing it,
+# "stream" parses it off the request and decodes /encrypt uploads while they
+# arrive; ?ingest=stream|spool overrides per request
+INGEST_MODE = os.environ.get('STEGO_INGEST_MODE', 'spool')
+
+# Border extraction: "corners" has ffmpeg crop the sampled frames to their
+# top corners, "full" decodes the sampled frames at full resolution
+BORDER_DECODE = os.environ.get('STEGO_BORDER_DECODE', 'corners')
 
 # RSA encryption and decryption functions
 def generate_keys(key_size=2048):
     """Generate RSA key pair if they don't exist"""
-    private_keys_path = os.path.join(KEYS_FOLDER, f'private_key_{key_size}.pem')
-    public_keys_path = os.path.join(KEYS_FOLDER, f'public_key_{key_size}.pem')
-    
-    if os.path.isfile(private_keys_path) and os.path.isfile(public_keys_path):
+    if not generate_key_pair(KEYS_FOLDER, key_size):
         print("Public and private keys already exist")
-        return
-    
-    # Generate a private key
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=key_size,
-    )
-    
-    # Get the public key
-    public_key = private_key.public_key()
-    
-    # Serialize and save the private key
-    private_pem = private_key.private_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.PKCS8,
-        encryption_algorithm=serialization.NoEncryption()
-    )
-    
-    with open(private_keys_path, "wb") as file_obj:
-        file_obj.write(private_pem)
-    
-    # Serialize and save the public key
-    public_pem = public_key.public_bytes(
-        encoding=serialization.Encoding.PEM,
-        format=serialization.PublicFormat.SubjectPublicKeyInfo
-    )
-    
-    with open(public_keys_path, "wb") as file_obj:
-        file_obj.write(public_pem)
-    
-    print(f"Public and Private keys created with size {key_size}")
 
 def encrypt_rsa(message):
-    """Encrypt message using RSA"""
-    key_size = 2048
-    # Ensure keys exist
-    generate_keys(key_size)
-    
-    # Read public key
-    public_key_path = os.path.join(KEYS_FOLDER, f'public_key_{key_size}.pem')
-    with open(public_key_path, 'rb') as key_file:
-        public_key = serialization.load_pem_public_key(key_file.read())
+    """Encrypt message using RSA
     
-    # Encrypt the message
+    Messages too long for raw RSA-OAEP are sealed in an RSA-wrapped AES-GCM
+    envelope instead; decrypt_rsa tells the two apart.
+    """
     message_bytes = message.encode('utf-8') if isinstance(message, str) else message
-    ciphertext = public_key.encrypt(
-        message_bytes,
-        rsa_padding.OAEP(
-            mgf=rsa_padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
+    
+    if len(message_bytes) <= max_oaep_plaintext(key_manager.key_size):
+        ciphertext = key_manager.encrypt(message_bytes)
+    else:
+        ciphertext = key_manager.seal(message_bytes)
     
     # Encode in base64
     return base64.b64encode(ciphertext)
 
 def decrypt_rsa(encoded_message):
-    """Decrypt message using RSA"""
-    key_size = 2048
-    # Ensure keys exist
-    generate_keys(key_size)
-    
-    # Set private key path
-    private_key_path = os.path.join(KEYS_FOLDER, f'private_key_{key_size}.pem')
-    
-    # Read private key
-    with open(private_key_path, 'rb') as key_file:
-        private_key = serialization.load_pem_private_key(
-            key_file.read(),
-            password=None
-        )
-    
+    """Decrypt message using RSA (raw OAEP ciphertext or envelope)"""
     # Decode base64 if needed
     if isinstance(encoded_message, str):
         encoded_message = encoded_message.encode('utf-8')
     
     cipher_text = base64.b64decode(encoded_message)
     
-    # Decrypt the message
-    plain_text = private_key.decrypt(
-        cipher_text,
-        rsa_padding.OAEP(
-            mgf=rsa_padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None
-        )
-    )
-    
-    return plain_text
+    if key_manager.is_envelope(cipher_text):
+        return key_manager.open(cipher_text)
+    return key_manager.decrypt(cipher_text)
 
 # Video processing functions
 def split_string(s_str, count=10):
@@ -191,188 +208,504 @@ def split_string(s_str, count=10):
         split_list.append(out_str)
     return split_list
 
-def extract_frames(video_path, temp_dir):
-    """Extract frames from video"""
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    print(f"[INFO] Extracting frames from video {video_path}")
+def probe_video(video_path):
+    """Read basic stream properties without decoding any frames"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        return {
+            "fps": cap.get(cv2.CAP_PROP_FPS),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        }
+    finally:
+        cap.release()
+
+def read_frames(video_path):
+    """Yield (index, frame) pairs straight from the decoder, one frame at a time"""
     vidcap = cv2.VideoCapture(video_path)
-    count = 0
-    frames = []
+    try:
+        index = 0
+        while True:
+            success, image = vidcap.read()
+            if not success:
+                break
+            yield index, image
+            index += 1
+    finally:
+        vidcap.release()
+
+# Border text is "STEGO:" + data + "#" + the base32 integrity tag of the rest,
+# which /verify checks; the decoders strip the tag off again
+_BORDER_TAG_RE = re.compile(r'#([A-Z2-7]{16})$')
+
+def border_payload(data, frame_shape, border_width=20):
+    """The border text for data: tagged, unless the tag would no longer fit the data corner"""
+    text = f"STEGO:{data}"
+    tag = base64.b32encode(key_manager.tag(printable_text(text.encode('utf-8')).encode('ascii')))
+    tagged = f"{text}#{tag.decode('ascii')}"
+    height, width = frame_shape[:2]
+    corner_size = border_width * 2
+    capacity = min(corner_size * corner_size, bits_per_frame_limit(width, height, border_width))
+    return tagged if len(tagged.encode('utf-8')) * 8 <= capacity else text
+
+def split_border_tag(border_data):
+    """Split decoded border text into (text, tag bytes), tag None if there is none"""
+    match = _BORDER_TAG_RE.search(border_data) if border_data else None
+    if match is None:
+        return border_data, None
+    return border_data[:match.start()], base64.b32decode(match.group(1))
+
+def border_stage(frames, data, total_frames, border_width=20, marked=None):
+    """Add the data-encoding border to each frame as it streams past
+    
+    marked(index), if given, picks the frames that get a border.
+    """
+    # The first frame tells whether the tag fits the border
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return
+    frames = itertools.chain([first], frames)
+    full_data = border_payload(data, first[1].shape, border_width)
+    print(f"[INFO] Encoding data in border: {full_data[:50]}...")
+    bits = text_bits(full_data)
+    
+    if marked is not None:
+        # Only a handful of frames get a border, so draw them inline
+        count = 0
+        for i, frame in frames:
+            if marked(i):
+                apply_data_border(frame, bits, i, total_frames, border_width)
+                count += 1
+            yield i, frame
+        print(f"[INFO] Added data borders to {count} frames")
+        return
     
-    while True:
-        success, image = vidcap.read()
-        if not success:
-            break
-        frame_path = os.path.join(temp_dir, f"{count}.png")
-        cv2.imwrite(frame_path, image)
-        frames.append(frame_path)
+    # Frames come straight from the decoder, so the border is drawn in place;
+    # the worker pool hands them back in order with a bounded in-flight window
+    tasks = ((i, frame, bits, total_frames, border_width) for i, frame in frames)
+    count = 0
+    for i, frame in ordered_map(border_frame, tasks, workers=ENCODE_WORKERS,
+                                mode=ENCODE_WORKER_MODE, max_in_flight=ENCODE_MAX_IN_FLIGHT):
+        yield i, frame
         count += 1
+        if i % 10 == 0:
+            print(f"[INFO] Added data border to frame {i}/{total_frames}")
     
-    print(f"[INFO] Extracted {count} frames from video")
-    return frames, count
+    print(f"[INFO] Added data borders to all {count} frames")
 
-def encode_frames(frames, encrypted_text, temp_dir):
-    """Encode encrypted text into frames"""
-    # Convert to string if it's bytes
+# Frame 0 holds the header (see frame_header.py), the payload parts follow it
+PAYLOAD_START = HEADER_FRAME + 1
+
+def payload_parts(encrypted_text):
+    """The messages to hide in the payload frames, in order, and the header scheme for them"""
+    if PAYLOAD_CODING == 'erasure':
+        shards = encode_shards(encrypted_text, ERASURE_DATA_FRAMES,
+                               ERASURE_DATA_FRAMES + ERASURE_PARITY_FRAMES)
+        return shards, 'rsa-erasure'
+    return split_string(encrypted_text), 'rsa-base64'
+
+def describe_part(part):
+    if isinstance(part, bytes):
+        shard = parse_shard(part)
+        return f"shard {shard['index'] + 1}/{shard['n']} (any {shard['k']} rebuild the payload)"
+    return part
+
+def payload_frame_count(encrypted_text):
+    """Number of frames lsb_stage hides the encrypted text parts in"""
+    if PAYLOAD_CODING == 'erasure':
+        return ERASURE_DATA_FRAMES + ERASURE_PARITY_FRAMES
+    if isinstance(encrypted_text, bytes):
+        encrypted_text = encrypted_text.decode('utf-8')
+    return len(split_string(encrypted_text))
+
+def border_marker(encrypted_text):
+    """The marked argument for border_stage under BORDER_FRAMES"""
+    if BORDER_FRAMES != 'payload':
+        return None
+    # The header and payload frames; the metadata frame is built from frame 0
+    # and inherits its border
+    end = PAYLOAD_START + payload_frame_count(encrypted_text)
+    return lambda i: i < end
+
+def lsb_stage(frames, encrypted_text, frame_numbers):
+    """Hide the header and the encrypted text in the first frames and append the metadata frame"""
     if isinstance(encrypted_text, bytes):
         encrypted_text = encrypted_text.decode('utf-8')
-        
-    # Split the text into parts
-    split_text_list = split_string(encrypted_text)
-    num_parts = len(split_text_list)
-    
-    # Use the first N frames (N = number of text parts)
-    frame_numbers = list(range(min(num_parts, len(frames))))
     
-    print(f"Encoding text into {len(frame_numbers)} frames")
+    split_text_list, scheme = payload_parts(encrypted_text)
+    print(f"Encoding text into up to {len(split_text_list)} frames")
+    payload_end = PAYLOAD_START + len(split_text_list)
+    header = pack_header(list(range(PAYLOAD_START, payload_end)), len(encrypted_text),
+                         border_frames=BORDER_FRAMES, scheme=SCHEME_CODES[scheme])
+    
+    # Keep a copy of the first frame so the metadata frame can be built from it
+    # once we know how many frames actually received a part
+    metadata_img = None
+    last_index = -1
+    for i, frame in frames:
+        if i == HEADER_FRAME:
+            hide_header(frame, header)
+        elif PAYLOAD_START <= i < payload_end:
+            part = split_text_list[i - PAYLOAD_START]
+            hide_array(frame, part, in_place=True)
+            frame_numbers.append(i)
+            print(f"[INFO] Frame {i} holds {describe_part(part)}")
+        if i == 0:
+            metadata_img = frame.copy()
+        last_index = i
+        yield i, frame
+    
+    if metadata_img is None:
+        return
     
-    # Hide text parts in frames
-    for i, frame_num in enumerate(frame_numbers):
-        if i >= len(split_text_list):
-            break
-            
-        frame_path = frames[frame_num]
-        # Hide text in frame using LSB steganography
-        secret_enc = lsb.hide(frame_path, split_text_list[i])
-        secret_enc.save(frame_path)
-        print(f"[INFO] Frame {frame_num} holds {split_text_list[i]}")
-    
-    # Save the frame numbers in a special metadata frame
-    # This will help with faster decryption
-    metadata_frame_path = os.path.join(temp_dir, "metadata.png")
-    # Create a simple black image for metadata
-    metadata_img = cv2.imread(frames[0])
-    cv2.imwrite(metadata_frame_path, metadata_img)
-    
-    # Save frame numbers as metadata
+    # Save the frame numbers in a metadata frame appended after the last frame
     metadata_content = ",".join(map(str, frame_numbers))
-    metadata_secret = lsb.hide(metadata_frame_path, metadata_content)
-    metadata_secret.save(metadata_frame_path)
     print(f"[INFO] Metadata frame holds frame numbers: {metadata_content}")
-    
-    # Insert the metadata frame as the last frame to process
-    frames.append(metadata_frame_path)
-        
-    return frame_numbers
+    yield last_index + 1, hide_array(metadata_img, metadata_content, in_place=True)
 
-def create_output_video(frames, original_video, output_path):
-    """Create output video from frames"""
-    # Get video properties
-    video = cv2.VideoCapture(original_video)
-    fps = video.get(cv2.CAP_PROP_FPS)
-    width = int(video.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(video.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
+def write_frames(frames, output_path, fps, frame_size):
+    """Consume a frame stream and write it to a PNG-codec MOV file"""
     # Ensure output path ends with .mov
     if not output_path.endswith('.mov'):
         output_path = output_path.rsplit('.', 1)[0] + '.mov'
     
-    # Create video writer with PNG codec for MOV container
-    # This preserves image quality better for steganography
     fourcc = cv2.VideoWriter_fourcc(*'png ')  # PNG codec with MOV container
-    out = cv2.VideoWriter(output_path, fourcc, fps, (width, height))
-    
-    # Add frames to video
-    for frame_path in frames:
-        frame = cv2.imread(frame_path)
-        if frame is not None:
+    out = cv2.VideoWriter(output_path, fourcc, fps, frame_size)
+    try:
+        for _, frame in frames:
             out.write(frame)
+    finally:
+        out.release()
     
-    out.release()
     print(f"[INFO] Created output video: {output_path}")
     return output_path
 
-def decode_video(video_path, temp_dir):
-    """Decode hidden text from video"""
-    # Create a temporary directory similar to the original code
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    # Extract frames using OpenCV directly
-    cap = cv2.VideoCapture(video_path)
-    number_of_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    print(f"[INFO] Video has {number_of_frames} frames")
-    
-    # Check for data in borders first
-    border_data = extract_border_data(video_path, temp_dir)
-    if border_data:
-        print(f"[INFO] Extracted data from borders: {border_data[:30]}...")
-    
-    # First check if there's a metadata frame by looking at the last frames
-    metadata_frame_numbers = []
+def pipe_frames(frames, output_path, fps, frame_size, profile=None, audio_source=None):
+    """Consume a frame stream and encode it with a single ffmpeg process"""
+    width, height = frame_size
+    with FFmpegWriter(output_path, width, height, fps, profile=profile or OUTPUT_PROFILE,
+                      audio_source=audio_source) as writer:
+        for _, frame in frames:
+            writer.write(frame)
+    return output_path
+
+def track_progress(frames, progress, stage, total=None):
+    """Pass frames through unchanged, reporting how many have gone by"""
+    if progress is None:
+        yield from frames
+        return
+    done = 0
+    for item in frames:
+        yield item
+        done += 1
+        progress(stage, done, total)
+
+def encode_video(video_path, text, encrypted_text, output_path, profile=None, progress=None):
+    """Run the full border + LSB pipeline from decoder to encoder without touching disk
+    
+    Frames flow through generators, so only the frames currently being processed
+    (plus the copy of frame 0 kept for the metadata frame) are held in memory.
+    The encoder muxes the audio of the original upload in the same pass.
+    With ENCODE_MODE "smart" only the GOPs holding the payload are re-encoded.
+    """
+    if ENCODE_MODE == 'smart':
+        try:
+            return encode_video_smart(video_path, text, encrypted_text, output_path,
+                                      profile=profile, progress=progress)
+        except SmartRenderUnavailable as e:
+            print(f"[WARNING] Smart encode unavailable, re-encoding every frame: {e}")
+    
+    info = probe_video(video_path)
+    return encode_stream(read_frames(video_path), info, text, encrypted_text, output_path,
+                         profile=profile, progress=progress, audio_source=video_path)
+
+def encode_stream(frames, info, text, encrypted_text, output_path, profile=None, progress=None,
+                  audio_source=None):
+    """Border + LSB pipeline over any (index, frame) stream; returns (output_path, frame_numbers)
+    
+    info needs fps, width, height and a frame_count, which may be an estimate.
+    Decoding, border/LSB and encoding run on their own threads (see
+    PIPELINE_QUEUE), so the request takes about as long as the slowest one.
+    """
+    total_frames = max(info["frame_count"], 1)
+    profile = profile or OUTPUT_PROFILE
+    output_path = output_path_for(output_path, profile)
+    
+    frame_numbers = []
+    clock = StageClock()
+    with StagedExecutor(PIPELINE_QUEUE) as stages:
+        frames = clock.tap(frames, "decode")
+        frames = track_progress(frames, progress, "decode", total_frames)
+        frames = clock.boundary(stages.stage("decode", frames))
+        frames = clock.tap(border_stage(frames, text, total_frames, marked=border_marker(encrypted_text)),
+                           "border")
+        frames = track_progress(frames, progress, "border", total_frames)
+        frames = clock.tap(lsb_stage(frames, encrypted_text, frame_numbers), "lsb")
+        frames = clock.boundary(stages.stage("embed", frames))
+        # The encoder also receives the appended metadata frame
+        frames = track_progress(frames, progress, "encode", total_frames + 1)
+        start = time.perf_counter()
+        pipe_frames(frames, output_path, info["fps"], (info["width"], info["height"]),
+                    profile=profile, audio_source=audio_source)
+        clock.observe(time.perf_counter() - start, final_stage="encode")
+    log_stages(stages)
+    
+    return output_path, frame_numbers
+
+def log_stages(stages):
+    if stages.stats:
+        print(f"[INFO] Pipeline queues: {stages.summary()}")
+
+def encode_video_smart(video_path, text, encrypted_text, output_path, profile=None, progress=None):
+    """Re-encode only the GOPs that need new pixels and stream-copy the rest
+    
+    The leading GOPs holding payload frames are re-encoded, and so is the last
+    GOP, which the metadata frame is appended to (a lone frame after the
+    copied GOPs would break their timestamps). They are encoded at the
+    source's profile and level so the joined track stays uniform. Returns
+    (output_path, frame_numbers) like encode_video. Raises
+    SmartRenderUnavailable if the upload can't be split into GOPs that match
+    the output profile.
+    """
+    info = probe_video(video_path)
+    total_frames = max(info["frame_count"], 1)
+    profile = profile or OUTPUT_PROFILE
+    output_path = output_path_for(output_path, profile)
+    work_dir = tempfile.mkdtemp(prefix='gops-', dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        start = time.perf_counter()
+        with stage_timer("split"):
+            segments = split_gops(video_path, work_dir, OUTPUT_PROFILES[profile]['pix_fmt'])
+        encoder_args = matching_encoder_args(segments[0])
+        payload_end = PAYLOAD_START + payload_frame_count(encrypted_text)
+        
+        split = {"head_segments": 0, "head_frames": 0, "tail_start": None}
+        def rendered_frames():
+            # Whole GOPs from the start until the header and payload frames are covered
+            for segment in segments:
+                if split["head_frames"] >= payload_end:
+                    break
+                for _, frame in read_frames(segment):
+                    index = split["head_frames"]
+                    split["head_frames"] += 1
+                    yield index, frame
+                split["head_segments"] += 1
+            if split["head_segments"] == len(segments):
+                return
+            
+            # Then the last GOP, numbered from the end of the video
+            tail = segments[-1]
+            first = max(total_frames - probe_video(tail)["frame_count"], split["head_frames"])
+            split["tail_start"] = first
+            for offset, (_, frame) in enumerate(read_frames(tail)):
+                yield first + offset, frame
+        
+        frame_numbers = []
+        clock = StageClock()
+        stages = StagedExecutor(PIPELINE_QUEUE)
+        frames = clock.tap(rendered_frames(), "decode")
+        frames = clock.boundary(stages.stage("decode", frames))
+        frames = clock.tap(border_stage(frames, text, total_frames, marked=border_marker(encrypted_text)),
+                           "border")
+        frames = clock.tap(lsb_stage(frames, encrypted_text, frame_numbers), "lsb")
+        frames = clock.boundary(stages.stage("embed", frames))
+        frames = track_progress(frames, progress, "encode")
+        
+        head_path = os.path.join(work_dir, 'head.mp4')
+        tail_path = os.path.join(work_dir, 'tail.mp4')
+        size = (info["width"], info["height"])
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(stages)
+            head_writer = stack.enter_context(FFmpegWriter(head_path, *size, info["fps"], profile=profile,
+                                                           video_args=encoder_args))
+            tail_writer = None
+            for i, frame in frames:
+                if split["tail_start"] is None or i < split["tail_start"]:
+                    head_writer.write(frame)
+                    continue
+                if tail_writer is None:
+                    tail_writer = stack.enter_context(FFmpegWriter(tail_path, *size, info["fps"],
+                                                                   profile=profile, video_args=encoder_args))
+                tail_writer.write(frame)
+        
+        log_stages(stages)
+        rendered = head_writer.frames_written
+        copied = []
+        if tail_writer is not None:
+            rendered += tail_writer.frames_written
+            copied = segments[split["head_segments"]:-1]
+        print(f"[INFO] Re-encoded {rendered} frames, copying {len(copied)} of {len(segments)} GOPs")
+        parts = [head_path] + copied + ([tail_path] if tail_writer is not None else [])
+        if copied:
+            for path in (head_path, tail_path):
+                check_matches(path, copied[0])
+        concat_segments(parts, video_path, output_path)
+        clock.observe(time.perf_counter() - start, final_stage="encode")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
     
-    # Check the last 5 frames for metadata
+    return output_path, frame_numbers
+
+# Frame sampling used by the decoders
+BORDER_SAMPLES = 10
+# Border samples are read this many at a time, frames 0-2 first: they carry
+# the border payload at three different rotations, so they usually settle it
+BORDER_BATCH = 3
+# Frames that must agree with the majority vote before sampling stops
+BORDER_CONFIRMATIONS = int(os.environ.get('STEGO_BORDER_CONFIRMATIONS', 3))
+BORDER_SAMPLED = metrics.registry.register(metrics.Histogram(
+    'stego_border_frames_sampled', 'Frames read per border extraction',
+    buckets=(1, 2, 3, 4, 6, 8, 10, 15)))
+BORDER_CONFIDENCE = metrics.registry.register(metrics.Histogram(
+    'stego_border_vote_confidence', 'Share of sampled border bits agreeing with the majority vote',
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99, 1.0)))
+METADATA_CANDIDATES = 5
+FALLBACK_PAYLOAD_FRAMES = 15
+
+def border_sample_indices(frame_count):
+    """Frames sampled throughout the video for border extraction"""
+    samples = min(BORDER_SAMPLES, frame_count)  # Use fewer samples for quicker processing
+    return [int(i * frame_count / samples) for i in range(samples)]
+
+def border_candidates(frame_count):
+    """Frames the adaptive border sampler may read, in the order it reads them"""
+    first = list(range(min(BORDER_BATCH, frame_count)))
+    return first + [i for i in border_sample_indices(frame_count) if i not in first]
+
+def plan_decode(frame_count):
+    """Gather every frame index any decoder needs so they can be read in one pass
+    
+    Only the first batch of border candidates is read up front; the border
+    sampler reads the others if it needs them.
+    """
+    return {
+        "border": border_candidates(frame_count),
+        # The metadata frame is appended at the end of the video
+        "metadata": list(range(max(0, frame_count - METADATA_CANDIDATES), frame_count)),
+        # Payload frames come first; without metadata we check the first 15
+        "payload": list(range(min(FALLBACK_PAYLOAD_FRAMES, frame_count))),
+    }
+
+def header_plan(frame, frame_count):
+    """Decode plan from the header in frame 0: exactly the payload frames, no tail scan
+    
+    Returns None for videos without a header (made before it existed), which
+    then go through plan_decode and the metadata frame.
+    """
+    header = read_header(frame)
+    if header is None:
+        return None
+    payload = [i for i in header["frames"] if i < frame_count]
+    print(f"[INFO] Found v{header['version']} {header['scheme']} header: payload in frames {payload}")
+    return {
+        "scheme": header["scheme"],
+        # The header and payload frames carry a border whatever BORDER_FRAMES was
+        "border": [HEADER_FRAME] + payload,
+        "metadata": [],
+        "payload": payload,
+        "payload_length": header["payload_length"],
+    }
+
+def read_frames_at(video_path, indices):
+    """Read the requested frames in a single ordered pass over the video"""
+    with FrameReader(video_path) as reader:
+        return reader.read(indices)
+
+def find_metadata_frame_numbers(frames, candidates):
+    """Look for the metadata frame among the candidate frames"""
     print("[INFO] Looking for metadata frame...")
-    for frame_index in range(max(0, number_of_frames - 5), number_of_frames):
-        # Jump to frame
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
-        ret, frame = cap.read()
-        if not ret:
+    for frame_index in candidates:
+        frame = frames.get(frame_index)
+        if frame is None:
             continue
-            
-        # Save frame and try to decode it
-        metadata_frame_path = os.path.join(temp_dir, f"metadata_check_{frame_index}.png")
-        cv2.imwrite(metadata_frame_path, frame)
         
         try:
-            metadata_content = lsb.reveal(metadata_frame_path)
+            metadata_content = reveal_array(frame)
             if metadata_content and ',' in metadata_content:
                 # This looks like our metadata frame
                 print(f"[INFO] Found potential metadata at frame {frame_index}: {metadata_content}")
                 try:
                     # Try to parse the frame numbers
                     frame_nums = [int(num) for num in metadata_content.split(',')]
-                    metadata_frame_numbers = frame_nums
                     print(f"[INFO] Using frame numbers from metadata: {frame_nums}")
-                    break
+                    return frame_nums
                 except:
                     print(f"[INFO] Failed to parse metadata numbers: {metadata_content}")
         except Exception as e:
             pass
-    
-    # Reset the video capture
-    cap.release()
-    cap = cv2.VideoCapture(video_path)
-    
-    # Frames to check - either from metadata or first 15 frames if no metadata
-    frames_to_check = metadata_frame_numbers if metadata_frame_numbers else list(range(15))
+    return []
+
+def reveal_payload(frames, frames_to_check, number_of_frames):
+    """Reveal and concatenate the hidden text parts from the payload frames"""
     print(f"[INFO] Will check these frames: {frames_to_check}")
-    
-    # Process frames - using targeted frame extraction if metadata is available
     decoded = {}
     
     for frame_number in frames_to_check:
         if frame_number >= number_of_frames:
             print(f"[WARNING] Frame number {frame_number} exceeds video length")
             continue
-            
-        # Jump to the specific frame
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-        ret, frame = cap.read()
-        if not ret:
-            print(f"[ERROR] Could not read frame {frame_number}")
-            continue
         
-        encoded_frame_file_name = os.path.join(temp_dir, f"{frame_number}-enc.png")
-        cv2.imwrite(encoded_frame_file_name, frame)
+        frame = frames.get(frame_number)
+        if frame is None:
+            continue
         
         # Try to decode the frame
         try:
-            clear_message = lsb.reveal(encoded_frame_file_name)
+            clear_message = reveal_array(frame)
             if clear_message:
                 decoded[frame_number] = clear_message
                 print(f"Frame {frame_number} DECODED: {clear_message}")
         except Exception as e:
             print(f"Error decoding frame {frame_number}: {e}")
     
-    # Arrange and decrypt the message
+    # Arrange the message parts in frame order
     res = ""
     for fn in sorted(decoded.keys()):
         res += decoded[fn]
+    return res
+
+def payload_scheme(frames, frames_to_check):
+    """Tell erasure shards from plain parts when there is no header to say"""
+    for frame_number in frames_to_check:
+        frame = frames.get(frame_number)
+        if frame is not None and parse_shard(reveal_bytes(frame)) is not None:
+            return 'rsa-erasure'
+    return 'rsa-base64'
+
+def reveal_erasure_payload(frames, frames_to_check, number_of_frames, read_missing):
+    """Rebuild an erasure-coded payload from the first k intact shard frames
+    
+    Frames already decoded are tried first; the others are only read if
+    those didn't hold enough intact shards.
+    """
+    collector = ShardCollector()
+    def collect(indices):
+        for frame_number in indices:
+            frame = frames.get(frame_number)
+            if frame is not None and not collector.add(reveal_bytes(frame)):
+                print(f"[WARNING] Frame {frame_number} holds no intact shard")
+            if collector.needed == 0:
+                return True
+        return False
     
+    if not collect([i for i in frames_to_check if i in frames]):
+        missing = [i for i in frames_to_check if i not in frames and i < number_of_frames]
+        if missing:
+            with stage_timer("decode", len(missing)):
+                frames.update(read_missing(missing))
+            collect(missing)
+    
+    payload = collector.payload()
+    if payload is None:
+        print(f"[WARNING] Only {len(collector.shards)} intact shards, {collector.needed} more needed")
+        return ""
+    print(f"[INFO] Rebuilt payload from shards {sorted(i + 1 for i in collector.shards)}")
+    return payload.decode('utf-8', 'replace')
+
+def decrypt_payload(res, border_data):
+    """Decrypt the revealed payload, falling back to the border data"""
     if not res:
         return border_data if border_data else None  # If no steganography data found, return border data
     
@@ -388,6 +721,94 @@ def decode_video(video_path, temp_dir):
             return border_data
         return res  # Otherwise return the encoded message
 
+def decode_video_single_pass(video_path, progress=None):
+    """Extract border data and decode hidden text, reading each needed frame once
+    
+    Returns a (border_data, decrypted_text) tuple. Every frame index the border,
+    metadata and payload decoders might need is read in one ordered pass and the
+    same decoded frame is shared between them.
+    """
+    with FrameReader(video_path) as reader:
+        return _decode_with_reader(reader, progress)
+
+def _decode_with_reader(reader, progress=None):
+    number_of_frames = reader.frame_count
+    print(f"[INFO] Video has {number_of_frames} frames")
+    
+    plan = header_plan(reader.get(HEADER_FRAME), number_of_frames) or plan_decode(number_of_frames)
+    wanted = set(plan["border"][:BORDER_BATCH] + plan["metadata"] + plan["payload"])
+    # Frames only sampled for the border are cut down to their corners as they arrive
+    corners_only = set(plan["border"]) - set(plan["metadata"]) - set(plan["payload"])
+    # Erasure-coded payloads are complete after any k intact shards, so
+    # reading stops there once the first border batch is in too
+    shards = ShardCollector() if plan.get("scheme") == 'rsa-erasure' else None
+    first_border = set(plan["border"][:BORDER_BATCH])
+    frames = {}
+    start = time.perf_counter()
+    for i, frame in track_progress(reader.iter_frames(wanted), progress, "decode", len(wanted)):
+        frames[i] = corner_strip(frame) if i in corners_only else frame
+        if shards is not None and i in plan["payload"]:
+            shards.add(reveal_bytes(frame))
+            if shards.needed == 0 and first_border <= frames.keys():
+                if len(frames) < len(wanted):
+                    print(f"[INFO] Stopped reading after {len(frames)} of {len(wanted)} frames")
+                break
+    metrics.observe_stage("decode", time.perf_counter() - start, len(frames))
+    
+    return decode_planned_frames(frames, plan, number_of_frames, reader.read, progress)
+
+def decode_planned_frames(frames, plan, number_of_frames, read_missing, progress=None):
+    """Run the border, metadata and payload decoders over already decoded frames
+    
+    frames maps indices to frames for everything in plan; read_missing(indices)
+    returns a dict of any other frames the metadata points at.
+    """
+    # Border data, reading more samples only while the frames don't agree
+    def read_border(indices):
+        found = {i: frames[i] for i in indices if i in frames}
+        missing = [i for i in indices if i not in frames and i < number_of_frames]
+        if missing:
+            found.update(read_missing(missing))
+        return found
+    
+    frame_size = max((frame.shape[1], frame.shape[0]) for frame in frames.values()) if frames else (0, 0)
+    with stage_timer("border_decode"):
+        border_data, _ = split_border_tag(sample_border_data(read_border, plan["border"], frame_size))
+    if border_data:
+        print(f"[INFO] Extracted data from borders: {border_data[:30]}...")
+    
+    # Frames to check - either from metadata or first 15 frames if no metadata
+    metadata_frame_numbers = find_metadata_frame_numbers(frames, plan["metadata"])
+    frames_to_check = metadata_frame_numbers if metadata_frame_numbers else plan["payload"]
+    scheme = plan.get("scheme") or payload_scheme(frames, frames_to_check)
+    
+    if scheme == 'rsa-erasure':
+        with stage_timer("lsb_reveal", len(frames_to_check)):
+            res = reveal_erasure_payload(frames, frames_to_check, number_of_frames, read_missing)
+    else:
+        # Metadata normally points inside the frames already read, but read any stragglers
+        missing = [i for i in frames_to_check if i not in frames and i < number_of_frames]
+        if missing:
+            with stage_timer("decode", len(missing)):
+                frames.update(read_missing(missing))
+        
+        with stage_timer("lsb_reveal", len(frames_to_check)):
+            res = reveal_payload(frames, frames_to_check, number_of_frames)
+    if "payload_length" in plan and len(res) != plan["payload_length"]:
+        print(f"[WARNING] Revealed {len(res)} of {plan['payload_length']} payload characters")
+    if progress is not None:
+        progress("decrypt", 0, 1)
+    with stage_timer("decrypt"):
+        decrypted_text = decrypt_payload(res, border_data)
+    if progress is not None:
+        progress("decrypt", 1, 1)
+    return border_data, decrypted_text
+
+def decode_video(video_path, temp_dir=None):
+    """Decode hidden text from video"""
+    _, decrypted_text = decode_video_single_pass(video_path)
+    return decrypted_text
+
 def text_to_binary(text):
     """Convert text to binary string"""
     if isinstance(text, str):
@@ -423,139 +844,7 @@ def create_data_border(frame, data, frame_index, total_frames, border_width=20):
     """Create border that encodes data in the top-left corner while adding decorative elements elsewhere"""
     # Make a copy to avoid modifying the original
     bordered_frame = frame.copy()
-    height, width = bordered_frame.shape[:2]
-    
-    # Convert data to binary
-    binary_data = text_to_binary(data)
-    
-    # Calculate which portion of the data to encode in this frame
-    bits_per_frame = min(len(binary_data), (2 * (width + height) - 4 * border_width) // 2)
-    start_index = (frame_index * bits_per_frame // 3) % len(binary_data)  # Overlap by 2/3 for redundancy
-    
-    # Extract the portion of data for this frame
-    frame_data = binary_data[start_index:start_index + bits_per_frame]
-    if len(frame_data) < bits_per_frame:
-        frame_data += binary_data[:bits_per_frame - len(frame_data)]  # Wrap around
-    
-    # Generate colors for 0 and 1 bits
-    # Use frame index to create subtle color variations between frames
-    hue_shift = (frame_index / total_frames) * 0.3  # Shift hue by up to 0.3
-    
-    # Color for '0' bit - dark blue to purple range
-    zero_hue = (0.6 + hue_shift) % 1.0
-    zero_color = tuple(int(x * 255) for x in colorsys.hsv_to_rgb(zero_hue, 0.7, 0.4))
-    zero_color = (zero_color[2], zero_color[1], zero_color[0])  # Convert to BGR
-    
-    # Color for '1' bit - orange to red range
-    one_hue = (0.05 + hue_shift) % 1.0
-    one_color = tuple(int(x * 255) for x in colorsys.hsv_to_rgb(one_hue, 0.9, 0.7))
-    one_color = (one_color[2], one_color[1], one_color[0])  # Convert to BGR
-    
-    # Calculate the corner size
-    corner_size = border_width * 2
-    
-    # KEEP EXISTING TOP-LEFT CORNER ENCODING (DON'T MODIFY THIS PART)
-    # Encode data in the top-left corner only
-    data_pos = 0
-    segment_width = 2  # Each bit takes 2 pixels width
-    
-    # Top-left corner area
-    for y in range(corner_size):
-        for x in range(corner_size):
-            if data_pos < len(frame_data):
-                bit = int(frame_data[data_pos])
-                color = one_color if bit else zero_color
-                bordered_frame[y, x] = color
-                data_pos += 1
-    
-    # ADD DECORATIVE CORNERS TO THE OTHER THREE CORNERS
-    # These won't contain actual data but will help with corner detection
-    
-    # Top-right corner (decorative)
-    tr_color = (30, 180, 30)  # Green
-    cv2.rectangle(bordered_frame, (width - corner_size, 0), (width, corner_size), tr_color, -1)
-    # Add diagonal lines for a distinctive pattern
-    for i in range(0, corner_size, 4):
-        cv2.line(bordered_frame, (width - corner_size, i), (width - corner_size + i, 0), (255, 255, 255), 1)
-    
-    # Bottom-left corner (decorative)
-    bl_color = (180, 30, 30)  # Blue
-    cv2.rectangle(bordered_frame, (0, height - corner_size), (corner_size, height), bl_color, -1)
-    # Add circular pattern
-    cv2.circle(bordered_frame, (corner_size // 2, height - corner_size // 2), 
-               corner_size // 3, (255, 255, 255), 2)
-    
-    # Bottom-right corner (decorative)
-    br_color = (180, 180, 30)  # Cyan
-    cv2.rectangle(bordered_frame, (width - corner_size, height - corner_size), (width, height), br_color, -1)
-    # Add square pattern
-    cv2.rectangle(bordered_frame, (width - corner_size + 5, height - corner_size + 5), 
-                 (width - 5, height - 5), (255, 255, 255), 2)
-    
-    # ADD TRANSLUCENT DECORATIVE ELEMENTS TO THE REST OF THE BORDER
-    # This makes it look like there's data without actually encoding anything
-    
-    # Create a border overlay for translucent effects
-    border_overlay = bordered_frame.copy()
-    
-    # Top border (excluding corners)
-    for x in range(corner_size, width - corner_size, segment_width * 2):
-        # Random-looking pattern based on position and frame
-        pattern_value = (x + frame_index) % 8  
-        if pattern_value < 4:  # Create alternating pattern
-            color = (30 + pattern_value * 20, 30 + pattern_value * 10, 150 - pattern_value * 10)
-            cv2.rectangle(border_overlay, (x, 0), (x + segment_width * 2 - 1, border_width - 1), color, -1)
-    
-    # Right border (excluding corners)
-    for y in range(corner_size, height - corner_size, segment_width * 2):
-        pattern_value = (y + frame_index) % 8
-        if pattern_value < 4:
-            color = (30 + pattern_value * 10, 150 - pattern_value * 10, 30 + pattern_value * 20)
-            cv2.rectangle(border_overlay, (width - border_width, y), 
-                         (width - 1, y + segment_width * 2 - 1), color, -1)
-    
-    # Bottom border (excluding corners)
-    for x in range(width - corner_size, corner_size, -(segment_width * 2)):
-        pattern_value = (x + frame_index) % 8
-        if pattern_value < 4:
-            color = (150 - pattern_value * 10, 30 + pattern_value * 10, 30 + pattern_value * 20)
-            cv2.rectangle(border_overlay, (x - segment_width * 2 + 1, height - border_width), 
-                         (x, height - 1), color, -1)
-    
-    # Left border (excluding corners)
-    for y in range(height - corner_size, corner_size, -(segment_width * 2)):
-        pattern_value = (y + frame_index) % 8
-        if pattern_value < 4:
-            color = (30 + pattern_value * 20, 150 - pattern_value * 10, 30 + pattern_value * 10)
-            cv2.rectangle(border_overlay, (0, y - segment_width * 2 + 1), 
-                         (border_width - 1, y), color, -1)
-    
-    # Blend the overlay with the original frame for translucent effect
-    alpha = 0.6  # Translucency level (0.0 to 1.0)
-    # Apply the translucent border overlay to the bordered frame
-    # But preserve the top-left corner which contains actual data
-    
-    # Top border (excluding corners)
-    mask = np.zeros_like(bordered_frame, dtype=bool)
-    mask[0:border_width, corner_size:width-corner_size] = True
-    bordered_frame[mask] = cv2.addWeighted(bordered_frame, 1-alpha, border_overlay, alpha, 0)[mask]
-    
-    # Right border (excluding corners)
-    mask = np.zeros_like(bordered_frame, dtype=bool)
-    mask[corner_size:height-corner_size, width-border_width:width] = True
-    bordered_frame[mask] = cv2.addWeighted(bordered_frame, 1-alpha, border_overlay, alpha, 0)[mask]
-    
-    # Bottom border (excluding corners)
-    mask = np.zeros_like(bordered_frame, dtype=bool)
-    mask[height-border_width:height, corner_size:width-corner_size] = True
-    bordered_frame[mask] = cv2.addWeighted(bordered_frame, 1-alpha, border_overlay, alpha, 0)[mask]
-    
-    # Left border (excluding corners)
-    mask = np.zeros_like(bordered_frame, dtype=bool)
-    mask[corner_size:height-corner_size, 0:border_width] = True
-    bordered_frame[mask] = cv2.addWeighted(bordered_frame, 1-alpha, border_overlay, alpha, 0)[mask]
-    
-    return bordered_frame
+    return apply_data_border(bordered_frame, text_bits(data), frame_index, total_frames, border_width)
 
 def create_data_corners(frame, frame_index, total_frames, border_width=20):
     """Create corners that encode frame information"""
@@ -617,76 +906,9 @@ def create_data_corners(frame, frame_index, total_frames, border_width=20):
     
     return frame
 
-def add_data_border_to_frames(frames, data, temp_dir):
-    """Add data-encoding border to all frames"""
-    bordered_frames = []
-    
-    # Set a reasonable border width
-    border_width = 20
-    
-    # Get total frame count
-    total_frames = len(frames)
-    
-    # Prepare the data to encode with STEGO marker
-    full_data = f"STEGO:{data}"
-    print(f"[INFO] Encoding data in border: {full_data[:50]}...")
-    
-    # Process each frame
-    for i, frame_path in enumerate(frames):
-        # Read frame
-        frame = cv2.imread(frame_path)
-        if frame is None:
-            continue
-        
-        # Create border with encoded data in top-left corner only
-        bordered_frame = create_data_border(frame, full_data, i, total_frames, border_width)
-        
-        # Save the bordered frame
-        bordered_path = os.path.join(temp_dir, f"bordered_{i}.png")
-        cv2.imwrite(bordered_path, bordered_frame)
-        bordered_frames.append(bordered_path)
-        
-        # Log progress
-        if i % 10 == 0:
-            print(f"[INFO] Added data border to frame {i}/{total_frames}")
-    
-    print(f"[INFO] Added data borders to all {len(bordered_frames)} frames")
-    return bordered_frames
 def detect_border_in_frame(frame):
     """Detect if a frame has our specific encoding pattern in the top-left corner"""
-    # Get frame dimensions
-    height, width = frame.shape[:2]
-    border_width = 20
-    corner_size = border_width * 2
-    
-    # Check if corners exist
-    if width < corner_size or height < corner_size:
-        return False
-    
-    # Extract the top-left corner
-    top_left = frame[0:corner_size, 0:corner_size]
-    
-    # Check for distinctive color patterns specific to our encoding
-    avg_colors = np.mean(top_left, axis=(0, 1))
-    color_std = np.std(top_left, axis=(0, 1))
-    
-    # Our encoding should have:
-    # 1. Significant color variance (mix of 0 and 1 bits)
-    # 2. Strong red or blue components (our bit colors)
-    high_variance = np.mean(color_std) > 50
-    strong_color = np.max(avg_colors) > 100
-    
-    # Also check for the presence of other corner markers
-    # Top-right corner should be green
-    if width >= corner_size*2:
-        top_right = frame[0:corner_size, width-corner_size:width]
-        tr_color = np.mean(top_right, axis=(0, 1))
-        tr_green = tr_color[1] > tr_color[0] + 30 and tr_color[1] > tr_color[2] + 30
-    else:
-        tr_green = False
-    
-    # Either the top-left corner looks like our encoding or we also have the top-right marker
-    return (high_variance and strong_color) or tr_green
+    return bool(detect_borders([frame])[0])
 
 def decode_corner_data(frame):
     """Decode frame index and total frames from corner markers"""
@@ -759,69 +981,28 @@ def decode_corner_data(frame):
 
 def decode_border_data(frame, border_width=20):
     """Decode data from the top-left corner only, since that's where we encode it"""
-    # Get frame dimensions
     height, width = frame.shape[:2]
     corner_size = border_width * 2
-    
-    # Make sure the frame is large enough
     if width < corner_size or height < corner_size:
         return None
-    
-    # Extract the top-left corner
-    top_left = frame[0:corner_size, 0:corner_size]
-    
-    # Function to determine if a pixel is likely a '1' bit based on color
-    def is_one_bit(pixel):
-        # Simple RGB check - typically our 1-bits are orange/red
-        # which have high red values compared to blue
-        return pixel[2] > pixel[0] + 20
-    
-    # Extract bits from the top-left corner, row by row
-    extracted_bits = ""
-    for y in range(corner_size):
-        for x in range(corner_size):
-            pixel = top_left[y, x]
-            extracted_bits += '1' if is_one_bit(pixel) else '0'
-    
-    # Convert binary data to text
-    print(f"[INFO] Extracted {len(extracted_bits)} bits from corner")
-    extracted_text = binary_to_text(extracted_bits)
-    return extracted_text
+    return printable_text(decode_border_bytes([frame], border_width)[0])
 
-def extract_border_data(video_path, temp_dir):
-    """Extract data from the top-left corner of frames"""
-    # Create a temporary directory
-    if not os.path.exists(temp_dir):
-        os.makedirs(temp_dir)
-    
-    cap = cv2.VideoCapture(video_path)
-    frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    
-    # Sample frames throughout the video
-    samples = min(10, frame_count)  # Use fewer samples for quicker processing
-    sample_indices = [int(i * frame_count / samples) for i in range(samples)]
-    
-    print(f"[INFO] Sampling {samples} frames to extract border data")
-    
-    # Collect raw frame data
-    raw_frames = []
-    for frame_idx in sample_indices:
-        cap.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
-        ret, frame = cap.read()
-        if ret:
-            # Check if the frame has our border encoding
-            if detect_border_in_frame(frame):
-                raw_frames.append((frame_idx, frame))
-    
-    cap.release()
+def decode_border_frames(sampled_frames):
+    """Extract data from the top-left corner of already decoded (index, frame) pairs"""
+    # Keep only frames that have our border encoding (checked for all frames at once)
+    sampled_frames = list(sampled_frames)
+    detected = detect_borders([frame for _, frame in sampled_frames])
+    raw_frames = [pair for pair, found in zip(sampled_frames, detected) if found]
     
     if not raw_frames:
         return "No frames with border encoding found"
     
-    # Extract texts from each frame
+    # Threshold and pack the bits of every detected frame in one go
+    decoded = decode_border_bytes([frame for _, frame in raw_frames])
+    print(f"[INFO] Extracted border bits from {len(decoded)} frames")
     frame_texts = []
-    for idx, frame in raw_frames:
-        text = decode_border_data(frame)
+    for (idx, _), data in zip(raw_frames, decoded):
+        text = printable_text(data)
         if text:
             frame_texts.append((idx, text))
             print(f"[INFO] Frame {idx}: {text[:30]}...")
@@ -853,8 +1034,139 @@ def extract_border_data(video_path, temp_dir):
     return clean_combined
 
 
+def border_tag_status(border_data):
+    """True or False when the border text's integrity tag does or doesn't check out, None without a tag"""
+    text, tag = split_border_tag(border_data)
+    if tag is None:
+        return None
+    return key_manager.check_tag(text.encode('ascii'), tag)
+
+def sample_border_data(read, candidates, frame_size, border_width=20):
+    """Read border samples in batches until the majority vote over them checks out
+    
+    read(indices) returns {index: frame} for the candidates it could read.
+    The payload is majority-voted over the frames carrying a border. A tagged
+    vote is accepted as soon as its tag checks out and never before; an
+    untagged one (older or tiny videos) once it starts with an intact
+    "STEGO:" and BORDER_CONFIRMATIONS frames agree with the others
+    leave-one-out. Otherwise the vote over every candidate is
+    used, and failing that the fragment heuristic of decode_border_frames.
+    """
+    width, height = frame_size
+    sampled = []
+    indices, bits = [], []
+    vote = None
+    tag_ok = None
+    for start in range(0, len(candidates), BORDER_BATCH):
+        batch_indices = candidates[start:start + BORDER_BATCH]
+        batch = read(batch_indices)
+        pairs = [(i, batch[i]) for i in batch_indices if batch.get(i) is not None]
+        sampled += pairs
+        
+        detected = detect_borders([frame for _, frame in pairs], border_width)
+        found = [pair for pair, ok in zip(pairs, detected) if ok]
+        if found:
+            top_left, _ = stack_corners([frame for _, frame in found], border_width)
+            bits.append(decode_corner_bits(top_left))
+            indices += [i for i, _ in found]
+        if len(indices) < 2:
+            continue
+        vote = vote_border_payload(np.concatenate(bits), indices, width, height, border_width)
+        if vote is None:
+            continue
+        text = printable_text(vote["data"])
+        tag_ok = border_tag_status(text)
+        # Without a tag the known "STEGO:" marker is the only check of the bits
+        if tag_ok or (tag_ok is None and text.startswith("STEGO:")
+                      and vote["agreeing"] >= BORDER_CONFIRMATIONS):
+            break
+    
+    BORDER_SAMPLED.observe(len(sampled))
+    if vote is not None:
+        BORDER_CONFIDENCE.observe(vote["confidence"])
+        tag_note = {True: "tag checks out", False: "tag doesn't match", None: "untagged"}[tag_ok]
+        print(f"[INFO] Border payload voted from {vote['frames']} frames ({vote['agreeing']} confirming, "
+              f"{tag_note}), confidence {vote['confidence']:.3f}, {len(sampled)} frames read")
+        return printable_text(vote["data"])
+    
+    print(f"[INFO] No border vote after {len(sampled)} frames, falling back to fragment search")
+    return decode_border_frames(sampled)
+
+def extract_border_data(video_path, temp_dir=None):
+    """Extract data from the top-left corner of frames"""
+    info = probe_video(video_path)
+    candidates = border_candidates(info["frame_count"])
+    
+    with CornerReader(video_path, candidates if BORDER_DECODE == 'corners' else [],
+                      info["width"], info["height"]) as corners:
+        def read(indices):
+            frames = corners.read(indices)
+            if frames is None:
+                frames = read_frames_at(video_path, indices)
+            return frames
+        
+        border_data, _ = split_border_tag(sample_border_data(read, candidates, (info["width"], info["height"])))
+    return border_data
+
+def verify_video(video_path):
+    """Check the border data against its integrity tag without decrypting anything
+    
+    Only a few border frames are decoded: the header and payload frames
+    listed in frame 0 when its header survived encoding, otherwise the first
+    border candidates. Returns {"valid", "id", "border_data", "reason"}.
+    """
+    with FrameReader(video_path) as reader:
+        header = read_header(reader.get(HEADER_FRAME))
+        if header is not None:
+            candidates = [HEADER_FRAME] + [i for i in header["frames"] if i < reader.frame_count]
+        else:
+            candidates = border_candidates(reader.frame_count)
+        with stage_timer("border_decode"):
+            border_data = sample_border_data(
+                lambda indices: {i: corner_strip(frame) for i, frame in reader.read(indices).items()},
+                candidates, (reader.width, reader.height))
+    
+    text, tag = split_border_tag(border_data)
+    result = {"valid": False, "border_data": text}
+    if not text or not text.startswith("STEGO:"):
+        result["reason"] = "No STEGO: marker in the border"
+    elif tag is None:
+        result["reason"] = "No integrity tag in the border (video predates /verify or is too small for one)"
+    elif not key_manager.check_tag(text.encode('ascii'), tag):
+        result["reason"] = "Integrity tag doesn't match the border data"
+    else:
+        result.update(valid=True, id=text[len("STEGO:"):])
+    return result
+
+
+def wants_binary_response(form=None):
+    """Whether the client asked for the raw MP4 instead of base64 inside JSON"""
+    form = request.form if form is None else form
+    mode = request.args.get('response') or form.get('response')
+    if mode:
+        return mode == 'binary'
+    return request.accept_mimetypes.best_match(['application/json', 'video/mp4']) == 'video/mp4'
+
+def send_result(result_id):
+    """Stream a stored result with Range support and its metadata in headers"""
+    result = result_store.get(result_id)
+    if result is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+    path, metadata = result
+    
+    response = send_file(path, mimetype='video/mp4', as_attachment=True,
+                         download_name=metadata["filename"], conditional=True)
+    response.headers['X-Result-Id'] = metadata["result_id"]
+    response.headers['X-Frame-Numbers'] = ",".join(map(str, metadata.get("frame_numbers", [])))
+    if metadata.get("profile"):
+        response.headers['X-Output-Profile'] = metadata["profile"]
+    if response.content_length:
+        metrics.BYTES.inc(response.content_length, direction="out")
+    return response
+
+
 # API endpoints
-@app.route('/health', methods=['GET'])
+@bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint for liveness check"""
     return jsonify({
@@ -863,132 +1175,641 @@ def health_check():
         "timestamp": datetime.now().isoformat()
     }), 200
 
-@app.route('/encrypt', methods=['POST'])
-def encrypt_endpoint():
-    """Endpoint to encrypt text and hide it in video"""
+@bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Per-stage latency histograms and throughput counters in Prometheus text format"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/results/<result_id>', methods=['GET'])
+def result_download(result_id):
+    """Download a finished video; supports HTTP Range requests"""
+    return send_result(result_id)
+
+@bp.route('/results/<result_id>/metadata', methods=['GET'])
+def result_metadata(result_id):
+    """Small JSON sidecar describing a finished video"""
+    result = result_store.get(result_id)
+    if result is None:
+        return jsonify({"error": "Result not found or expired"}), 404
+    _, metadata = result
+    return jsonify(metadata)
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+def make_temp_dir():
+    """Create a per-request temporary directory for processing"""
+    session_id = str(uuid.uuid4())
+    temp_dir = os.path.join(TEMP_FOLDER, session_id)
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+def save_upload(video_file, temp_dir, digest=None):
+    """Save an uploaded video into the request's temp dir and return its path
+    
+    digest, a hashlib object, is updated with the bytes as they are copied.
+    """
+    video_path = os.path.join(temp_dir, secure_filename(video_file.filename))
+    with stage_timer("upload_save"):
+        if digest is None:
+            video_file.save(video_path)
+        else:
+            with open(video_path, 'wb') as f:
+                for chunk in iter(lambda: video_file.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    f.write(chunk)
+    metrics.BYTES.inc(os.path.getsize(video_path), direction="in")
+    return video_path
+
+def decrypt_result_response(response_data, cache_status):
+    """JSON for a decrypt result, noting whether it came from the cache"""
+    if response_data:
+        response = jsonify(response_data)
+    else:
+        response = jsonify({"error": "No hidden text found in video"})
+        response.status_code = 404
+    response.headers['X-Cache'] = cache_status
+    return response
+
+def encrypt_output_path(temp_dir, filename):
+    """Where the encoded video for an upload is written"""
+    original_filename = secure_filename(filename)
+    output_filename = f"encoded_{original_filename.rsplit('.', 1)[0]}.mp4"
+    return os.path.join(temp_dir, output_filename)
+
+def run_encrypt(video_path, text, output_path, profile=None, progress=None):
+    """Encrypt text and hide it in the video; returns (mp4_path, frame_numbers)"""
+    # Encrypt the text using RSA
+    encrypted_text = encrypt_rsa(text)
+    
+    # Stream frames through the border and LSB stages straight into ffmpeg
+    return encode_video(video_path, text, encrypted_text, output_path, profile=profile, progress=progress)
+
+def run_decrypt(video_path, progress=None):
+    """Extract border data and hidden text; returns the response payload (may be empty)"""
+    # Extract border data and decode hidden text in a single pass over the video
+    border_data, decrypted_text = decode_video_single_pass(video_path, progress=progress)
+    return decrypt_response_data(border_data, decrypted_text)
+
+def cache_decrypt_result(content_hash, response_data):
+    """Cache a decrypt result unless the decode came up empty or without an intact border
+    
+    A failed decryption falls back to the border text, so only results whose
+    border still starts with "STEGO:" are definite enough to serve again.
+    """
+    if response_data and response_data.get("border_data", "").startswith("STEGO:"):
+        decrypt_cache.put(content_hash, response_data)
+
+def decrypt_response_data(border_data, decrypted_text):
+    response_data = {}
+    
+    if border_data:
+        response_data["border_data"] = border_data
+    
+    if decrypted_text:
+        response_data["stego_data"] = decrypted_text
+    
+    return response_data
+
+def parse_encrypt_request():
+    """Validate an encrypt upload; returns (video_file, text, profile, error_response)"""
     if 'video' not in request.files or 'text' not in request.form:
-        return jsonify({"error": "Missing video file or text"}), 400
+        return None, None, None, (jsonify({"error": "Missing video file or text"}), 400)
     
     video_file = request.files['video']
     text = request.form['text']
+    profile = request.form.get('profile', OUTPUT_PROFILE)
     
     if video_file.filename == '':
-        return jsonify({"error": "No video selected"}), 400
+        return None, None, None, (jsonify({"error": "No video selected"}), 400)
     
-    # Create temporary directory for processing
-    session_id = str(uuid.uuid4())
-    temp_dir = os.path.join(TEMP_FOLDER, session_id)
-    os.makedirs(temp_dir, exist_ok=True)
+    if profile not in OUTPUT_PROFILES:
+        return None, None, None, (jsonify({"error": f"Unknown output profile: {profile}"}), 400)
     
-    try:
-        # Save uploaded video
-        video_path = os.path.join(temp_dir, secure_filename(video_file.filename))
-        video_file.save(video_path)
-        
-        # Extract frames from video FIRST
-        frames, _ = extract_frames(video_path, temp_dir)
-        
-        # Add data-encoding borders BEFORE steganography
-        frames = add_data_border_to_frames(frames, text, temp_dir)
-        
-        # Encrypt the text using RSA AFTER borders
-        encrypted_text = encrypt_rsa(text)
-        
-        # Encode encrypted text into frames LAST
-        frame_numbers = encode_frames(frames, encrypted_text, temp_dir)
-        
-        # Create output video with .mov extension
-        original_filename = secure_filename(video_file.filename)
-        output_filename = f"encoded_{original_filename.rsplit('.', 1)[0]}.mov"
-        output_path = os.path.join(temp_dir, output_filename)
-        create_output_video(frames, video_path, output_path)
-        
-        # Convert MOV to MP4
-        mp4_path = convert_to_mp4(output_path, temp_dir)
-        
-        # Check if MP4 conversion was successful
-        if not mp4_path or not os.path.exists(mp4_path):
-            return jsonify({"error": "MP4 conversion failed"}), 500
-        
-        # Read both files into memory
-        with open(output_path, 'rb') as mov_file:
-            mov_data = mov_file.read()
-        
+    return video_file, text, profile, None
+
+def parse_decrypt_request():
+    """Validate a decrypt upload; returns (video_file, error_response)"""
+    if 'video' not in request.files:
+        return None, (jsonify({"error": "Missing video file"}), 400)
+    
+    video_file = request.files['video']
+    
+    if video_file.filename == '':
+        return None, (jsonify({"error": "No video selected"}), 400)
+    
+    return video_file, None
+
+def admission_controller(kind):
+    return current_app.extensions['stego_admission'][kind]
+
+def admission_error_response(error):
+    response = jsonify({"error": str(error)})
+    response.status_code = error.status_code
+    if error.retry_after:
+        response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def admitted(kind):
+    """Reserve a queue place before the view reads its upload, release it when it returns
+    
+    The view admits the request with admit_upload() once the upload is saved;
+    job views take the ticket over with take_admission_ticket().
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                g.admission_ticket = admission_controller(kind).reserve()
+            except AdmissionError as e:
+                return admission_error_response(e)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                ticket = g.pop('admission_ticket', None)
+                if ticket is not None:
+                    ticket.release()
+        return wrapper
+    return decorator
+
+def estimate_cost(video_path, kind):
+    """Frames the request will decode times their pixel count"""
+    info = probe_video(video_path)
+    frame_count = max(info["frame_count"], 1)
+    if kind == 'decrypt':
+        plan = plan_decode(frame_count)
+        frame_count = len(set(plan["border"] + plan["metadata"] + plan["payload"]))
+    elif kind == 'verify':
+        # The header frame and a few border frames
+        frame_count = min(frame_count, 1 + BORDER_BATCH)
+    return frame_count * info["width"] * info["height"]
+
+def admit_upload(video_path, kind, ticket=None, timeout=None):
+    """Wait for an execution slot for a saved upload; raises AdmissionError"""
+    ticket = ticket or g.admission_ticket
+    if not ticket.admitted:
+        ticket.admit(estimate_cost(video_path, kind), timeout=timeout)
+
+def take_admission_ticket():
+    """Hand the request's ticket to a background job, which must release it"""
+    return g.pop('admission_ticket')
+
+def encrypt_response(mp4_path, frame_numbers, profile, form=None):
+    """Send the encoded video as binary (from the result store) or as base64 JSON"""
+    if wants_binary_response(form):
+        # Move the file out of the temp dir and stream it from disk
+        result_id = result_store.put(mp4_path, metadata={
+            "frame_numbers": frame_numbers,
+            "profile": profile,
+        })
+        return send_result(result_id)
+    
+    with stage_timer("response"):
         with open(mp4_path, 'rb') as mp4_file:
             mp4_data = mp4_file.read()
         
-        # Create response with both files
         response = {
-            # "mov": base64.b64encode(mov_data).decode('utf-8'),
             "mp4": base64.b64encode(mp4_data).decode('utf-8'),
-            # "mov_filename": output_filename,
             "mp4_filename": os.path.basename(mp4_path)
         }
+        metrics.BYTES.inc(len(response["mp4"]), direction="out")
         
         return jsonify(response)
+
+@bp.route('/encrypt', methods=['POST'])
+@admitted('encrypt')
+def encrypt_endpoint():
+    """Endpoint to encrypt text and hide it in video"""
+    if wants_streaming_ingest():
+        return stream_encrypt_endpoint()
+    
+    video_file, text, profile, error = parse_encrypt_request()
+    if error:
+        return error
+    
+    # Create temporary directory for processing
+    temp_dir = make_temp_dir()
+    
+    try:
+        # Save uploaded video
+        video_path = save_upload(video_file, temp_dir)
+        admit_upload(video_path, 'encrypt')
+        
+        output_path = encrypt_output_path(temp_dir, video_file.filename)
+        try:
+            mp4_path, frame_numbers = run_encrypt(video_path, text, output_path, profile=profile)
+        except RuntimeError as e:
+            print(f"Error encoding video: {e}")
+            return jsonify({"error": "MP4 encoding failed"}), 500
+        
+        return encrypt_response(mp4_path, frame_numbers, profile)
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
     finally:
         # Clean up temporary files after response is sent
-        # We'll add a delay or move this to a background task in production
         try:
             if os.path.exists(temp_dir):
                 shutil.rmtree(temp_dir)
         except Exception as cleanup_error:
             print(f"Error cleaning up: {cleanup_error}")
-@app.route('/decrypt', methods=['POST'])
+
+@bp.route('/decrypt', methods=['POST'])
+@admitted('decrypt')
 def decrypt_endpoint():
     """Endpoint to decrypt hidden text from video"""
-    if 'video' not in request.files:
-        return jsonify({"error": "Missing video file"}), 400
-    
-    video_file = request.files['video']
+    if wants_streaming_ingest():
+        return stream_decrypt_endpoint()
     
-    if video_file.filename == '':
-        return jsonify({"error": "No video selected"}), 400
+    video_file, error = parse_decrypt_request()
+    if error:
+        return error
     
     # Create temporary directory for processing
-    session_id = str(uuid.uuid4())
-    temp_dir = os.path.join(TEMP_FOLDER, session_id)
-    os.makedirs(temp_dir, exist_ok=True)
+    temp_dir = make_temp_dir()
     
     try:
-        # Save uploaded video
-        video_path = os.path.join(temp_dir, secure_filename(video_file.filename))
-        video_file.save(video_path)
+        # Save uploaded video, hashing it on the way
+        digest = hashlib.sha256()
+        video_path = save_upload(video_file, temp_dir, digest)
+        content_hash = digest.hexdigest()
         
-        # First try to extract data from borders
-        border_data = extract_border_data(video_path, temp_dir)
+        response_data = decrypt_cache.get(content_hash)
+        if response_data is not None:
+            return decrypt_result_response(response_data, 'hit')
         
-        # Then try to decode and decrypt hidden text
-        decrypted_text = decode_video(video_path, temp_dir)
-        
-        response_data = {}
-        
-        if border_data:
-            response_data["border_data"] = border_data
+        admit_upload(video_path, 'decrypt')
+        response_data = run_decrypt(video_path)
+        cache_decrypt_result(content_hash, response_data)
+        return decrypt_result_response(response_data, 'miss')
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    finally:
+        # Clean up temporary files
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+
+@bp.route('/verify', methods=['POST'])
+@admitted('verify')
+def verify_endpoint():
+    """Endpoint to check a proof video's border data against its integrity tag
+    
+    Reads the header frame and a few corners only. Pass decrypt=1 to also run
+    the full decryption and get stego_data as /decrypt would return it; that
+    part waits for a decrypt slot unless the result is cached.
+    """
+    video_file, error = parse_decrypt_request()
+    if error:
+        return error
+    wants_decrypt = (request.args.get('decrypt') or request.form.get('decrypt', '')).lower() in ('1', 'true', 'yes')
+    
+    temp_dir = make_temp_dir()
+    try:
+        digest = hashlib.sha256() if wants_decrypt else None
+        video_path = save_upload(video_file, temp_dir, digest)
+        admit_upload(video_path, 'verify')
+        response_data = verify_video(video_path)
         
-        if decrypted_text:
-            response_data["stego_data"] = decrypted_text
+        if wants_decrypt:
+            content_hash = digest.hexdigest()
+            decrypted = decrypt_cache.get(content_hash)
+            if decrypted is None:
+                # Free the verify slot rather than hold it while queueing for decrypt
+                take_admission_ticket().release()
+                with admission_controller('decrypt').reserve() as ticket:
+                    admit_upload(video_path, 'decrypt', ticket)
+                    decrypted = run_decrypt(video_path)
+                cache_decrypt_result(content_hash, decrypted)
+            if "stego_data" in decrypted:
+                response_data["stego_data"] = decrypted["stego_data"]
         
-        if response_data:
-            return jsonify(response_data)
-        else:
-            return jsonify({"error": "No hidden text found in video"}), 404
+        return jsonify(response_data)
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
     
     finally:
-        # Clean up temporary files
         if os.path.exists(temp_dir):
             shutil.rmtree(temp_dir)
 
+# Streaming ingestion (?ingest=stream): /encrypt decodes frames while the upload
+# arrives. Uploads ffmpeg can't decode from a pipe, encrypt uploads whose text
+# field comes after the video, and uploads arriving while no encrypt slot is free
+# are processed from the saved copy instead. /decrypt only needs a few planned
+# frames, so it spools the upload and reads just those.
+def wants_streaming_ingest():
+    return request.args.get('ingest', INGEST_MODE) == 'stream'
+
+def _encode_streamed_upload(decoder, text, output_path, profile, ticket):
+    """Worker side of a streamed /encrypt; returns None if the upload can't be streamed"""
+    try:
+        info = decoder.wait_info()
+        if info is None:
+            decoder.close()
+            return None
+        if not ticket.try_admit(info["frame_count"] * info["width"] * info["height"]):
+            # Waiting here would leave ffmpeg's output unread and stall the upload
+            # feeding it, so spool the rest and admit the saved copy as usual
+            print("[INFO] No encrypt slot free; saving the upload before encoding it")
+            decoder.close()
+            return None
+        encrypted_text = encrypt_rsa(text)
+        # Video only: the audio is muxed in once the whole upload is on disk
+        video_only_path = output_path.rsplit('.', 1)[0] + '_video.mp4'
+        return encode_stream(decoder.frames(), info, text, encrypted_text, video_only_path, profile=profile)
+    except BaseException:
+        # Stop ffmpeg so the request thread isn't left blocked feeding it
+        decoder.close()
+        raise
+
+def _finish_streaming(started):
+    """Stop the decoder and wait for the worker before the temp dir goes away"""
+    if 'decoder' in started:
+        started['decoder'].close()
+    if 'future' in started:
+        started['future'].exception()
+
+def _streamed_result(started):
+    """The worker's result, or None to fall back to the saved upload"""
+    if 'future' not in started:
+        return None
+    try:
+        return started['future'].result()
+    except StreamDecodeError as e:
+        print(f"[INFO] Streaming decode failed, using the saved upload instead: {e}")
+        return None
+
+def stream_encrypt_endpoint():
+    """/encrypt, encoding the video while it is being uploaded"""
+    ticket = g.admission_ticket
+    temp_dir = make_temp_dir()
+    started = {}
+    
+    def on_video(fields, filename):
+        profile = fields.get('profile', OUTPUT_PROFILE)
+        if 'text' not in fields or profile not in OUTPUT_PROFILES:
+            print("[INFO] Text field not received before the video; saving the upload first")
+            return None
+        started['decoder'] = decoder = StreamDecoder()
+        started['future'] = run_in_thread(_encode_streamed_upload, decoder, fields['text'],
+                                          encrypt_output_path(temp_dir, filename), profile, ticket)
+        return decoder
+    
+    try:
+        try:
+            with stage_timer("upload_save"):
+                fields, video_path, filename = receive_upload(request.stream, request.content_type,
+                                                              temp_dir, 'video', on_video)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid upload: {e}"}), 400
+        finally:
+            if 'decoder' in started:
+                started['decoder'].finish_input()
+        
+        if video_path is None or 'text' not in fields:
+            return jsonify({"error": "Missing video file or text"}), 400
+        if filename == '':
+            return jsonify({"error": "No video selected"}), 400
+        profile = fields.get('profile', OUTPUT_PROFILE)
+        if profile not in OUTPUT_PROFILES:
+            return jsonify({"error": f"Unknown output profile: {profile}"}), 400
+        metrics.BYTES.inc(os.path.getsize(video_path), direction="in")
+        
+        output_path = encrypt_output_path(temp_dir, filename)
+        try:
+            result = _streamed_result(started)
+            if result is None:
+                admit_upload(video_path, 'encrypt', ticket)
+                mp4_path, frame_numbers = run_encrypt(video_path, fields['text'], output_path, profile=profile)
+            else:
+                video_only_path, frame_numbers = result
+                mp4_path = mux_audio(video_only_path, video_path, output_path_for(output_path, profile))
+        except RuntimeError as e:
+            print(f"Error encoding video: {e}")
+            return jsonify({"error": "MP4 encoding failed"}), 500
+        
+        return encrypt_response(mp4_path, frame_numbers, profile, form=fields)
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    finally:
+        _finish_streaming(started)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def stream_decrypt_endpoint():
+    """/decrypt, parsing the upload off the request stream and hashing it on the way to disk
+    
+    Decoding the whole stream would cost more than the planned-frame reader,
+    so the saved copy is decoded like a regular /decrypt upload.
+    """
+    ticket = g.admission_ticket
+    temp_dir = make_temp_dir()
+    digest = hashlib.sha256()
+    try:
+        try:
+            with stage_timer("upload_save"):
+                fields, video_path, filename = receive_upload(request.stream, request.content_type,
+                                                              temp_dir, 'video', digest=digest)
+        except ValueError as e:
+            return jsonify({"error": f"Invalid upload: {e}"}), 400
+        
+        if video_path is None:
+            return jsonify({"error": "Missing video file"}), 400
+        if filename == '':
+            return jsonify({"error": "No video selected"}), 400
+        metrics.BYTES.inc(os.path.getsize(video_path), direction="in")
+        
+        content_hash = digest.hexdigest()
+        response_data = decrypt_cache.get(content_hash)
+        if response_data is not None:
+            return decrypt_result_response(response_data, 'hit')
+        
+        admit_upload(video_path, 'decrypt', ticket)
+        response_data = run_decrypt(video_path)
+        cache_decrypt_result(content_hash, response_data)
+        return decrypt_result_response(response_data, 'miss')
+    
+    except AdmissionError as e:
+        return admission_error_response(e)
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+# Asynchronous jobs: submit returns a job id right away, clients poll for progress
+def _encrypt_job(job, ticket, video_path, text, output_path, profile):
+    admit_upload(video_path, 'encrypt', ticket, timeout=RESULT_TTL)
+    mp4_path, frame_numbers = run_encrypt(video_path, text, output_path, profile=profile, progress=job.report)
+    result_id = result_store.put(mp4_path, metadata={
+        "frame_numbers": frame_numbers,
+        "profile": profile,
+    })
+    return {
+        "result_id": result_id,
+        "mp4_filename": os.path.basename(mp4_path),
+        "frame_numbers": frame_numbers,
+    }
+
+def _decrypt_job(job, ticket, video_path, content_hash):
+    response_data = decrypt_cache.get(content_hash)
+    if response_data is not None:
+        return response_data
+    admit_upload(video_path, 'decrypt', ticket, timeout=RESULT_TTL)
+    response_data = run_decrypt(video_path, progress=job.report)
+    cache_decrypt_result(content_hash, response_data)
+    return response_data
+
+def _job_cleanup(ticket, temp_dir):
+    def cleanup():
+        ticket.release()
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return cleanup
+
+def _abandon_job_setup(ticket, temp_dir):
+    """Undo a job submission that failed before the job (and its cleanup) was queued"""
+    if ticket is not None:
+        ticket.release()
+    shutil.rmtree(temp_dir, ignore_errors=True)
+
+def _job_accepted(job):
+    return jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": url_for('.job_status', job_id=job.id),
+        "result_url": url_for('.job_result', job_id=job.id),
+    }), 202
+
+@bp.route('/jobs/encrypt', methods=['POST'])
+@admitted('encrypt')
+def submit_encrypt_job():
+    """Queue an encrypt job; same form fields as /encrypt"""
+    video_file, text, profile, error = parse_encrypt_request()
+    if error:
+        return error
+    
+    temp_dir = make_temp_dir()
+    ticket = None
+    try:
+        video_path = save_upload(video_file, temp_dir)
+        output_path = encrypt_output_path(temp_dir, video_file.filename)
+        
+        ticket = take_admission_ticket()
+        job = job_manager.submit('encrypt', _encrypt_job, ticket, video_path, text, output_path, profile,
+                                 cleanup=_job_cleanup(ticket, temp_dir))
+    except Exception as e:
+        _abandon_job_setup(ticket, temp_dir)
+        return jsonify({"error": str(e)}), 500
+    return _job_accepted(job)
+
+@bp.route('/jobs/decrypt', methods=['POST'])
+@admitted('decrypt')
+def submit_decrypt_job():
+    """Queue a decrypt job; same form fields as /decrypt"""
+    video_file, error = parse_decrypt_request()
+    if error:
+        return error
+    
+    temp_dir = make_temp_dir()
+    ticket = None
+    try:
+        digest = hashlib.sha256()
+        video_path = save_upload(video_file, temp_dir, digest)
+        
+        ticket = take_admission_ticket()
+        job = job_manager.submit('decrypt', _decrypt_job, ticket, video_path, digest.hexdigest(),
+                                 cleanup=_job_cleanup(ticket, temp_dir))
+    except Exception as e:
+        _abandon_job_setup(ticket, temp_dir)
+        return jsonify({"error": str(e)}), 500
+    return _job_accepted(job)
+
+@bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status of a job with per-stage progress"""
+    record = job_manager.get(job_id)
+    if record is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    return jsonify(record)
+
+@bp.route('/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Download the encoded video (encrypt) or the decoded data (decrypt) of a finished job"""
+    record = job_manager.get(job_id)
+    if record is None:
+        return jsonify({"error": "Job not found or expired"}), 404
+    if record["status"] == 'failed':
+        return jsonify({"error": record["error"], "status": record["status"]}), 500
+    if record["status"] != 'done':
+        return jsonify({"error": "Job not finished", "status": record["status"]}), 409
+    
+    if record["kind"] == 'encrypt':
+        return send_result(record["result"]["result_id"])
+    
+    if not record["result"]:
+        return jsonify({"error": "No hidden text found in video"}), 404
+    return jsonify(record["result"])
+
+def create_app(config=None):
+    """Build the Flask app; wsgi.py uses this under a multi-worker WSGI server"""
+    app = Flask(__name__)
+    app.config.update(
+        ENCRYPT_CONCURRENCY=ENCRYPT_CONCURRENCY,
+        ENCRYPT_QUEUE=ENCRYPT_QUEUE,
+        ENCRYPT_MAX_COST=ENCRYPT_MAX_COST,
+        DECRYPT_CONCURRENCY=DECRYPT_CONCURRENCY,
+        DECRYPT_QUEUE=DECRYPT_QUEUE,
+        DECRYPT_MAX_COST=DECRYPT_MAX_COST,
+        VERIFY_CONCURRENCY=VERIFY_CONCURRENCY,
+        VERIFY_QUEUE=VERIFY_QUEUE,
+        VERIFY_MAX_COST=VERIFY_MAX_COST,
+        MAX_REQUEST_COST=MAX_REQUEST_COST,
+        ADMISSION_TIMEOUT=ADMISSION_TIMEOUT,
+    )
+    if config:
+        app.config.update(config)
+    
+    CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
+    app.before_request(start_request_metrics)
+    app.after_request(after_request)
+    app.after_request(finish_request_metrics)
+    app.teardown_request(close_request_metrics)
+    app.register_blueprint(bp)
+    
+    # Costs are configured in megapixel-frames
+    app.extensions['stego_admission'] = {
+        kind: AdmissionController(
+            kind,
+            app.config[f'{kind.upper()}_CONCURRENCY'],
+            app.config[f'{kind.upper()}_QUEUE'],
+            max_cost=app.config[f'{kind.upper()}_MAX_COST'] * 1e6,
+            max_request_cost=app.config['MAX_REQUEST_COST'] * 1e6,
+            queue_timeout=app.config['ADMISSION_TIMEOUT'],
+        )
+        for kind in ('encrypt', 'decrypt', 'verify')
+    }
+    return app
+
 if __name__ == '__main__':
     # Make sure keys are generated on startup
     generate_keys()
+    app = create_app()
     
     # Try different ports if the default is in use
     port = 5000
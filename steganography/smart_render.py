@@ -0,0 +1,149 @@
+"""Smart rendering: re-encode only the GOPs that carry the payload.
+
+The LSB payload only touches the first few frames, plus the metadata frame
+appended at the end. For an H.264 upload, split_gops cuts the source at its
+keyframes with a stream copy. Only the leading GOPs holding payload frames
+are decoded, rendered and encoded again. concat_segments then joins the new
+head, the untouched remaining GOPs and the new metadata frame, and copies the
+source audio alongside. Encrypt time then grows with the payload instead of
+the clip length.
+
+The joined file mixes two encodes in one H.264 track, which players only
+handle when both share a pixel format, profile and level. Smart rendering is
+therefore only used when the source already has the output profile's pixel
+format (e.g. a re-upload of our own output). The new GOPs are encoded at the
+source's profile and level, and the result is checked against the source
+before joining. Anything else raises SmartRenderUnavailable and the caller
+encodes the whole video. Frames in copied GOPs keep the source encoding and
+carry no data border.
+"""
+import glob
+import os
+import re
+import struct
+import subprocess
+
+from video_output import audio_args, ffmpeg_available, probe_audio_codec
+
+# Source codecs whose GOPs can be copied next to our own H.264 output
+COPYABLE_CODECS = {'h264'}
+# H.264 profile_idc values and the matching libx264 -profile:v names
+X264_PROFILES = {66: 'baseline', 77: 'main', 100: 'high', 110: 'high10', 122: 'high422', 244: 'high444'}
+
+_VIDEO_STREAM_RE = re.compile(r'Stream #\d+:\d+.*?: Video: (\w+)[^,\n]*, (\w+)')
+
+
+class SmartRenderUnavailable(RuntimeError):
+    """The source can't be split into copyable GOPs; encode it in full instead"""
+
+
+def probe_video_stream(video_path):
+    """Return (codec name, pixel format) of the first video stream, or (None, None)"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-i', video_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None, None
+    match = _VIDEO_STREAM_RE.search(result.stderr.decode(errors='ignore'))
+    return (match.group(1), match.group(2)) if match else (None, None)
+
+
+def avc_profile_level(mp4_path):
+    """(profile_idc, level_idc) from the avcC box of an H.264 MP4, or None"""
+    with open(mp4_path, 'rb') as f:
+        # Walk the top-level boxes to moov; sample data could contain b'avcC' by chance
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            size, kind = struct.unpack('>I4s', header)
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0] - 8
+            if kind == b'moov':
+                moov = f.read(size - 8)
+                break
+            if size < 8:
+                return None
+            f.seek(size - 8, os.SEEK_CUR)
+    at = moov.find(b'avcC')
+    if at < 0 or len(moov) < at + 8:
+        return None
+    # configurationVersion, AVCProfileIndication, profile_compatibility, AVCLevelIndication
+    return moov[at + 5], moov[at + 7]
+
+
+def matching_encoder_args(segment_path):
+    """libx264 arguments that encode at the profile and level of a copied segment"""
+    source = avc_profile_level(segment_path)
+    if source is None or source[0] not in X264_PROFILES:
+        raise SmartRenderUnavailable(f"Can't match the source's H.264 profile ({source})")
+    profile_idc, level_idc = source
+    return ['-profile:v', X264_PROFILES[profile_idc], '-level:v', f'{level_idc / 10:.1f}']
+
+
+def check_matches(encoded_path, segment_path):
+    """Raise unless an encoded segment has the profile and level of a copied one"""
+    encoded, source = avc_profile_level(encoded_path), avc_profile_level(segment_path)
+    if encoded != source:
+        raise SmartRenderUnavailable(f"Re-encoded GOPs came out as profile/level {encoded}, "
+                                     f"the source is {source}")
+
+
+def _run(command, what):
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise SmartRenderUnavailable(f"ffmpeg failed to {what}: {result.stderr.decode(errors='ignore')[-2000:]}")
+
+
+def split_gops(video_path, work_dir, pix_fmt):
+    """Stream-copy the video track into one MP4 per GOP; returns the segment paths in order
+
+    pix_fmt is the pixel format the re-encoded GOPs will have; a source in
+    any other format can't share a track with them.
+    """
+    if not ffmpeg_available():
+        raise SmartRenderUnavailable("ffmpeg is not installed")
+    codec, source_pix_fmt = probe_video_stream(video_path)
+    if codec not in COPYABLE_CODECS:
+        raise SmartRenderUnavailable(f"Can't copy {codec or 'unknown'} video next to H.264")
+    if source_pix_fmt != pix_fmt:
+        raise SmartRenderUnavailable(f"The source is {source_pix_fmt}, the output would be {pix_fmt}")
+
+    # A tiny segment_time makes the segment muxer cut at every keyframe
+    _run([
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-i', video_path, '-map', '0:v:0', '-c', 'copy',
+        '-f', 'segment', '-segment_time', '0.001', '-segment_format', 'mp4',
+        '-reset_timestamps', '1',
+        os.path.join(work_dir, 'gop%06d.mp4'),
+    ], "split the video at its keyframes")
+    segments = sorted(glob.glob(os.path.join(work_dir, 'gop*.mp4')))
+    if not segments:
+        raise SmartRenderUnavailable("The video has no frames to copy")
+    return segments
+
+
+def concat_segments(segments, audio_source, output_path):
+    """Join video segments losslessly and add the audio of audio_source"""
+    list_path = output_path + '.concat.txt'
+    with open(list_path, 'w') as f:
+        for path in segments:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+    command = [
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-f', 'concat', '-safe', '0', '-i', list_path,
+    ]
+    audio_codec = probe_audio_codec(audio_source) if audio_source else None
+    if audio_codec:
+        command += ['-i', audio_source, '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy']
+        command += audio_args(audio_codec)
+    else:
+        command += ['-map', '0:v:0', '-c:v', 'copy']
+    command += ['-movflags', '+faststart', output_path]
+    try:
+        _run(command, "join the video segments")
+    finally:
+        os.remove(list_path)
+    return output_path
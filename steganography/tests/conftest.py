@@ -0,0 +1,38 @@
+"""Shared fixtures. The server modules are flat, so the server folder goes on sys.path."""
+import os
+import shutil
+import sys
+
+import pytest
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.join(SERVER_DIR, 'benchmarks'))
+
+CID = 'bafybeigdyrzt5sfp7udm7hu76uh7y26nf3efuylqabf3oclgtqy55fbzdi'
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason="ffmpeg is not installed")
+
+
+@pytest.fixture(scope='session')
+def server(tmp_path_factory):
+    """The server module, running in a scratch folder
+
+    server.py creates its uploads/tmp/keys folders relative to the working
+    directory on import, so the whole session runs from a temp folder.
+    """
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('server'))
+    import server as module
+    yield module
+    os.chdir(previous)
+
+
+@pytest.fixture(scope='session')
+def client(server):
+    return server.create_app().test_client()
+
+
+@pytest.fixture(scope='session')
+def clip_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('clips'))
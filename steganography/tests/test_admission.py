@@ -0,0 +1,166 @@
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+from werkzeug.datastructures import FileStorage
+from werkzeug.test import encode_multipart
+
+from admission import AdmissionController, Overloaded, TooExpensive
+from conftest import CID, requires_ffmpeg
+
+
+def test_queue_full_is_overloaded_with_retry_after():
+    controller = AdmissionController('encrypt', max_concurrent=1, max_queue=1)
+    first, second = controller.reserve(), controller.reserve()
+    with pytest.raises(Overloaded) as raised:
+        controller.reserve()
+    assert raised.value.status_code == 503
+    assert raised.value.retry_after >= 1
+    first.release()
+    controller.reserve().release()
+    second.release()
+    assert controller.stats()["queued"] == 0
+
+
+def test_too_expensive_is_413():
+    controller = AdmissionController('decrypt', 2, 2, max_request_cost=100)
+    ticket = controller.reserve()
+    with pytest.raises(TooExpensive) as raised:
+        ticket.admit(101)
+    assert raised.value.status_code == 413
+    ticket.release()
+    assert controller.stats()["queued"] == 0
+
+
+def test_waiting_for_a_slot_times_out():
+    controller = AdmissionController('encrypt', 1, 1)
+    running = controller.reserve().admit(1)
+    with pytest.raises(Overloaded) as raised:
+        controller.reserve().admit(1, timeout=0.05)
+    assert raised.value.retry_after >= 1
+    running.release()
+    assert controller.stats()["waiting_for_slot"] == 0
+
+
+def test_cost_budget_holds_back_the_next_request():
+    controller = AdmissionController('encrypt', 2, 2, max_cost=10)
+    first = controller.reserve().admit(8)
+    second = controller.reserve()
+    admitted = threading.Event()
+    thread = threading.Thread(target=lambda: (second.admit(8), admitted.set()))
+    thread.start()
+    assert not admitted.wait(0.1)
+    first.release()
+    assert admitted.wait(5)
+    thread.join()
+    second.release()
+
+
+def test_try_admit_does_not_wait():
+    controller = AdmissionController('encrypt', 1, 2, max_request_cost=100)
+    running = controller.reserve().admit(1)
+    ticket = controller.reserve()
+    assert not ticket.try_admit(1)
+    assert controller.stats()["waiting_for_slot"] == 0
+    with pytest.raises(TooExpensive):
+        ticket.try_admit(101)
+    running.release()
+    assert ticket.try_admit(1)
+    ticket.release()
+
+
+def test_lone_request_runs_whatever_its_cost():
+    controller = AdmissionController('encrypt', 2, 2, max_cost=10)
+    controller.reserve().admit(1000).release()
+
+
+@pytest.fixture
+def tiny_video(tmp_path):
+    path = str(tmp_path / 'tiny.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(5):
+        writer.write(np.full((48, 64, 3), i * 40, dtype=np.uint8))
+    writer.release()
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_http_503_with_retry_after(server, tiny_video):
+    app = server.create_app({'DECRYPT_CONCURRENCY': 1, 'DECRYPT_QUEUE': 0})
+    held = app.extensions['stego_admission']['decrypt'].reserve()
+    try:
+        response = app.test_client().post('/decrypt', data={'video': (io.BytesIO(tiny_video), 'tiny.avi')},
+                                          content_type='multipart/form-data')
+    finally:
+        held.release()
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_verify_is_not_queued_behind_decrypts(server, tiny_video):
+    app = server.create_app({'DECRYPT_CONCURRENCY': 1, 'DECRYPT_QUEUE': 0})
+    held = app.extensions['stego_admission']['decrypt'].reserve().admit(1)
+    client = app.test_client()
+    try:
+        verified = client.post('/verify', data={'video': (io.BytesIO(tiny_video), 'tiny.avi')},
+                               content_type='multipart/form-data')
+        decrypted = client.post('/verify?decrypt=1', data={'video': (io.BytesIO(tiny_video), 'tiny.avi')},
+                                content_type='multipart/form-data')
+    finally:
+        held.release()
+    assert verified.status_code == 200
+    assert verified.get_json()["valid"] is False
+    # The decryption part still needs a decrypt slot
+    assert decrypted.status_code == 503
+    assert app.extensions['stego_admission']['verify'].stats()["queued"] == 0
+
+
+def test_http_413_for_an_oversized_video(server, tiny_video):
+    app = server.create_app({'MAX_REQUEST_COST': 1e-6})
+    response = app.test_client().post('/decrypt', data={'video': (io.BytesIO(tiny_video), 'tiny.avi')},
+                                      content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert response.get_json()["error"] == "Video too large to decrypt"
+    assert app.extensions['stego_admission']['decrypt'].stats()["queued"] == 0
+
+
+def wait_until_read(stream, size, timeout):
+    """Whether the server reads the whole request body within timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while stream.tell() < size:
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+@requires_ffmpeg
+def test_streamed_upload_is_not_stalled_by_a_busy_slot(server, tmp_path):
+    path = str(tmp_path / 'clip.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (320, 240))
+    rng = np.random.default_rng(3)
+    for _ in range(150):
+        writer.write(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8))
+    writer.release()
+    with open(path, 'rb') as f:
+        video = FileStorage(io.BytesIO(f.read()), 'clip.avi')
+    boundary, body = encode_multipart({'text': CID, 'profile': 'lossless', 'video': video})
+    # Bigger than what ffmpeg reads while probing, so an undrained decoder would block the upload
+    stream = io.BytesIO(body)
+
+    app = server.create_app({'ENCRYPT_CONCURRENCY': 1})
+    held = app.extensions['stego_admission']['encrypt'].reserve().admit(1)
+    responses = []
+    thread = threading.Thread(target=lambda: responses.append(app.test_client().post(
+        '/encrypt?ingest=stream', input_stream=stream,
+        content_type=f'multipart/form-data; boundary={boundary}', content_length=len(body))))
+    thread.start()
+    try:
+        assert wait_until_read(stream, len(body), 30)
+    finally:
+        held.release()
+        thread.join(120)
+    assert responses[0].status_code == 200
@@ -0,0 +1,60 @@
+import io
+
+import numpy as np
+import pytest
+
+from border import (apply_data_border, decode_corner_bits, leave_one_out_agreement, printable_text,
+                    stack_corners, text_bits, vote_border_payload)
+from conftest import CID, requires_ffmpeg
+
+WIDTH, HEIGHT = 640, 360
+
+
+def corner_rows(text, indices, total_frames=60):
+    """Corner bits of uncompressed frames carrying text in their border"""
+    frames = [apply_data_border(np.full((HEIGHT, WIDTH, 3), 128, dtype=np.uint8), text_bits(text), k, total_frames)
+              for k in indices]
+    top_left, _ = stack_corners(frames)
+    return decode_corner_bits(top_left)
+
+
+def test_clean_frames_vote_the_payload():
+    rows = corner_rows("STEGO:" + CID, [0, 1, 2])
+    vote = vote_border_payload(rows, [0, 1, 2], WIDTH, HEIGHT)
+    assert printable_text(vote["data"]) == "STEGO:" + CID
+    assert vote["agreeing"] == 3
+
+
+def test_frames_do_not_confirm_their_own_error():
+    rows = np.ones((3, 40), dtype=bool)
+    rows[:2, 7] = False
+    # Frames 0 and 1 built the majority on bit 7, but each is compared with the others only
+    assert (leave_one_out_agreement(rows) < 1).all()
+    assert (leave_one_out_agreement(np.ones((3, 40), dtype=bool)) == 1).all()
+
+
+def test_prefix_errors_are_not_hidden():
+    text = "STEGO:" + CID
+    indices = [0, 1, 2]
+    rows = corner_rows(text, indices)
+    n = len(text) * 8
+    # Bit 26 ('G' -> 'g') is wrong in two of the three frames
+    for row, k in zip(rows[:2], indices[:2]):
+        row[(26 - k * n // 3) % n] ^= True
+    vote = vote_border_payload(rows, indices, WIDTH, HEIGHT)
+    assert printable_text(vote["data"]).startswith("STEgO:")
+
+
+@requires_ffmpeg
+@pytest.mark.parametrize('seed', [5, 7])
+def test_x264_round_trip_verifies(server, client, clip_dir, tmp_path, seed):
+    from synthetic import get_clip
+    source = get_clip(clip_dir, (WIDTH, HEIGHT), 2, seed=seed)
+    output, _ = server.run_encrypt(source, CID, str(tmp_path / 'out.mp4'), profile='x264')
+    with open(output, 'rb') as f:
+        response = client.post('/verify', data={'video': (io.BytesIO(f.read()), 'out.mp4')},
+                               content_type='multipart/form-data')
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["valid"], result
+    assert result["id"] == CID
@@ -0,0 +1,36 @@
+import numpy as np
+
+from border import corner_strip
+from conftest import requires_ffmpeg
+from corner_reader import CornerReader
+from frame_reader import FrameReader
+
+WIDTH, HEIGHT = 320, 240
+
+
+@requires_ffmpeg
+def test_batches_share_one_decode(clip_dir):
+    from synthetic import get_clip
+    source = get_clip(clip_dir, (WIDTH, HEIGHT), 2, seed=11)
+    candidates = [0, 1, 2, 10, 20, 30, 40]
+    with FrameReader(source) as frames, CornerReader(source, candidates, WIDTH, HEIGHT) as corners:
+        process = corners.process
+        for batch in ([0, 1, 2], [10, 20, 30], [40]):
+            strips = corners.read(batch)
+            assert sorted(strips) == batch
+            for i in batch:
+                expected = corner_strip(frames.get(i)).astype(int)
+                assert np.abs(strips[i].astype(int) - expected).mean() < 3
+            # Later batches carry on from the same ffmpeg run instead of starting over
+            assert corners.process is process
+        # Frames already handed out stay available; others fall back to full frames
+        assert sorted(corners.read([20])) == [20]
+        assert corners.read([5]) is None
+
+
+@requires_ffmpeg
+def test_frames_past_the_end_are_left_out(clip_dir):
+    from synthetic import get_clip
+    source = get_clip(clip_dir, (WIDTH, HEIGHT), 2, seed=11)
+    with CornerReader(source, [0, 10000], WIDTH, HEIGHT) as corners:
+        assert sorted(corners.read([0, 10000])) == [0]
@@ -0,0 +1,59 @@
+import os
+
+import decrypt_cache
+from decrypt_cache import DecryptCache
+
+CONTENT_HASH = 'ab' * 32
+RESULT = {"border_data": "STEGO:bafy", "stego_data": "bafy"}
+
+
+def test_hit_from_memory_and_disk(tmp_path):
+    cache = DecryptCache(str(tmp_path))
+    assert cache.get(CONTENT_HASH) is None
+    cache.put(CONTENT_HASH, RESULT)
+    assert cache.get(CONTENT_HASH) == RESULT
+    # A second process only shares the disk tier
+    assert DecryptCache(str(tmp_path)).get(CONTENT_HASH) == RESULT
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = DecryptCache(str(tmp_path), ttl_seconds=-1)
+    cache.put(CONTENT_HASH, RESULT)
+    assert cache.get(CONTENT_HASH) is None
+    assert DecryptCache(str(tmp_path)).get(CONTENT_HASH) is None
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.json')]
+
+
+def test_version_bump_misses(tmp_path, monkeypatch):
+    DecryptCache(str(tmp_path)).put(CONTENT_HASH, RESULT)
+    monkeypatch.setattr(decrypt_cache, 'CACHE_VERSION', decrypt_cache.CACHE_VERSION + 1)
+    assert DecryptCache(str(tmp_path)).get(CONTENT_HASH) is None
+
+
+def test_key_rotation_misses(tmp_path):
+    key = ['old']
+    cache = DecryptCache(str(tmp_path), key_id=lambda: key[0])
+    cache.put(CONTENT_HASH, RESULT)
+    key[0] = 'new'
+    assert cache.get(CONTENT_HASH) is None
+    key[0] = 'old'
+    assert cache.get(CONTENT_HASH) == RESULT
+
+
+def test_hits_do_not_extend_the_disk_ttl(tmp_path):
+    cache = DecryptCache(str(tmp_path))
+    cache.put(CONTENT_HASH, RESULT)
+    path = os.path.join(tmp_path, cache.entry_key(CONTENT_HASH) + '.json')
+    os.utime(path, (1000, 1000))
+    assert DecryptCache(str(tmp_path)).get(CONTENT_HASH) == RESULT
+    assert os.stat(path).st_mtime == 1000
+
+
+def test_empty_and_failed_results_are_not_cached(server):
+    server.decrypt_cache.clear()
+    server.cache_decrypt_result(CONTENT_HASH, {})
+    server.cache_decrypt_result(CONTENT_HASH, {"border_data": "ST#Gq", "stego_data": "ST#Gq"})
+    assert server.decrypt_cache.get(CONTENT_HASH) is None
+    server.cache_decrypt_result(CONTENT_HASH, RESULT)
+    assert server.decrypt_cache.get(CONTENT_HASH) == RESULT
+    server.decrypt_cache.clear()
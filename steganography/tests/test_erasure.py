@@ -0,0 +1,66 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from erasure import ShardCollector, encode_shards, parse_shard
+from lsb_codec import hide_array, reveal_bytes
+
+PAYLOAD = bytes(random.Random(0).randrange(256) for _ in range(301))
+
+
+def test_any_k_of_n_shards_rebuild_the_payload():
+    shards = encode_shards(PAYLOAD, 4, 7)
+    for chosen in itertools.combinations(range(7), 4):
+        collector = ShardCollector()
+        for index in chosen:
+            assert collector.add(shards[index])
+        assert collector.needed == 0
+        assert collector.payload() == PAYLOAD, chosen
+
+
+def test_fewer_than_k_shards_are_not_enough():
+    shards = encode_shards(PAYLOAD, 4, 7)
+    collector = ShardCollector()
+    assert collector.needed is None
+    for shard in shards[4:]:
+        collector.add(shard)
+    assert collector.needed == 1
+    assert collector.payload() is None
+
+
+def test_crc_mismatch_is_rejected():
+    shard = bytearray(encode_shards(PAYLOAD, 4, 7)[5])
+    shard[-1] ^= 0x01
+    assert parse_shard(bytes(shard)) is None
+    collector = ShardCollector()
+    assert not collector.add(bytes(shard))
+    assert collector.rejected == 1
+
+
+def test_shards_of_another_payload_are_rejected():
+    collector = ShardCollector()
+    collector.add(encode_shards(PAYLOAD, 4, 7)[0])
+    assert not collector.add(encode_shards(PAYLOAD, 3, 7)[1])
+    assert collector.rejected == 1
+
+
+def test_text_payloads_and_bad_parameters():
+    text = "base64+ciphertext/=="
+    shards = encode_shards(text, 2, 3)
+    collector = ShardCollector()
+    collector.add(shards[2])
+    collector.add(shards[0])
+    assert collector.payload().decode() == text
+    with pytest.raises(ValueError):
+        encode_shards(PAYLOAD, 5, 4)
+
+
+def test_shards_survive_the_lsb_codec():
+    frames = [np.random.default_rng(i).integers(0, 256, (120, 160, 3), dtype=np.uint8) for i in range(7)]
+    shards = encode_shards(PAYLOAD, 4, 7)
+    collector = ShardCollector()
+    for frame, shard in list(zip(frames, shards))[3:]:
+        collector.add(reveal_bytes(hide_array(frame, shard)))
+    assert collector.payload() == PAYLOAD
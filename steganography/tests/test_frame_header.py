@@ -0,0 +1,48 @@
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from frame_header import (HEADER_VERSION, SCHEME_RSA_ERASURE, hide_header, pack_header, read_header,
+                          unpack_header)
+
+FRAMES = [1, 2, 3, 5, 8]
+
+
+def test_round_trip():
+    header = unpack_header(pack_header(FRAMES, 1234, border_frames='payload', scheme=SCHEME_RSA_ERASURE))
+    assert header == {
+        "version": HEADER_VERSION,
+        "scheme": 'rsa-erasure',
+        "border_width": 20,
+        "border_frames": 'payload',
+        "payload_length": 1234,
+        "frames": FRAMES,
+    }
+
+
+@pytest.mark.parametrize('position', [4, 9, -6, -1])
+def test_crc_mismatch_is_no_header(position):
+    data = bytearray(pack_header(FRAMES, 1234))
+    data[position] ^= 0x01
+    assert unpack_header(bytes(data)) is None
+
+
+def test_malformed_headers():
+    data = pack_header(FRAMES, 1234)
+    assert unpack_header(b"SVX" + data[3:]) is None
+    assert unpack_header(data[:-1]) is None
+    assert unpack_header(data + b"\0") is None
+    assert unpack_header(b"") is None
+    # A newer version is not read, even with a valid CRC
+    body = data[:3] + bytes([HEADER_VERSION + 1]) + data[4:-4]
+    assert unpack_header(body + struct.pack('>I', zlib.crc32(body))) is None
+
+
+def test_hidden_in_a_frame():
+    frame = np.random.default_rng(0).integers(0, 256, (90, 160, 3), dtype=np.uint8)
+    assert read_header(frame) is None
+    assert read_header(None) is None
+    hide_header(frame, pack_header(FRAMES, 99))
+    assert read_header(frame)["frames"] == FRAMES
@@ -0,0 +1,16 @@
+def test_result_is_served_from_another_working_directory(server, client, tmp_path, monkeypatch):
+    source = tmp_path / 'encoded_clip.mp4'
+    source.write_bytes(b'\0\0\0\x18ftypmp42' + bytes(range(256)) * 4)
+    result_id = server.result_store.put(str(source), metadata={"frame_numbers": [1, 2]})
+
+    elsewhere = tmp_path / 'elsewhere'
+    elsewhere.mkdir()
+    monkeypatch.chdir(elsewhere)
+    response = client.get(f'/results/{result_id}')
+    assert response.status_code == 200
+    assert response.data == b'\0\0\0\x18ftypmp42' + bytes(range(256)) * 4
+    assert response.headers['X-Frame-Numbers'] == '1,2'
+
+    partial = client.get(f'/results/{result_id}', headers={'Range': 'bytes=0-11'})
+    assert partial.status_code == 206
+    assert partial.data == b'\0\0\0\x18ftypmp42'
@@ -0,0 +1,176 @@
+"""Single-process ffmpeg output stage.
+
+Raw BGR frames are piped straight into one ffmpeg process over stdin, which
+encodes them with the selected output profile and muxes the audio track of
+the original upload in the same pass. This replaces writing a PNG-codec MOV
+with cv2.VideoWriter and then re-encoding it with ffmpeg (the legacy
+pipeline, now only in benchmarks/legacy_pipeline.py).
+"""
+import re
+import shutil
+import subprocess
+import tempfile
+
+# Output profiles: "x264" is the lossy delivery format, "lossless" keeps every
+# pixel (and therefore the LSB payload) intact using RGB H.264 at qp 0
+OUTPUT_PROFILES = {
+    'x264': {
+        'extension': '.mp4',
+        # 4:4:4 like the old PNG MOV -> MP4 conversion picked; 4:2:0 chroma
+        # subsampling smears the one-pixel-per-bit border colours
+        'video_args': ['-c:v', 'libx264', '-crf', '23', '-preset', 'fast', '-pix_fmt', 'yuv444p'],
+        # The pixel format ffmpeg reports when decoding the output
+        'pix_fmt': 'yuv444p',
+        'lossless': False,
+    },
+    'lossless': {
+        'extension': '.mp4',
+        'video_args': ['-c:v', 'libx264rgb', '-qp', '0', '-preset', 'ultrafast'],
+        'pix_fmt': 'gbrp',
+        'lossless': True,
+    },
+}
+DEFAULT_PROFILE = 'x264'
+
+# Audio codecs the MP4 muxer accepts as a stream copy
+MP4_AUDIO_CODECS = {'aac', 'mp3', 'alac', 'ac3', 'eac3', 'opus', 'flac'}
+
+DEFAULT_FPS = 30.0
+
+_AUDIO_STREAM_RE = re.compile(r'Stream #\d+:\d+.*?: Audio: (\w+)')
+
+
+def ffmpeg_available():
+    return shutil.which('ffmpeg') is not None
+
+
+def probe_audio_codec(video_path):
+    """Return the codec name of the first audio stream, or None if there is none"""
+    try:
+        result = subprocess.run(['ffmpeg', '-hide_banner', '-i', video_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=30)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    match = _AUDIO_STREAM_RE.search(result.stderr.decode(errors='ignore'))
+    return match.group(1) if match else None
+
+
+def audio_args(audio_codec):
+    """ffmpeg arguments to carry an audio stream of this codec into an MP4"""
+    if audio_codec in MP4_AUDIO_CODECS:
+        return ['-c:a', 'copy']
+    return ['-c:a', 'aac', '-b:a', '128k']
+
+
+def mux_audio(video_path, audio_source, output_path):
+    """Combine the video of video_path with the audio of audio_source without re-encoding video
+
+    Used when the video was encoded before the audio source was complete,
+    e.g. while the upload was still streaming in.
+    """
+    audio_codec = probe_audio_codec(audio_source)
+    if not audio_codec:
+        shutil.move(video_path, output_path)
+        return output_path
+
+    command = [
+        'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+        '-i', video_path, '-i', audio_source,
+        '-map', '0:v:0', '-map', '1:a:0', '-c:v', 'copy',
+    ] + audio_args(audio_codec) + ['-movflags', '+faststart', output_path]
+    result = subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to mux audio: {result.stderr.decode(errors='ignore')[-2000:]}")
+    return output_path
+
+
+def output_path_for(path, profile=DEFAULT_PROFILE):
+    """Give path the file extension the profile's container needs"""
+    return path.rsplit('.', 1)[0] + OUTPUT_PROFILES[profile]['extension']
+
+
+class FFmpegWriter:
+    """Encode a stream of BGR frames with a single ffmpeg process"""
+
+    def __init__(self, output_path, width, height, fps, profile=DEFAULT_PROFILE, audio_source=None,
+                 video_args=None):
+        if profile not in OUTPUT_PROFILES:
+            raise ValueError(f"Unknown output profile: {profile}")
+        if not ffmpeg_available():
+            raise RuntimeError("ffmpeg is not installed")
+
+        self.output_path = output_path
+        self.width = width
+        self.height = height
+        self.profile = profile
+        self.frames_written = 0
+        fps = fps if fps and fps > 0 else DEFAULT_FPS
+
+        command = [
+            'ffmpeg', '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+            '-s', f'{width}x{height}', '-framerate', f'{fps}',
+            '-i', 'pipe:0',
+        ]
+
+        # Mux the original audio, copying it when the container allows
+        audio_codec = probe_audio_codec(audio_source) if audio_source else None
+        if audio_codec:
+            command += ['-i', audio_source, '-map', '0:v:0', '-map', '1:a:0'] + audio_args(audio_codec)
+        else:
+            command += ['-map', '0:v:0']
+
+        command += OUTPUT_PROFILES[profile]['video_args'] + list(video_args or [])
+        command += ['-movflags', '+faststart', output_path]
+
+        # ffmpeg's log goes to a temp file so a full stderr pipe can never block the writer
+        self._log = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.DEVNULL, stderr=self._log)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, frame):
+        if frame.shape[0] != self.height or frame.shape[1] != self.width:
+            raise ValueError(f"Frame size {frame.shape[1]}x{frame.shape[0]} does not match "
+                             f"{self.width}x{self.height}")
+        try:
+            self.process.stdin.write(frame.tobytes() if not frame.flags['C_CONTIGUOUS'] else frame.data)
+        except BrokenPipeError:
+            raise RuntimeError(f"ffmpeg exited early: {self._read_log()}")
+        self.frames_written += 1
+
+    def close(self):
+        """Finish encoding and return the output path"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        log = self._read_log()
+        self._log.close()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {log}")
+        print(f"[INFO] Encoded {self.frames_written} frames to {self.output_path} ({self.profile})")
+        return self.output_path
+
+    def abort(self):
+        """Stop ffmpeg without waiting for it to finish the file"""
+        try:
+            self.process.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.kill()
+        self.process.wait()
+        self._log.close()
+
+    def _read_log(self):
+        self._log.seek(0)
+        return self._log.read().decode(errors='ignore').strip()[-2000:]
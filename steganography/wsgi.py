@@ -0,0 +1,22 @@
+"""Production entry point.
+
+Serve with a multi-worker WSGI server instead of the debug server, e.g.
+
+    gunicorn -w 4 --threads 4 -b 0.0.0.0:5000 --timeout 600 wsgi:app
+
+Admission limits (STEGO_ENCRYPT_CONCURRENCY, STEGO_ENCRYPT_QUEUE, ...) apply
+per worker process, so size them as total capacity / workers. Running this
+file directly starts a threaded server without the debugger or reloader.
+"""
+import os
+
+from server import create_app, generate_keys
+
+generate_keys()
+app = create_app()
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+
+    run_simple(os.environ.get('STEGO_HOST', '0.0.0.0'), int(os.environ.get('STEGO_PORT', 5000)), app,
+               threaded=True, use_reloader=False, use_debugger=False)